@@ -0,0 +1,255 @@
+"""
+Hizalama Benchmark'ı (Sentetik Bozulmalar)
+
+Models/*/images altındaki şablon sayfalarından sentetik "öğrenci fotoğrafları"
+üretir (perspektif, 4 yönde döndürme, bulanıklık, JPEG, gölge, kırpma, ölçek,
+tarayıcı: küçük kayma/dönme/DPI farkı),
+her hizalama yöntemini bunlar üzerinde çalıştırır ve yöntem başına gecikme
+yüzdeliklerini, başarı oranını ve köşe geri izdüşüm hatasını raporlar.
+Şablon özellikleri üretimdeki gibi modelin bölgeleri (config.json) maskelenerek hesaplanır.
+
+Kullanım (NoteMasterAI klasöründen):
+    python benchmarks/alignment_benchmark.py
+    python benchmarks/alignment_benchmark.py --model Türkçe --samples 5 --methods align_image SIFT
+    python benchmarks/alignment_benchmark.py --no-cache --csv bench.csv
+    python benchmarks/alignment_benchmark.py --no-mask   # Maskesiz şablon özellikleri (karşılaştırma için)
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import logging
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logic import alignment
+
+DISTORTIONS = ["tilt", "rot90", "rot-90", "rot180", "blur", "jpeg", "shadow", "crop", "scale", "scan"]
+METHODS = ["align_image", "MARKER", "PHASE", "PYRAMID", "SIFT", "ORB", "AKAZE"]
+# Köşe hatası bu değerin (şablon pikseli) altındaysa hizalama "doğru" sayılır (300 DPI'da ~0.85mm)
+ACCURATE_CORNER_PX = 10.0
+
+# --- SYNTHETIC STUDENT PHOTOS ---
+# Her üretici (öğrenci görüntüsü, M) döndürür; M: Şablon -> Öğrenci (3x3) gerçek dönüşüm.
+
+def _tilt(img, rng, strength=0.06):
+    h, w = img.shape[:2]
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    jitter = rng.uniform(-strength, strength, size=(4, 2)) * np.float32([w, h])
+    M = cv2.getPerspectiveTransform(src, np.float32(src + jitter))
+    out = cv2.warpPerspective(img, M, (w, h), borderValue=(255, 255, 255))
+    return out, M
+
+def _rotate(img, M, angle):
+    h, w = img.shape[:2]
+    if angle == 90:
+        out = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+        R = np.array([[0, -1, h - 1], [1, 0, 0], [0, 0, 1]], dtype=np.float64)
+    elif angle == -90:
+        out = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        R = np.array([[0, 1, 0], [-1, 0, w - 1], [0, 0, 1]], dtype=np.float64)
+    else:
+        out = cv2.rotate(img, cv2.ROTATE_180)
+        R = np.array([[-1, 0, w - 1], [0, -1, h - 1], [0, 0, 1]], dtype=np.float64)
+    return out, R @ M
+
+def _scan(img, rng):
+    """Düz yatak tarayıcı: Küçük dönme + kayma + DPI farkı (perspektif yok)."""
+    h, w = img.shape[:2]
+    s = float(rng.uniform(0.5, 1.05))
+    M = cv2.getRotationMatrix2D((w * s / 2, h * s / 2), float(rng.uniform(-2.0, 2.0)), 1.0) @ np.diag([s, s, 1.0])
+    M[:, 2] += rng.uniform(-0.02, 0.02, size=2) * np.float64([w * s, h * s])
+    out = cv2.warpAffine(img, M, (int(w * s), int(h * s)), borderValue=(255, 255, 255))
+    return out, np.vstack([M, [0, 0, 1]])
+
+def make_distortion(img, kind, rng):
+    if kind == "scan":
+        return _scan(img, rng)
+    # "tilt": Güçlü perspektif; diğerleri hafif perspektif + kendi bozulması
+    out, M = _tilt(img, rng, 0.08 if kind == "tilt" else 0.03)
+    if kind.startswith("rot"):
+        out, M = _rotate(out, M, int(kind[3:]))
+    elif kind == "blur":
+        k = int(rng.choice([5, 9, 13]))
+        out = cv2.GaussianBlur(out, (k, k), 0)
+    elif kind == "jpeg":
+        quality = int(rng.integers(15, 40))
+        _, buf = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        out = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    elif kind == "shadow":
+        h, w = out.shape[:2]
+        gx = np.linspace(rng.uniform(0.35, 0.6), 1.0, w, dtype=np.float32)
+        if rng.random() < 0.5: gx = gx[::-1]
+        gy = np.linspace(1.0, rng.uniform(0.7, 1.0), h, dtype=np.float32)[:, None]
+        out = np.clip(out.astype(np.float32) * (gy * gx)[:, :, None], 0, 255).astype(np.uint8)
+    elif kind == "crop":
+        h, w = out.shape[:2]
+        dx, dy = int(w * rng.uniform(0.03, 0.1)), int(h * rng.uniform(0.03, 0.1))
+        if rng.random() < 0.5:
+            # Üst/sol kırpma koordinatları kaydırır
+            out = out[dy:, dx:]
+            M = np.array([[1, 0, -dx], [0, 1, -dy], [0, 0, 1]], dtype=np.float64) @ M
+        else:
+            out = out[:h - dy, :w - dx]
+        out = np.ascontiguousarray(out)
+    elif kind == "scale":
+        s = float(rng.uniform(0.45, 0.8))
+        out = cv2.resize(out, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+        M = np.diag([s, s, 1.0]) @ M
+    return out, M
+
+# --- METHODS ---
+
+def run_method(method, img_template, img_student, template_features):
+    """Returns: (H Öğrenci -> Şablon veya None, süre ms)"""
+    t0 = time.perf_counter()
+    if method == "align_image":
+        H = alignment.align_image(img_template, img_student, template_features=template_features).homography
+    elif method == "MARKER":
+        H = alignment._try_align_markers(img_template, img_student, template_features)
+    elif method == "PHASE":
+        H = alignment._try_align_phase(img_template, img_student, template_features)
+    elif method == "PYRAMID":
+        H = alignment._try_align_pyramid(img_template, img_student, template_features)
+    elif method == "SIFT":
+        H = alignment._estimate_homography("SIFT", img_template, img_student, template_features)
+    else:
+        H = alignment._estimate_homography(method, img_template, img_student)
+    return H, (time.perf_counter() - t0) * 1000.0
+
+def corner_error(H, M, shape):
+    """Şablon köşeleri gerçek dönüşümle öğrenciye, tahminle geri taşınır; maksimum sapma (px)."""
+    h, w = shape[:2]
+    corners = np.float32([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]]).reshape(-1, 1, 2)
+    back = cv2.perspectiveTransform(cv2.perspectiveTransform(corners, M), H)
+    return float(np.linalg.norm(back - corners, axis=2).max())
+
+# --- REPORT ---
+
+def summarize(rows, methods):
+    print()
+    header = f"{'Method':<12} {'N':>4} {'Success':>8} {'Accurate':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'Err p50':>8} {'Err p90':>8}"
+    print(header)
+    print("-" * len(header))
+    for method in methods:
+        m_rows = [r for r in rows if r["method"] == method]
+        if not m_rows: continue
+        lat = np.array([r["ms"] for r in m_rows])
+        errs = np.array([r["corner_err"] for r in m_rows if r["success"]])
+        n = len(m_rows)
+        success = sum(r["success"] for r in m_rows) / n
+        accurate = sum(r["accurate"] for r in m_rows) / n
+        lat = lat[~np.isnan(lat)]
+        p50, p90, p99 = np.percentile(lat, [50, 90, 99]) if len(lat) else (float("nan"),) * 3
+        e50, e90 = np.percentile(errs, [50, 90]) if len(errs) else (float("nan"), float("nan"))
+        print(f"{method:<12} {n:>4} {success:>8.0%} {accurate:>9.0%} {p50:>8.0f} {p90:>8.0f} {p99:>8.0f} {e50:>8.1f} {e90:>8.1f}")
+
+    print()
+    print("Başarı oranı (Accurate) - bozulma türüne göre:")
+    kinds = sorted({r["distortion"] for r in rows}, key=DISTORTIONS.index)
+    print(f"{'Method':<12} " + " ".join(f"{k:>7}" for k in kinds))
+    for method in methods:
+        cells = []
+        for k in kinds:
+            k_rows = [r for r in rows if r["method"] == method and r["distortion"] == k]
+            cells.append(f"{sum(r['accurate'] for r in k_rows) / len(k_rows):>7.0%}" if k_rows else f"{'-':>7}")
+        print(f"{method:<12} " + " ".join(cells))
+
+def _page_index(filename):
+    """page_{i}.png -> i (ModelManager.save_model adlandırması)"""
+    try:
+        return int(os.path.splitext(filename)[0].split("_")[1])
+    except (IndexError, ValueError):
+        return None
+
+def load_templates(models_dir, model_names=None, max_pages=None):
+    """Returns: [(ad, şablon BGR, sayfanın bölgeleri)] Bölgeler config.json'dan (maskeli özellikler için)."""
+    templates = []
+    for name in sorted(os.listdir(models_dir)):
+        if model_names and name not in model_names: continue
+        images_dir = os.path.join(models_dir, name, "images")
+        if not os.path.isdir(images_dir): continue
+        zones = {}
+        try:
+            with open(os.path.join(models_dir, name, "config.json"), "r") as f:
+                zones = json.load(f).get("zones", {})
+        except (OSError, ValueError):
+            pass
+        files = sorted((f for f in os.listdir(images_dir) if f.lower().endswith(".png")),
+                       key=lambda f: (_page_index(f) is None, _page_index(f) or 0, f))
+        for f in files[:max_pages]:
+            img = cv2.imread(os.path.join(images_dir, f))
+            if img is not None:
+                p_idx = _page_index(f)
+                page_zones = zones.get(str(p_idx), zones.get(p_idx, [])) if p_idx is not None else []
+                templates.append((f"{name}/{f}", img, page_zones))
+    return templates
+
+def main():
+    parser = argparse.ArgumentParser(description="NoteMaster hizalama benchmark'ı")
+    parser.add_argument("--models-dir", default="Models")
+    parser.add_argument("--model", nargs="*", help="Sadece bu modeller (varsayılan: hepsi)")
+    parser.add_argument("--pages", type=int, default=None, help="Model başına en fazla sayfa")
+    parser.add_argument("--samples", type=int, default=3, help="Bozulma türü başına örnek")
+    parser.add_argument("--distortions", nargs="*", default=DISTORTIONS, choices=DISTORTIONS)
+    parser.add_argument("--methods", nargs="*", default=METHODS, choices=METHODS)
+    parser.add_argument("--no-cache", action="store_true", help="Şablon özelliklerini önceden hesaplama")
+    parser.add_argument("--no-mask", action="store_true", help="Özellikleri bölgeleri maskelemeden hesapla (eski yol)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="Ham sonuçları CSV olarak yaz")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Hizalama loglarını göster")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+    # Tek süreç, tek thread: yöntemler arası adil karşılaştırma
+    cv2.setNumThreads(1)
+
+    templates = load_templates(args.models_dir, args.model, args.pages)
+    if not templates:
+        print(f"Şablon bulunamadı: {args.models_dir}/*/images")
+        return 1
+
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    for t_name, img_template, page_zones in templates:
+        # Üretimdeki gibi: Cevap bölgeleri maskelenmiş şablon özellikleri
+        feats = None if args.no_cache else alignment.compute_template_features(img_template,
+                                                                               None if args.no_mask else page_zones)
+        for kind in args.distortions:
+            for sample in range(args.samples):
+                img_student, M = make_distortion(img_template, kind, rng)
+                for method in args.methods:
+                    try:
+                        H, ms = run_method(method, img_template, img_student, feats)
+                    except (cv2.error, AttributeError) as e:
+                        # Örn: OpenCV derlemesinde AKAZE yok
+                        print(f"[Benchmark] {method} çalıştırılamadı: {e}")
+                        H, ms = None, float("nan")
+                    err = corner_error(H, M, img_template.shape) if H is not None else float("nan")
+                    rows.append({
+                        "template": t_name,
+                        "distortion": kind,
+                        "sample": sample,
+                        "method": method,
+                        "ms": ms,
+                        "success": H is not None,
+                        "accurate": H is not None and err <= ACCURATE_CORNER_PX,
+                        "corner_err": err
+                    })
+                print(f"[Benchmark] {t_name} {kind} ({sample + 1}/{args.samples})", flush=True)
+
+    summarize(rows, args.methods)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nHam sonuçlar: {args.csv}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+PDF Rasterleştirme Benchmark'ı
+
+Models/*/ altındaki PDF'leri (blank.pdf, key.pdf) veya verilen dosyaları her
+arka uçla (pdfium, poppler) farklı DPI'larda rasterleştirir; arka uç ve DPI
+başına sayfa/saniye, sayfa başına gecikme ve tepe bellek (RSS) raporlar.
+Her ölçüm ayrı bir süreçte çalışır (tepe bellek birbirini etkilemez; poppler
+için pdftoppm alt süreçlerinin tepe belleği ayrıca verilir).
+Sayfa önbelleği kullanılmaz.
+
+Kullanım (NoteMasterAI klasöründen):
+    python benchmarks/pdf_render_benchmark.py
+    python benchmarks/pdf_render_benchmark.py --pdf sinav.pdf --dpi 150 300 --renderers pdfium
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logic import pdf_render
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+DPIS = [150, 200, 300]
+
+def _peak_rss_mb(who):
+    if resource is None: return float("nan")
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux: KB, macOS: bayt
+    return peak / 1024.0 / 1024.0 if sys.platform == "darwin" else peak / 1024.0
+
+def _run(renderer, pdf_paths, dpi, grayscale, queue):
+    try:
+        rasterizer = pdf_render.get_rasterizer(renderer)
+        latencies, pixels = [], 0
+        t_total = time.perf_counter()
+        for path in pdf_paths:
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+            indices = range(rasterizer.page_count(pdf_bytes))
+            t0 = time.perf_counter()
+            for _, arr in rasterizer.iter_pages(pdf_bytes, indices, dpi, grayscale):
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                pixels += arr.shape[0] * arr.shape[1]
+                del arr
+                t0 = time.perf_counter()
+        elapsed = time.perf_counter() - t_total
+        queue.put({
+            "pages": len(latencies),
+            "seconds": elapsed,
+            "latencies": latencies,
+            "mpix": pixels / 1e6,
+            "rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else float("nan"),
+            "child_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else float("nan"),
+        })
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+def measure(renderer, pdf_paths, dpi, grayscale):
+    """Ölçümü temiz bir süreçte çalıştırır."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(renderer, pdf_paths, dpi, grayscale, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def find_pdfs(models_dir):
+    paths = []
+    for name in sorted(os.listdir(models_dir)):
+        for f in ("blank.pdf", "key.pdf"):
+            path = os.path.join(models_dir, name, f)
+            if os.path.exists(path):
+                paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="NoteMaster PDF rasterleştirme benchmark'ı")
+    parser.add_argument("--models-dir", default="Models")
+    parser.add_argument("--pdf", nargs="*", help="PDF dosyaları (varsayılan: Models/*/blank.pdf, key.pdf)")
+    parser.add_argument("--dpi", nargs="*", type=int, default=DPIS)
+    parser.add_argument("--renderers", nargs="*", default=pdf_render.RENDERERS, choices=pdf_render.RENDERERS)
+    parser.add_argument("--grayscale", action="store_true")
+    args = parser.parse_args()
+
+    pdf_paths = args.pdf or find_pdfs(args.models_dir)
+    if not pdf_paths:
+        print(f"PDF bulunamadı: {args.models_dir}/*/blank.pdf")
+        return 1
+
+    print(f"{len(pdf_paths)} PDF, renk: {'gri' if args.grayscale else 'RGB'}")
+    header = f"{'Renderer':<10} {'DPI':>4} {'Pages':>6} {'pages/s':>8} {'MPix/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'RSS MB':>8} {'Child MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for renderer in args.renderers:
+        for dpi in args.dpi:
+            res = measure(renderer, pdf_paths, dpi, args.grayscale)
+            if "error" in res:
+                print(f"{renderer:<10} {dpi:>4} çalıştırılamadı: {res['error']}")
+                continue
+            lat = sorted(res["latencies"])
+            p50 = lat[len(lat) // 2] if lat else float("nan")
+            p90 = lat[min(len(lat) - 1, int(len(lat) * 0.9))] if lat else float("nan")
+            secs = max(res["seconds"], 1e-9)
+            print(f"{renderer:<10} {dpi:>4} {res['pages']:>6} {res['pages'] / secs:>8.2f} {res['mpix'] / secs:>8.1f} "
+                  f"{p50:>8.0f} {p90:>8.0f} {res['rss_mb']:>8.0f} {res['child_rss_mb']:>9.0f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,7 +12,9 @@ class GlobalState:
     
     def reset(self):
         # Phase 1 Data
+        self.model_name = ""     # Selected exam model
         self.pdf_images = []     # Template blank PDF images (PIL or OpenCV)
+        self.template_features = [] # Precomputed alignment features per template page
         self.current_page = 0
         self.zones = {}          # Dictionary: { page_index: [zone_dict, ...] }
         self.template_json_path = "sablon.json"
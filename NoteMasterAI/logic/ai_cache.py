@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from PIL import Image
+
+# --- AI YANIT ÖNBELLEĞİ AYARLARI ---
+# Gemini yanıtları SQLite'ta saklanır. Anahtar: model adı + normalize edilmiş istem metni
+# + her görsel parçanın kesin (piksel) özeti + üretim ayarları.
+# Aynı istek tekrarlanırsa (çökme sonrası yeniden puanlama, tek bölge değişikliği) API çağrılmaz.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # NoteMasterAI/
+AI_CACHE_PATH = os.path.join(BASE_DIR, "cache", "ai_responses.db")
+AI_CACHE_TTL_DAYS = 30          # Bundan eski yanıtlar kullanılmaz ve silinir
+AI_CACHE_MAX_MB = 256           # Yanıt metinlerinin toplam boyutu; aşılınca en eski kullanılanlar silinir
+AI_CACHE_EVICT_EVERY = 200      # Her N yazmada bir süre/boyut temizliği
+AI_CACHE_VERSION = 1            # Anahtar biçimi değişirse artırılır (eski kayıtlar eşleşmez)
+
+def _normalize_text(text):
+    """Boşluk farkları aynı istek sayılır."""
+    return " ".join(str(text).split())
+
+def _part_digest(part):
+    """İstem parçasının özeti: metin normalize edilir, görseller piksel bazında (kesin) özetlenir."""
+    h = hashlib.sha256()
+    if isinstance(part, str):
+        h.update(b"T")
+        h.update(_normalize_text(part).encode("utf-8"))
+    elif isinstance(part, Image.Image):
+        h.update(f"I{part.mode}{part.size}".encode("utf-8"))
+        h.update(part.tobytes())
+    elif isinstance(part, (bytes, bytearray)):
+        h.update(b"B")
+        h.update(bytes(part))
+    else:
+        h.update(b"R")
+        h.update(repr(part).encode("utf-8"))
+    return h.hexdigest()
+
+def _config_text(generation_config):
+    if generation_config is None:
+        return ""
+    if isinstance(generation_config, dict):
+        data = generation_config
+    elif hasattr(generation_config, "__dict__"):
+        data = vars(generation_config)
+    else:
+        return repr(generation_config)
+    return json.dumps({k: v for k, v in data.items() if v is not None}, sort_keys=True, default=str)
+
+def model_name_of(gemini_model):
+    return str(getattr(gemini_model, "model_name", "") or type(gemini_model).__name__)
+
+class AIResponseCache:
+    """
+    SQLite tabanlı Gemini yanıt önbelleği (TTL + boyut sınırı, LRU temizlik).
+
+    Kullanım:
+        cache = get_ai_cache()
+        text = cache.generate(gemini_model, [prompt, pil_img], generation_config=cfg,
+                              validate=lambda t: ...)   # yalnızca geçerli yanıtlar saklanır
+        cache.stats()  # {"hits", "misses", "bypassed"}
+    """
+
+    def __init__(self, path=AI_CACHE_PATH, ttl_days=AI_CACHE_TTL_DAYS, max_mb=AI_CACHE_MAX_MB):
+        self.path = path
+        self.ttl = ttl_days * 86400.0
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0}
+        self._writes = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                size INTEGER,
+                created REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # Her çağrıda ayrı bağlantı: GradingWorker'ın AI thread'leri aynı anda okuyup yazar
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def key(self, model_name, parts, generation_config=None):
+        h = hashlib.sha256()
+        h.update(f"v{AI_CACHE_VERSION}|{model_name}|{_config_text(generation_config)}".encode("utf-8"))
+        for part in parts:
+            h.update(_part_digest(part).encode("ascii"))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Returns: Saklanan yanıt metni veya None (yok / süresi dolmuş)"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT response FROM responses WHERE key = ? AND created >= ?",
+                               (key, now - self.ttl)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                conn.commit()
+        finally:
+            conn.close()
+        return row[0] if row is not None else None
+
+    def put(self, key, model_name, response_text):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, model_name, response_text, len(response_text.encode("utf-8")), now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % AI_CACHE_EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Süresi dolanları, ardından boyut sınırı aşılıyorsa en eski kullanılanları siler."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                # En eski kullanılanlardan, fazlalığı karşılayana kadar
+                cutoff, acc = None, 0
+                for last_used, size in conn.execute("SELECT last_used, size FROM responses ORDER BY last_used ASC"):
+                    acc += size
+                    cutoff = last_used
+                    if acc >= excess: break
+                if cutoff is not None:
+                    conn.execute("DELETE FROM responses WHERE last_used <= ?", (cutoff,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def generate(self, gemini_model, parts, generation_config=None, use_cache=True, validate=None):
+        """
+        gemini_model.generate_content'in önbellekli hali.
+
+        validate: Yanıt metnini alıp True/False döndüren fonksiyon; False ise yanıt saklanmaz.
+        Returns: Yanıt metni (str). API hataları çağırana aynen yükselir.
+        """
+        if not use_cache:
+            with self._lock:
+                self._counters["bypassed"] += 1
+            return self._call(gemini_model, parts, generation_config)
+
+        model_name = model_name_of(gemini_model)
+        key = self.key(model_name, parts, generation_config)
+        try:
+            cached = self.get(key)
+        except sqlite3.Error as e:
+            print(f"[AICache] Önbellek okunamadı: {e}")
+            cached = None
+        if cached is not None:
+            with self._lock:
+                self._counters["hits"] += 1
+            return cached
+
+        with self._lock:
+            self._counters["misses"] += 1
+        text = self._call(gemini_model, parts, generation_config)
+        if text and (validate is None or validate(text)):
+            try:
+                self.put(key, model_name, text)
+            except sqlite3.Error as e:
+                print(f"[AICache] Önbelleğe yazılamadı: {e}")
+        return text
+
+    def _call(self, gemini_model, parts, generation_config):
+        if generation_config is not None:
+            return gemini_model.generate_content(parts, generation_config=generation_config).text
+        return gemini_model.generate_content(parts).text
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+        finally:
+            conn.close()
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_ai_cache():
+    """Süreç genelinde paylaşılan önbellek."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = AIResponseCache()
+        return _CACHE
+
+def generate_content(gemini_model, parts, generation_config=None, use_cache=True, validate=None):
+    """Kısayol: get_ai_cache().generate(...). Önbellek açılamazsa doğrudan API çağrılır."""
+    try:
+        cache = get_ai_cache()
+    except (OSError, sqlite3.Error) as e:
+        print(f"[AICache] Önbellek açılamadı, doğrudan çağrılıyor: {e}")
+        if generation_config is not None:
+            return gemini_model.generate_content(parts, generation_config=generation_config).text
+        return gemini_model.generate_content(parts).text
+    return cache.generate(gemini_model, parts, generation_config, use_cache=use_cache, validate=validate)
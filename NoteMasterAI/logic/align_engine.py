@@ -0,0 +1,176 @@
+import os
+import concurrent.futures
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from logic import alignment
+
+# Havuz boyutu (None = tüm çekirdekler)
+ENGINE_MAX_WORKERS = None
+# Notlandırmada hizalamaya önden gönderilen en fazla öğrenci (Çekirdek sayısından bağımsız: her biri
+# tüm sayfalarıyla bellekte tutulur). Ayrıca toplam sayfa boyutu PREFETCH_MEMORY_MB ile sınırlıdır.
+ENGINE_LOOKAHEAD = 3
+
+# --- WORKER SIDE ---
+# Her süreçte bir kez doldurulur: {key: (template_bgr, TemplateFeatures or None)}
+_WORKER_TEMPLATES = {}
+_WORKER_SHM = []
+
+def _attach(spec):
+    """Paylaşımlı bellek bloğuna bağlanır ve kopyasız NumPy görünümü döndürür."""
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    _WORKER_SHM.append(shm) # GC edilmesin
+    return np.ndarray(spec["shape"], dtype=np.dtype(spec["dtype"]), buffer=shm.buf)
+
+def _features_from_manifest(entry):
+    if entry is None:
+        return None
+    feats = alignment.TemplateFeatures(
+        _attach(entry["points"]), _attach(entry["descriptors"]), entry["scale"], entry["shape"]
+    )
+    feats.coarse = _features_from_manifest(entry.get("coarse"))
+    feats.markers = entry.get("markers", {})
+    feats.masked = entry.get("masked", False)
+    feats.zones_hash = entry.get("zones_hash", "")
+    return feats
+
+def _init_worker(manifest):
+    # OpenCV'nin kendi thread havuzu süreç havuzuyla yarışmasın
+    cv2.setNumThreads(1)
+    for key, entry in manifest.items():
+        _WORKER_TEMPLATES[key] = (_attach(entry["image"]), _features_from_manifest(entry["features"]))
+
+def _align_worker(key, img_student, prior=None):
+    tmpl_cv, feats = _WORKER_TEMPLATES[key]
+    return alignment.find_homography(tmpl_cv, img_student, template_features=feats, prior=prior)
+
+def _forward(src, dst):
+    """İç Future'ın sonucunu dışarıya verilen Future'a aktarır."""
+    if src.cancelled():
+        dst.cancel()
+    elif src.exception() is not None:
+        dst.set_exception(src.exception())
+    else:
+        dst.set_result(src.result())
+
+# --- MAIN PROCESS SIDE ---
+class AlignmentEngine:
+    """
+    Süreç havuzu tabanlı hizalama motoru.
+
+    Şablon sayfaları ve önceden hesaplanmış özellikleri bir kez
+    multiprocessing.shared_memory üzerinden yayınlanır; her işçi süreç
+    bunlara kopyasız bağlanır. Öğrenci sayfaları `submit` ile gönderilir ve
+    Future olarak AlignmentResult (Öğrenci -> Şablon homografisi) döner.
+
+    Şablonlar liste (anahtar = sayfa indeksi) veya sözlük olarak verilebilir;
+    sözlük ile birden fazla modelin sayfaları tek havuzda yayınlanır
+    (örn: {(model_adı, sayfa): görüntü}).
+
+    Kullanım:
+        with AlignmentEngine(template_images, template_features) as engine:
+            fut = engine.submit(p_idx, stud_cv)
+            res = fut.result()
+    """
+
+    def __init__(self, template_images, template_features=None, max_workers=ENGINE_MAX_WORKERS):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._shm_blocks = []
+        self.template_shapes = {}
+
+        manifest = {}
+        if not isinstance(template_images, dict):
+            template_images = dict(enumerate(template_images))
+        if not isinstance(template_features, dict):
+            template_features = dict(enumerate(template_features or []))
+        try:
+            for key, tmpl_cv in template_images.items():
+                if tmpl_cv is None: continue
+                manifest[key] = {
+                    "image": self._publish(tmpl_cv),
+                    "features": self._publish_features(template_features.get(key))
+                }
+                self.template_shapes[key] = tmpl_cv.shape[:2]
+
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_worker, initargs=(manifest,)
+            )
+        except Exception:
+            self._release()
+            raise
+
+    def _publish(self, array):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        self._shm_blocks.append(shm)
+        return {"name": shm.name, "shape": array.shape, "dtype": array.dtype.str}
+
+    def _publish_features(self, feats):
+        if feats is None:
+            return None
+        return {
+            "points": self._publish(feats.points),
+            "descriptors": self._publish(feats.descriptors),
+            "scale": feats.scale,
+            "shape": feats.shape,
+            "coarse": self._publish_features(feats.coarse),
+            "markers": feats.markers, # Küçük, doğrudan kopyalanır
+            "masked": feats.masked, # Maskeli şablonda öğrenci bütçesi MASKED_STUDENT_NFEATURES
+            "zones_hash": feats.zones_hash
+        }
+
+    def has_template(self, key):
+        return key in self.template_shapes
+
+    def submit(self, key, img_student, prior=None):
+        """Öğrenci sayfasını (BGR) hizalama için kuyruğa ekler. Future[AlignmentResult] döner."""
+        return self.executor.submit(_align_worker, key, img_student, prior)
+
+    def submit_student(self, items):
+        """
+        Bir öğrencinin sayfalarını gönderir: İlk sayfa tam kademeyle hizalanır,
+        kalanlar onun sonucunu önsel (warm-start) olarak alıp onun ardından kuyruğa girer.
+        Diğer öğrencilerin sayfaları bu arada havuzu doldurmaya devam eder.
+
+        items: [(key, img_student)]
+        Returns: [Future[AlignmentResult]] (items sırasıyla)
+        """
+        if not items:
+            return []
+        first = self.submit(*items[0])
+        rest = [concurrent.futures.Future() for _ in items[1:]]
+
+        def _on_first(fut):
+            prior = None
+            if not fut.cancelled() and fut.exception() is None and fut.result().ok:
+                prior = fut.result()
+            for (key, img_student), proxy in zip(items[1:], rest):
+                try:
+                    inner = self.submit(key, img_student, prior)
+                except RuntimeError as e: # Havuz kapatıldı
+                    proxy.set_exception(e)
+                    continue
+                inner.add_done_callback(lambda f, proxy=proxy: _forward(f, proxy))
+
+        first.add_done_callback(_on_first)
+        return [first] + rest
+
+    def _release(self):
+        for shm in self._shm_blocks:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shm_blocks = []
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
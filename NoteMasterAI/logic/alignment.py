@@ -1,6 +1,13 @@
 import cv2
 import numpy as np
 import os
+import time
+import hashlib
+import logging
+from collections import Counter
+from logic import fiducials
+
+logger = logging.getLogger(__name__)
 
 # --- AYARLAR ---
 # Eşleşme hassasiyeti (Düşük = Daha katı eleme, Yüksek = Daha çok kabul)
@@ -18,60 +25,591 @@ RANSAC_REPROJ_THRESHOLD = 10.0
 MIN_MATCH_COUNT = 10
 # SIFT hesaplaması için maksimum boyut (Hız ve genel yapı doğruluğu için)
 MAX_ALIGN_DIM = 2000
+# SIFT için maksimum özellik sayısı
+SIFT_NFEATURES = 5000
+ORB_NFEATURES = 5000
+
+# Şablon maskesi: Cevap bölgeleri (öğrencinin yazdığı yerler) özellik çıkarımından hariç tutulur
+# Maskeli şablonda daha az ama daha güvenilir nokta yeterli olur
+MASKED_TEMPLATE_NFEATURES = 3000
+MASKED_COARSE_FEATURES = 1000
+MASKED_STUDENT_NFEATURES = 3000 # Maskeli şablona karşı öğrenci tarafı bütçesi
+ZONE_MASK_PADDING = 0.01 # Bölge etrafında ek boşluk (Sayfa kısa kenarının oranı)
+
+# FLANN (KD-Tree) ayarları
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_PARAMS = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
+FLANN_SEARCH_PARAMS = dict(checks=50)
+
+# Piramit (kaba -> ince) hizalama ayarları
+# Kaba seviyede küçük resim + az özellik ile homografi, ardından ECC ile iyileştirme
+USE_PYRAMID_ALIGN = True
+PYRAMID_COARSE_DIM = 600
+PYRAMID_COARSE_FEATURES = 1500
+# Her seviye ayrı bir ECC turu (örn: (1000, 2000)). Tek seviye 1200px çoğu kağıt için yeterli.
+PYRAMID_REFINE_DIMS = (1200,)
+ECC_MAX_ITER = 8
+ECC_EPS = 1e-3
+# ECC sonucu kaba tahminden bu kadar (köşe başına, şablon köşegeninin oranı) saparsa ıraksamış sayılır
+PYRAMID_MAX_CORNER_SHIFT = 0.03
+
+# Köşe işaretleri (ArUco) varsa önce onlarla hizala (bkz. logic/fiducials.py)
+USE_FIDUCIALS = True
+
+# Tarayıcı hızlı yolu: Şablondan sadece küçük kayma/dönme/DPI farkıyla ayrılan
+# taramalar için log-polar faz korelasyonu (benzerlik dönüşümü, özellik çıkarımı yok)
+USE_PHASE_ALIGN = True
+PHASE_DIM = 512                # Korelasyon bu boyutta kare tuvalde yapılır
+PHASE_MAX_ASPECT_DIFF = 0.04   # En/boy oranı farkı (göreli) bundan büyükse tarama sayılmaz
+PHASE_MIN_THUMB_NCC = 0.4      # Hizalamadan önceki küçük resim korelasyonu (Ön eleme)
+PHASE_MAX_ROTATION = 5.0       # Derece
+PHASE_MIN_RESPONSE = 0.3       # Öteleme korelasyon tepesi bundan zayıfsa özellik yoluna düşülür
+PHASE_MIN_VERIFY_NCC = 0.7     # Hizalanmış tuvalin şablonla korelasyonu (Son doğrulama)
+
+# Önsel (warm-start): Aynı öğrencinin önceki sayfası aynı telefon/açıyla çekilmiştir.
+# Önceki sayfanın yöntemi + açısı düşük bütçeyle ve önsel homografi etrafında dar aramayla denenir.
+USE_PRIOR_ALIGN = True
+PRIOR_FEATURE_RATIO = 0.5      # Önsel denemede özellik bütçesi (normal bütçenin oranı)
+PRIOR_SEARCH_RADIUS = 0.05     # Eşleşme, önselin öngördüğü konuma bu kadar yakın olmalı (Şablon köşegeni oranı)
+
+# Yön tahmini için küçük resim boyutu (Hızlı ön sınıflandırma)
+ORIENT_THUMB_DIM = 128
+ROTATION_ANGLES = [0, 90, -90, 180]
+
+# Şablon parmak izi (dHash) karşılaştırmasında izin verilen farklı bit sayısı (64 bit üzerinden)
+FINGERPRINT_MAX_BITS = 6
+
+class AlignmentResult:
+    """
+    Hizalama sonucu.
+
+    Attributes:
+        homography: Öğrenci -> Şablon (3x3) veya None (başarısız)
+        method: Kazanan yöntem ("MARKER", "PHASE", "PYRAMID", "SIFT", "ORB", "AKAZE")
+        angle: Kazanan ön döndürme açısı (0, 90, -90, 180)
+        warm_start: Önceki sayfanın sonucu (önsel) ile mi bulundu?
+        inliers / matches: RANSAC iç nokta sayısı / oran testinden geçen eşleşme sayısı
+        reproj_error: İç noktaların ortalama geri izdüşüm hatası (şablon pikseli), döndürülen homografi için
+        fit_points: Son uyumun iç nokta eşleşmeleri (şablon, öğrenci; tam çözünürlük). Sadece süreç içi
+                    (PYRAMID ince ayar sonrası hatayı yeniden hesaplar); kopyalanmaz / kaydedilmez.
+        timings: Aşama süreleri (ms): markers, orientation, detect, match, ransac, refine, warp
+        stats: Bu çağrının kademe sayaçları (pages, marker_hits, prior_attempts, ...). Süreç havuzundan
+               sonuçla birlikte döner; GradingWorker çalıştırma boyunca toplar.
+        image: Bükülmüş (hizalanmış) görüntü, sadece align_image doldurur
+    """
+
+    def __init__(self):
+        self.homography = None
+        self.method = None
+        self.angle = 0
+        self.warm_start = False
+        self.inliers = 0
+        self.matches = 0
+        self.reproj_error = None
+        self.fit_points = None
+        self.timings = {}
+        self.stats = Counter()
+        self.image = None
+
+    @property
+    def ok(self):
+        return self.homography is not None
+
+    @property
+    def inlier_ratio(self):
+        return self.inliers / self.matches if self.matches else 0.0
+
+    @property
+    def total_ms(self):
+        return sum(self.timings.values())
+
+    def add_time(self, stage, start):
+        """`start` (perf_counter) anından bu yana geçen süreyi aşamaya ekler."""
+        self.timings[stage] = self.timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000.0
+
+    def __getstate__(self):
+        # Süreç havuzundan dönüşte iç nokta dizileri taşınmaz
+        state = dict(self.__dict__)
+        state["fit_points"] = None
+        return state
+
+    def count(self, key, n=1):
+        self.stats[key] += n
+
+    def to_dict(self):
+        return {
+            "success": self.ok,
+            "method": self.method,
+            "angle": self.angle,
+            "warm_start": self.warm_start,
+            "inliers": self.inliers,
+            "matches": self.matches,
+            "inlier_ratio": self.inlier_ratio,
+            "reproj_error": self.reproj_error,
+            "total_ms": self.total_ms,
+            "timings": dict(self.timings),
+            "stats": dict(self.stats),
+            "homography": self.homography.tolist() if self.ok else None
+        }
+
+    def __repr__(self):
+        if not self.ok:
+            return f"AlignmentResult(failed, {self.total_ms:.0f}ms)"
+        prior = ", prior" if self.warm_start else ""
+        err = f"{self.reproj_error:.2f}px" if self.reproj_error is not None else "n/a"
+        return (f"AlignmentResult({self.method} {self.angle}°{prior}, inliers={self.inliers}/{self.matches}, "
+                f"err={err}, {self.total_ms:.0f}ms)")
+
+class AlignedPageView:
+    """
+    Tembel hizalanmış sayfa görünümü.
+
+    Tam sayfayı bükmek yerine homografiyi ve orijinal öğrenci görüntüsünü
+    saklar; her bölge kırpımı sadece o ROI için (şablon koordinatlarında)
+    `warpPerspective` ile üretilir.
+
+    Args:
+        homography: Öğrenci -> Şablon (3x3)
+        img_student: Orijinal öğrenci görüntüsü (BGR)
+        template_shape: Şablon (h, w)
+    """
+
+    def __init__(self, homography, img_student, template_shape):
+        self.homography = np.asarray(homography, dtype=np.float64)
+        self.image = img_student
+        self.shape = tuple(template_shape[:2])
+
+    @classmethod
+    def resized(cls, img_student, template_shape):
+        """Hizalama yoksa: öğrenci sayfasını şablon boyutuna ölçekleyen görünüm (cv2.resize eşdeğeri)."""
+        h_s, w_s = img_student.shape[:2]
+        h_t, w_t = template_shape[:2]
+        S = np.array([[w_t / w_s, 0, 0], [0, h_t / h_s, 0], [0, 0, 1]], dtype=np.float64)
+        # resize piksel merkezlerini hizalar: x' = (x + 0.5) * s - 0.5
+        S[0, 2] = 0.5 * S[0, 0] - 0.5
+        S[1, 2] = 0.5 * S[1, 1] - 0.5
+        return cls(S, img_student, template_shape)
+
+    def clamp(self, x, y, w, h):
+        """Dikdörtgeni şablon sınırlarına kırpar (eski tam sayfa dilimleme ile aynı kural)."""
+        h_img, w_img = self.shape
+        x = max(0, min(int(x), w_img - 1))
+        y = max(0, min(int(y), h_img - 1))
+        w = max(1, min(int(w), w_img - x))
+        h = max(1, min(int(h), h_img - y))
+        return x, y, w, h
+
+    def crop(self, x, y, w, h):
+        """Şablon koordinatlarındaki (x, y, w, h) bölgesini döndürür."""
+        x, y, w, h = self.clamp(x, y, w, h)
+        M = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64) @ self.homography
+        return cv2.warpPerspective(self.image, M, (w, h))
+
+    def full(self):
+        """Tüm sayfayı bükerek döndürür (önizleme / hata ayıklama için)."""
+        h_t, w_t = self.shape
+        return cv2.warpPerspective(self.image, self.homography, (w_t, h_t))
+
+# Şablon özellik önbelleği sürümü (Hesaplama mantığı değişirse artırılmalı)
+TEMPLATE_FEATURE_VERSION = 4
+
+class TemplateFeatures:
+    """
+    Bir şablon sayfası için önceden hesaplanmış SIFT verileri.
+
+    Şablon her öğrenci için aynı olduğundan CLAHE + SIFT + FLANN indeksi
+    bir kez hesaplanır ve model klasöründe saklanır. Noktalar küçültülmüş
+    (MAX_ALIGN_DIM) görüntü koordinatlarındadır, `scale` ile geri çevrilir.
+    """
+
+    def __init__(self, points, descriptors, scale, shape, index=None):
+        self.points = points            # (N, 2) float32
+        self.descriptors = descriptors  # (N, 128) float32
+        self.scale = float(scale)
+        self.shape = tuple(shape)       # Orijinal şablon boyutu (h, w)
+        self.index = index
+        self.coarse = None              # Piramit hizalama için kaba seviye (TemplateFeatures)
+        self.markers = {}               # Köşe işaretleri {id: (4, 2) köşeler}, orijinal koordinatlarda
+        self.zones_hash = ""            # Hesaplamada verilen bölgelerin imzası (Önbellek geçerliliği)
+        self.masked = False             # Cevap bölgeleri maskelenerek mi hesaplandı?
+        self.phase_ref = None           # Faz korelasyonu için şablon tuvali (Sadece bellekte, kaydedilmez)
+
+    def get_index(self):
+        if self.index is None:
+            self.index = cv2.flann_Index(self.descriptors, FLANN_INDEX_PARAMS)
+        return self.index
+
+    def knn_match(self, des_query, k=2):
+        """Sorgu tanımlayıcılarını şablon indeksinde arar. (indices, L2 distances) döndürür."""
+        indices, dists = self.get_index().knnSearch(des_query, k, params=FLANN_SEARCH_PARAMS)
+        # KD-Tree kare mesafe döndürür
+        return indices, np.sqrt(dists)
+
+    def save(self, path):
+        """`path` uzantısız verilir: path.npz + path.flann yazılır."""
+        np.savez(
+            path + ".npz",
+            version=TEMPLATE_FEATURE_VERSION,
+            points=self.points,
+            descriptors=self.descriptors,
+            scale=self.scale,
+            shape=np.array(self.shape),
+            markers=fiducials.markers_to_array(self.markers),
+            zones_hash=self.zones_hash,
+            masked=self.masked
+        )
+        self.get_index().save(path + ".flann")
+        if self.coarse is not None:
+            self.coarse.save(path + "_coarse")
+
+    @classmethod
+    def load(cls, path):
+        """Kayıtlı özellikleri yükler. Dosya yoksa veya sürüm eskiyse None döndürür."""
+        npz_path = path + ".npz"
+        if not os.path.exists(npz_path):
+            return None
+        try:
+            data = np.load(npz_path)
+            if int(data["version"]) != TEMPLATE_FEATURE_VERSION:
+                return None
+            feats = cls(data["points"], data["descriptors"], float(data["scale"]), tuple(int(v) for v in data["shape"]))
+            feats.markers = fiducials.markers_from_array(data["markers"])
+            feats.zones_hash = str(data["zones_hash"])
+            feats.masked = bool(data["masked"])
+        except Exception as e:
+            logger.warning(f"[Alignment] Özellik önbelleği okunamadı ({npz_path}): {e}")
+            return None
+
+        # Eğitilmiş FLANN indeksi (Yoksa/bozuksa ilk kullanımda yeniden kurulur)
+        flann_path = path + ".flann"
+        if os.path.exists(flann_path):
+            index = cv2.flann_Index()
+            try:
+                if index.load(feats.descriptors, flann_path):
+                    feats.index = index
+            except cv2.error:
+                pass
+
+        if os.path.exists(path + "_coarse.npz"):
+            feats.coarse = cls.load(path + "_coarse")
+        return feats
+
+def _resize_for_compute(img, max_dim=MAX_ALIGN_DIM):
+    h, w = img.shape[:2]
+    if max(h, w) <= max_dim: return img, 1.0
+    scale = max_dim / max(h, w)
+    new_w, new_h = int(w * scale), int(h * scale)
+    return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA), scale
+
+def _prepare_gray(img, max_dim=MAX_ALIGN_DIM):
+    """Küçült + Gri + CLAHE. (gray, scale) döndürür."""
+    small, scale = _resize_for_compute(img, max_dim)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if len(small.shape) == 3 else small
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    return clahe.apply(gray), scale
+
+def _create_detector(method_name, nfeatures=None):
+    if method_name == "SIFT":
+        return cv2.SIFT_create(nfeatures=nfeatures or SIFT_NFEATURES)
+    if method_name == "ORB":
+        return cv2.ORB_create(nfeatures=nfeatures or ORB_NFEATURES)
+    if method_name == "AKAZE":
+        return cv2.AKAZE_create()
+    return None
+
+def _compute_features(img, max_dim, nfeatures, mask=None):
+    gray, scale = _prepare_gray(img, max_dim)
+    if mask is not None:
+        mask = cv2.resize(mask, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_NEAREST)
+    kp, des = _create_detector("SIFT", nfeatures).detectAndCompute(gray, mask)
+    if des is None or len(kp) < MIN_MATCH_COUNT:
+        return None
+
+    points = np.float32([k.pt for k in kp]).reshape(-1, 2)
+    feats = TemplateFeatures(points, np.float32(des), scale, img.shape[:2])
+    feats.get_index() # Eğit
+    return feats
+
+def zones_signature(zones):
+    """Bir sayfanın bölge dikdörtgenlerinden kısa imza (Önbellek geçerliliği için)."""
+    rects = sorted(
+        (round(float(z["left"])), round(float(z["top"])), round(float(z["width"])), round(float(z["height"])))
+        for z in (zones or []) if all(k in z for k in ("left", "top", "width", "height"))
+    )
+    if not rects: return ""
+    return hashlib.sha1(repr(rects).encode("utf-8")).hexdigest()[:16]
+
+def build_zone_mask(shape, zones):
+    """
+    Şablon boyutunda maske: 255 = basılı (sabit) alan, 0 = cevap bölgesi.
+    Bölge yoksa None.
+    """
+    h, w = shape[:2]
+    pad = int(min(h, w) * ZONE_MASK_PADDING)
+    mask = np.full((h, w), 255, dtype=np.uint8)
+    found = False
+    for z in zones or []:
+        try:
+            x, y = int(float(z["left"])), int(float(z["top"]))
+            zw, zh = int(float(z["width"])), int(float(z["height"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        mask[max(0, y - pad):max(0, y + zh + pad), max(0, x - pad):max(0, x + zw + pad)] = 0
+        found = True
+    return mask if found else None
+
+def compute_template_features(img_template, zones=None):
+    """
+    Şablon sayfası (BGR) için SIFT özelliklerini ve FLANN indeksini hesaplar.
+    Piramit hizalama için kaba seviye de (`coarse`) ve varsa köşe
+    işaretleri (`markers`) birlikte hesaplanır.
+
+    Args:
+        zones: (Opsiyonel) Sayfanın bölgeleri (config.json). Verilirse cevap
+            bölgeleri maskelenir ve daha küçük özellik bütçesi kullanılır.
 
-def align_image(img_template, img_student, debug_path=None):
+    Returns:
+        TemplateFeatures veya None (Yeterli nokta bulunamazsa)
     """
-    NoteMaster Hizalama Motoru (v5 - Rotation Aware + Multi-Method)
+    feats = None
+    mask = build_zone_mask(img_template.shape, zones)
+    if mask is not None:
+        feats = _compute_features(img_template, MAX_ALIGN_DIM, MASKED_TEMPLATE_NFEATURES, mask)
+        if feats is not None:
+            feats.coarse = _compute_features(img_template, PYRAMID_COARSE_DIM, MASKED_COARSE_FEATURES, mask)
+            feats.zones_hash = zones_signature(zones)
+            feats.masked = True
+        else:
+            logger.info("[Alignment] Maskeli şablonda yeterli nokta yok, maskesiz hesaplanıyor.")
+
+    if feats is None:
+        feats = _compute_features(img_template, MAX_ALIGN_DIM, SIFT_NFEATURES)
+        if feats is not None:
+            feats.coarse = _compute_features(img_template, PYRAMID_COARSE_DIM, PYRAMID_COARSE_FEATURES)
+            # Maskesiz geri dönüş de bu bölgeler için geçerli önbellektir
+            feats.zones_hash = zones_signature(zones)
+    if feats is not None:
+        feats.markers = fiducials.detect_markers(img_template)
+    return feats
+
+def _rotate_90s(img, angle):
+    if angle == 0: return img
+    if angle == 90: return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if angle == -90: return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    if angle == 180: return cv2.rotate(img, cv2.ROTATE_180)
+    return img
+
+def _orientation_thumb(img, size=None):
+    """Gri, bulanık, mürekkep=parlak küçük resim (float32, sıfır ortalama)."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    if size is None:
+        h, w = gray.shape[:2]
+        scale = ORIENT_THUMB_DIM / max(h, w)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    thumb = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    thumb = cv2.GaussianBlur(255.0 - thumb.astype(np.float32), (5, 5), 0)
+    return thumb - thumb.mean()
+
+def _ncc(a, b):
+    denom = np.sqrt((a * a).sum() * (b * b).sum())
+    return float((a * b).sum() / denom) if denom > 0 else 0.0
+
+def estimate_orientation(img_template, img_student):
+    """
+    Öğrenci kağıdının yönünü küçük resim üzerinde hızlıca tahmin eder.
+
+    Her aday açı için öğrenci küçük resmi döndürülüp şablon boyutuna getirilir;
+    2B korelasyon + satır/sütun projeksiyon profilleri karşılaştırılır.
+
+    Returns:
+        list: En olasıdan en az olasıya sıralı açılar (ROTATION_ANGLES)
+    """
+    tmpl = _orientation_thumb(img_template)
+    size = (tmpl.shape[1], tmpl.shape[0])
+    t_rows, t_cols = tmpl.sum(axis=1), tmpl.sum(axis=0)
+
+    # Öğrenci tarafı bir kez küçültülür, döndürme küçük resim üzerinde yapılır
+    h, w = img_student.shape[:2]
+    scale = (ORIENT_THUMB_DIM * 2) / max(h, w)
+    small = cv2.resize(img_student, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA) if scale < 1 else img_student
+
+    scores = {}
+    for angle in ROTATION_ANGLES:
+        stud = _orientation_thumb(_rotate_90s(small, angle), size)
+        s_rows, s_cols = stud.sum(axis=1), stud.sum(axis=0)
+        profile = 0.5 * (_ncc(t_rows - t_rows.mean(), s_rows - s_rows.mean()) +
+                         _ncc(t_cols - t_cols.mean(), s_cols - s_cols.mean()))
+        scores[angle] = _ncc(tmpl, stud) + profile
+
+    return sorted(ROTATION_ANGLES, key=lambda a: scores[a], reverse=True)
+
+def template_fingerprint(img):
+    """
+    Şablon sayfası için kısa parmak izi: boyut + 64 bit fark karması (dHash).
+    Aynı PDF'in farklı yerlerde yeniden rasterleştirilmesine dayanıklıdır.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return {"shape": [int(gray.shape[0]), int(gray.shape[1])], "dhash": f"{value:016x}"}
+
+def fingerprints_match(fp_a, fp_b, max_bits=FINGERPRINT_MAX_BITS):
+    if not fp_a or not fp_b: return False
+    if list(fp_a.get("shape", [])) != list(fp_b.get("shape", [])): return False
+    try:
+        diff = int(fp_a["dhash"], 16) ^ int(fp_b["dhash"], 16)
+    except (KeyError, ValueError):
+        return False
+    return bin(diff).count("1") <= max_bits
+
+def _rotation_matrix(angle, w, h):
+    """Orijinal görüntü koordinatlarını `_rotate_90s(img, angle)` koordinatlarına taşır."""
+    if angle == 90:
+        return np.array([[0, -1, h - 1], [1, 0, 0], [0, 0, 1]], dtype=np.float64)
+    if angle == -90:
+        return np.array([[0, 1, 0], [-1, 0, w - 1], [0, 0, 1]], dtype=np.float64)
+    if angle == 180:
+        return np.array([[-1, 0, w - 1], [0, -1, h - 1], [0, 0, 1]], dtype=np.float64)
+    return np.eye(3)
+
+def align_image(img_template, img_student, debug_path=None, template_features=None, warp=True, prior=None):
+    """
+    NoteMaster Hizalama Motoru (v6 - Orientation Ranked + Multi-Method)
     
-    Öğrenci kağıdını hizalar. Önce farklı açıları (0, 90, -90, 180) SIFT ile dener.
+    Öğrenci kağıdını hizalar. Önce küçük resim üzerinde yön tahmini yapılır ve
+    açılar (0, 90, -90, 180) olasılık sırasıyla SIFT ile denenir.
     Eğer hepsi başarısız olursa, 0 derecede ORB ve AKAZE alternatiflerini dener.
     
     Args:
         img_template: Referans resim (BGR)
         img_student: Öğrenci resmi (BGR)
+        template_features: (Opsiyonel) Şablonun önceden hesaplanmış SIFT verileri.
+            Verilirse şablon tarafı yeniden hesaplanmaz.
+        warp: False ise tam sayfa bükülmez; bölgeler için AlignedPageView kullanın.
+        prior: (Opsiyonel) Aynı öğrencinin önceki sayfasının AlignmentResult'ı.
+            Önce onun yöntemi/açısı denenir (bkz. _try_align_prior).
         
     Returns:
-        aligned_image: Hizalanmış resim veya None
+        AlignmentResult: `result.ok` ve warp ise `result.image` hizalanmış resimdir.
     """
-    
-    def get_rotated(img, angle):
-        if angle == 0: return img
-        if angle == 90: return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-        if angle == -90: return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        if angle == 180: return cv2.rotate(img, cv2.ROTATE_180)
-        return img
-
-    # 1. Rotation Strategy (Try SIFT on all angles first)
+    result = find_homography(img_template, img_student, debug_path, template_features, prior)
+    if result.ok and warp:
+        t0 = time.perf_counter()
+        h_t, w_t = img_template.shape[:2]
+        result.image = cv2.warpPerspective(img_student, result.homography, (w_t, h_t))
+        result.add_time("warp", t0)
+    return result
+
+def find_homography(img_template, img_student, debug_path=None, template_features=None, prior=None):
+    """
+    align_image ile aynı kademeli strateji, fakat görüntüyü bükmeden sadece
+    Öğrenci -> Şablon homografisini bulur (Orijinal, döndürülmemiş öğrenci
+    koordinatlarında). Süreç havuzunda çalışmaya uygundur.
+
+    Returns:
+        AlignmentResult (görüntüsüz)
+    """
+    result = AlignmentResult()
+    result.count("pages")
+    h_s, w_s = img_student.shape[:2]
+
+    # 0. Fiducial Fast Path (Printed corner markers, rotation independent)
+    if USE_FIDUCIALS:
+        H = _try_align_markers(img_template, img_student, template_features, result)
+        if H is not None:
+            logger.info(f"[Alignment] Köşe işaretleri ile hizalandı.")
+            result.count("marker_hits")
+            result.homography = H
+            result.method = "MARKER"
+            # Döndürme bilgisi (sadece rapor için): H'nin dönme bileşeni 90'ın katına yuvarlanır
+            angle = int(round(np.degrees(np.arctan2(-H[0, 1], H[0, 0])) / 90.0)) * 90
+            result.angle = 180 if angle == -180 else angle
+            return result
+
+    # 0a. Warm Start (Previous page of the same student: same phone, similar angle)
+    if USE_PRIOR_ALIGN and prior is not None and prior.ok:
+        result.count("prior_attempts")
+        H = _try_align_prior(img_template, img_student, prior, template_features, result)
+        if H is not None:
+            logger.info(f"[Alignment] Önsel ile hizalandı ({prior.method}, {prior.angle}°).")
+            result.count("prior_hits")
+            result.homography = H
+            result.method = prior.method
+            result.angle = prior.angle
+            result.warm_start = True
+            return result
+        logger.info("[Alignment] Önsel doğrulanamadı, tam kademeli hizalamaya geçiliyor.")
+
+    # 0b. Scanner Fast Path (Near-identity: small shift/rotation/DPI change)
+    if USE_PHASE_ALIGN:
+        H = _try_align_phase(img_template, img_student, template_features, result)
+        if H is not None:
+            logger.info(f"[Alignment] Faz korelasyonu ile hizalandı (Tarayıcı).")
+            result.count("phase_hits")
+            result.homography = H
+            result.method = "PHASE"
+            result.angle = 0
+            return result
+
+    # 1. Rotation Strategy (Ranked by cheap orientation estimate)
     # Orientation is a common failure point for otherwise good images.
-    rotations = [0, 90, -90, 180]
+    t0 = time.perf_counter()
+    rotations = estimate_orientation(img_template, img_student)
+    result.add_time("orientation", t0)
     
-    for angle in rotations:
+    for attempt, angle in enumerate(rotations):
         # Log only if retrying
         if angle != 0:
-             print(f"[Alignment] Deneniyor: SIFT ile {angle} derece döndürme...")
+             logger.info(f"[Alignment] Deneniyor: SIFT ile {angle} derece döndürme...")
         else:
-             print(f"[Alignment] Deneniyor: SIFT (Standart)...")
+             logger.info(f"[Alignment] Deneniyor: SIFT (Standart)...")
              
-        rot_img = get_rotated(img_student, angle)
+        rot_img = _rotate_90s(img_student, angle)
         
+        # Cheap pyramid (coarse SIFT + ECC) first, full SIFT only if it diverges
+        H = None
+        method = "PYRAMID"
+        if USE_PYRAMID_ALIGN:
+            result.count("pyramid_attempts")
+            H = _try_align_pyramid(img_template, rot_img, template_features, result)
+            if H is not None:
+                result.count("pyramid_hits")
+
         # Use SIFT as primary
-        result = _try_align_method("SIFT", img_template, rot_img, debug_path)
-        if result is not None:
-             print(f"[Alignment] SIFT ({angle}°) ile başarıyla hizalandı.")
+        if H is None:
+            method = "SIFT"
+            result.count("sift_attempts")
+            H = _estimate_homography("SIFT", img_template, rot_img, template_features, result=result)
+        if H is not None:
+             logger.info(f"[Alignment] {method} ({angle}°) ile başarıyla hizalandı.")
+             if attempt == 0:
+                 result.count("orientation_first_hit")
+             result.count("skipped_angles", len(rotations) - attempt - 1)
+             result.homography = H @ _rotation_matrix(angle, w_s, h_s)
+             result.method = method
+             result.angle = angle
              return result
 
     # 2. Fallback Strategy (Texture/Lighting Issues)
     # If SIFT failed all angles, try robust binary descriptors on original image
     other_methods = ["ORB", "AKAZE"]
     for method in other_methods:
-        print(f"[Alignment] Deneniyor: {method} (Fallback)...")
-        result = _try_align_method(method, img_template, img_student, debug_path)
-        if result is not None:
-            print(f"[Alignment] {method} ile başarıyla hizalandı.")
+        logger.info(f"[Alignment] Deneniyor: {method} (Fallback)...")
+        result.count("fallback_attempts")
+        H = _estimate_homography(method, img_template, img_student, result=result)
+        if H is not None:
+            logger.info(f"[Alignment] {method} ile başarıyla hizalandı.")
+            result.homography = H
+            result.method = method
+            result.angle = 0
             return result
             
-    print("[Alignment] Kritik: Tüm hizalama yöntemleri ve açılar başarısız oldu!")
-    return None
+    logger.warning("[Alignment] Kritik: Tüm hizalama yöntemleri ve açılar başarısız oldu!")
+    result.count("failures")
+    return result
 
 def validate_homography(H, h_stud, w_stud, h_tmpl, w_tmpl):
     """
@@ -91,10 +629,10 @@ def validate_homography(H, h_stud, w_stud, h_tmpl, w_tmpl):
     if det < (0.2 * expected_scale) or det > (5.0 * expected_scale):
         # Fallback absolute check just in case expected is weird (e.g. crop)
         if det < 0.1 or det > 30.0: 
-            print(f"[Alignment] Rejection: Bad Determinant ({det:.2f}) vs Expected ({expected_scale:.2f})")
+            logger.info(f"[Alignment] Rejection: Bad Determinant ({det:.2f}) vs Expected ({expected_scale:.2f})")
             return False
             
-    print(f"[Alignment] Determinant OK ({det:.2f} ~ Exp {expected_scale:.2f})")
+    logger.debug(f"[Alignment] Determinant OK ({det:.2f} ~ Exp {expected_scale:.2f})")
         
     # 2. Corner Check (Template corners mapped back to Student Image)
     # H maps Student -> Template.
@@ -112,7 +650,7 @@ def validate_homography(H, h_stud, w_stud, h_tmpl, w_tmpl):
     
     # 3. Check Convexity (Is it a valid quad?)
     if not cv2.isContourConvex(np.int32(pts_stud_proj)):
-        print(f"[Alignment] Rejection: Non-convex shape (Twisted)")
+        logger.info(f"[Alignment] Rejection: Non-convex shape (Twisted)")
         return False
         
     # 4. Check if projected corners are somewhat within reasonable bounds?
@@ -122,93 +660,122 @@ def validate_homography(H, h_stud, w_stud, h_tmpl, w_tmpl):
     stud_area = h_stud * w_stud
     
     if area < stud_area * 0.2: # Projected area too small
-         print(f"[Alignment] Rejection: Projected area too small ({area})")
+         logger.info(f"[Alignment] Rejection: Projected area too small ({area})")
          return False
     
     if area > stud_area * 4.0: # Projected area too huge
-         print(f"[Alignment] Rejection: Projected area too big ({area})")
+         logger.info(f"[Alignment] Rejection: Projected area too big ({area})")
          return False
 
     return True
 
-def _try_align_method(method_name, img_template, img_student, debug_path):
-    """Tekil hizalama denemesi"""
-    
-    def resize_for_compute(img, max_dim=MAX_ALIGN_DIM):
-        h, w = img.shape[:2]
-        if max(h, w) <= max_dim: return img, 1.0
-        scale = max_dim / max(h, w)
-        new_w, new_h = int(w * scale), int(h * scale)
-        return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA), scale
+def _estimate_homography(method_name, img_template, img_student, template_features=None,
+                         max_dim=MAX_ALIGN_DIM, nfeatures=None, result=None, prior_H=None, search_radius=None):
+    """
+    Öğrenci -> Şablon homografisini (tam çözünürlük) hesaplar ve doğrular.
 
-    # 1. Resize & Preprocess
-    templ_small, templ_scale = resize_for_compute(img_template)
-    stud_small, stud_scale = resize_for_compute(img_student)
+    SIFT için `template_features` verilirse sadece öğrenci tarafı hesaplanır ve
+    öğrenci tanımlayıcıları şablonun eğitilmiş FLANN indeksinde aranır.
+    `result` (AlignmentResult) verilirse aşama süreleri ve başarıda
+    iç nokta / hata istatistikleri ona yazılır.
+    `prior_H` verilirse sadece önselin öngördüğü konuma `search_radius`
+    (şablon pikseli) mesafedeki eşleşmeler tutulur.
 
-    gray_template = cv2.cvtColor(templ_small, cv2.COLOR_BGR2GRAY)
-    gray_student = cv2.cvtColor(stud_small, cv2.COLOR_BGR2GRAY)
-    
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    gray_template = clahe.apply(gray_template)
-    gray_student = clahe.apply(gray_student)
+    Returns:
+        H (3x3) veya None
+    """
+    if result is None:
+        result = AlignmentResult()
+    use_cache = method_name == "SIFT" and template_features is not None
+
+    # 1. Resize & Preprocess
+    t0 = time.perf_counter()
+    gray_student, stud_scale = _prepare_gray(img_student, max_dim)
+    if not use_cache:
+        gray_template, templ_scale = _prepare_gray(img_template, max_dim)
 
     # 2. Detect Features
-    detector = None
-    if method_name == "SIFT":
-        detector = cv2.SIFT_create(nfeatures=5000)
-    elif method_name == "ORB":
-        detector = cv2.ORB_create(nfeatures=5000)
-    elif method_name == "AKAZE":
-        detector = cv2.AKAZE_create()
-        
+    if nfeatures is None and use_cache and template_features.masked:
+        nfeatures = MASKED_STUDENT_NFEATURES
+    detector = _create_detector(method_name, nfeatures)
     if detector is None: return None
         
-    kp_template, des_template = detector.detectAndCompute(gray_template, None)
     kp_student, des_student = detector.detectAndCompute(gray_student, None)
+    result.add_time("detect", t0)
+    if des_student is None or len(kp_student) < MIN_MATCH_COUNT: return None
 
-    if des_template is None or des_student is None: return None
-    if len(kp_template) < MIN_MATCH_COUNT or len(kp_student) < MIN_MATCH_COUNT: return None
+    ratio = RATIO_TEST_THRESHOLD
+    if method_name == "ORB": ratio = 0.8
 
-    # 3. Match
-    matches = []
-    
-    if method_name in ["ORB", "AKAZE"]:
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False) 
-        matches = bf.knnMatch(des_template, des_student, k=2)
-    else:
-        FLANN_INDEX_KDTREE = 1
-        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-        search_params = dict(checks=50)
-        flann = cv2.FlannBasedMatcher(index_params, search_params)
+    if use_cache:
+        # 3-4. Match (Student -> Template Index) + Vectorized Ratio Test
+        if len(template_features.points) < MIN_MATCH_COUNT: return None
+        t0 = time.perf_counter()
         try:
-             matches = flann.knnMatch(des_template, des_student, k=2)
-        except: return None
+            indices, dists = template_features.knn_match(np.float32(des_student), k=2)
+        except cv2.error: return None
 
-    # 4. Ratio Test
-    good_matches = []
-    ratio = RATIO_TEST_THRESHOLD
-    if method_name == "ORB": ratio = 0.8
-    
-    for m_n in matches:
-        if len(m_n) != 2: continue
-        m, n = m_n
-        if m.distance < ratio * n.distance:
-            good_matches.append(m)
+        good = dists[:, 0] < ratio * dists[:, 1]
+        result.add_time("match", t0)
+        if np.count_nonzero(good) < MIN_MATCH_COUNT: return None
 
-    if len(good_matches) < MIN_MATCH_COUNT: return None
+        stud_pts = np.float32([k.pt for k in kp_student])
+        src_pts = template_features.points[indices[good, 0]].reshape(-1, 1, 2) / template_features.scale
+        dst_pts = stud_pts[good].reshape(-1, 1, 2) / stud_scale
+    else:
+        t0 = time.perf_counter()
+        kp_template, des_template = detector.detectAndCompute(gray_template, None)
+        result.add_time("detect", t0)
 
-    # 5. Homography
-    src_pts = np.float32([kp_template[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp_student[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-    
-    src_pts /= templ_scale
-    dst_pts /= stud_scale
+        if des_template is None: return None
+        if len(kp_template) < MIN_MATCH_COUNT: return None
+
+        # 3. Match
+        t0 = time.perf_counter()
+        matches = []
+        
+        if method_name in ["ORB", "AKAZE"]:
+            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False) 
+            matches = bf.knnMatch(des_template, des_student, k=2)
+        else:
+            flann = cv2.FlannBasedMatcher(FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+            try:
+                 matches = flann.knnMatch(des_template, des_student, k=2)
+            except: return None
 
+        # 4. Ratio Test
+        good_matches = []
+        
+        for m_n in matches:
+            if len(m_n) != 2: continue
+            m, n = m_n
+            if m.distance < ratio * n.distance:
+                good_matches.append(m)
+
+        result.add_time("match", t0)
+        if len(good_matches) < MIN_MATCH_COUNT: return None
+
+        src_pts = np.float32([kp_template[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+        dst_pts = np.float32([kp_student[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+        
+        src_pts /= templ_scale
+        dst_pts /= stud_scale
+
+    # Guided matching (Warm start): drop matches far from where the prior predicts
+    if prior_H is not None:
+        pred = cv2.perspectiveTransform(np.float32(dst_pts), prior_H)
+        near = np.linalg.norm(pred - src_pts, axis=2).ravel() < search_radius
+        src_pts, dst_pts = src_pts[near], dst_pts[near]
+        if len(src_pts) < MIN_MATCH_COUNT: return None
+
+    # 5. Homography
+    t0 = time.perf_counter()
     algo = cv2.RANSAC
     if hasattr(cv2, 'USAC_MAGSAC'): algo = cv2.USAC_MAGSAC
     
     thresh = RANSAC_REPROJ_THRESHOLD 
     H, mask = cv2.findHomography(dst_pts, src_pts, algo, thresh)
+    result.add_time("ransac", t0)
     
     if H is None: return None
 
@@ -220,11 +787,290 @@ def _try_align_method(method_name, img_template, img_student, debug_path):
         return None
     # -------------------------------
 
-    # 6. Warming
-    aligned_image = cv2.warpPerspective(img_student, H, (w_orig, h_orig))
-    
-    if debug_path and method_name == "SIFT": 
-         pass
-         
-    return aligned_image
+    _record_fit_quality(result, H, mask, src_pts, dst_pts)
+    return H
+
+def _record_fit_quality(result, H, mask, src_pts, dst_pts):
+    """İç nokta sayısı + şablon pikselinde ortalama geri izdüşüm hatası."""
+    inlier_mask = mask.ravel().astype(bool) if mask is not None else np.ones(len(src_pts), dtype=bool)
+    result.matches = int(len(src_pts))
+    result.inliers = int(np.count_nonzero(inlier_mask))
+    if result.inliers:
+        result.fit_points = (np.float32(src_pts[inlier_mask]), np.float32(dst_pts[inlier_mask]))
+        _record_reproj_error(result, H)
+
+def _record_reproj_error(result, H):
+    """fit_points üzerinde H'nin ortalama geri izdüşüm hatası (şablon pikseli)."""
+    src_pts, dst_pts = result.fit_points
+    proj = cv2.perspectiveTransform(dst_pts, H)
+    result.reproj_error = float(np.linalg.norm(proj - src_pts, axis=2).mean())
+
+def _try_align_markers(img_template, img_student, template_features=None, result=None):
+    """
+    Şablonda köşe işaretleri varsa öğrenci sayfasında da arar ve homografiyi
+    doğrudan işaret köşelerinden hesaplar. İşaretsiz şablonlarda öğrenci
+    tarafında hiç tespit yapılmaz.
+
+    Returns:
+        H (Öğrenci -> Şablon, 3x3) veya None
+    """
+    if result is None:
+        result = AlignmentResult()
+    if not fiducials.is_available():
+        return None
+
+    t0 = time.perf_counter()
+    if template_features is not None:
+        tmpl_markers = template_features.markers
+    else:
+        tmpl_markers = fiducials.detect_markers(img_template)
+    if len(tmpl_markers) < fiducials.MIN_MARKERS:
+        result.add_time("markers", t0)
+        return None
+
+    pairs = fiducials.marker_correspondences(tmpl_markers, fiducials.detect_markers(img_student))
+    result.add_time("markers", t0)
+    if pairs is None:
+        logger.info("[Alignment] Köşe işaretleri bulunamadı, özellik eşleştirmeye geçiliyor.")
+        return None
+
+    src_pts, dst_pts = pairs
+    H, mask = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, RANSAC_REPROJ_THRESHOLD)
+    if H is None:
+        return None
+
+    h_t, w_t = img_template.shape[:2]
+    h_s, w_s = img_student.shape[:2]
+    if not validate_homography(H, h_s, w_s, h_t, w_t):
+        return None
+
+    _record_fit_quality(result, H, mask, src_pts, dst_pts)
+    return H
+
+def _phase_canvas(img):
+    """Gri, mürekkep=parlak, uzun kenarı PHASE_DIM olan kare tuval (float32) ve ölçek."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    # Önce tam sayı katsayıyla INTER_AREA (OpenCV'nin hızlı yolu), sonra doğrusal son boyut
+    k = max(1, max(gray.shape[:2]) // PHASE_DIM)
+    if k > 1:
+        h, w = (gray.shape[0] // k) * k, (gray.shape[1] // k) * k
+        gray = cv2.resize(gray[:h, :w], None, fx=1.0 / k, fy=1.0 / k, interpolation=cv2.INTER_AREA)
+    h, w = gray.shape[:2]
+    scale = PHASE_DIM / max(h, w)
+    small = cv2.resize(gray, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                       interpolation=cv2.INTER_LINEAR if k > 1 else cv2.INTER_AREA)
+    scale /= k
+    canvas = np.zeros((PHASE_DIM, PHASE_DIM), np.float32)
+    canvas[:small.shape[0], :small.shape[1]] = 255.0 - small
+    return canvas, scale
+
+_PHASE_FILTERS = {}
+
+def _phase_filters():
+    """Hann penceresi + yüksek geçiren filtre (Bir kez hesaplanır)."""
+    if PHASE_DIM not in _PHASE_FILTERS:
+        window = cv2.createHanningWindow((PHASE_DIM, PHASE_DIM), cv2.CV_32F)
+        yy, xx = np.meshgrid(np.linspace(-0.5, 0.5, PHASE_DIM), np.linspace(-0.5, 0.5, PHASE_DIM), indexing='ij')
+        hp = 1.0 - np.cos(np.pi * xx) * np.cos(np.pi * yy)
+        _PHASE_FILTERS[PHASE_DIM] = (window, (hp * (2.0 - hp)).astype(np.float32))
+    return _PHASE_FILTERS[PHASE_DIM]
+
+def _log_polar_spectrum(canvas):
+    """Genlik spektrumunun log-polar hali: Dönme/ölçek -> öteleme (ötelemeden bağımsız)."""
+    window, highpass = _phase_filters()
+    spectrum = cv2.dft(canvas * window, flags=cv2.DFT_COMPLEX_OUTPUT)
+    mag = np.fft.fftshift(cv2.magnitude(spectrum[:, :, 0], spectrum[:, :, 1]))
+    mag = np.log1p(mag) * highpass
+    center = (PHASE_DIM / 2.0, PHASE_DIM / 2.0)
+    return cv2.warpPolar(mag, (PHASE_DIM, PHASE_DIM), center, PHASE_DIM / 2.0,
+                         cv2.INTER_LINEAR | cv2.WARP_FILL_OUTLIERS | cv2.WARP_POLAR_LOG)
+
+def _phase_reference(img_template, template_features=None):
+    """Şablon tarafı (tuval, ölçek, log-polar spektrum, küçük resim); TemplateFeatures üzerinde önbelleklenir."""
+    if template_features is not None and template_features.phase_ref is not None:
+        return template_features.phase_ref
+    canvas, scale = _phase_canvas(img_template)
+    ref = (canvas, scale, _log_polar_spectrum(canvas), _orientation_thumb(canvas, (ORIENT_THUMB_DIM, ORIENT_THUMB_DIM)))
+    if template_features is not None:
+        template_features.phase_ref = ref
+    return ref
+
+def _try_align_phase(img_template, img_student, template_features=None, result=None):
+    """
+    Tarayıcı hızlı yolu (Fourier-Mellin).
+
+    1. Ön eleme: En/boy oranı + hizalanmamış küçük resim korelasyonu.
+    2. Genlik spektrumlarının log-polar korelasyonu -> dönme + ölçek.
+    3. Düzeltilmiş tuvalde faz korelasyonu -> öteleme.
+    Tepe zayıfsa veya hizalanmış tuval şablonla örtüşmüyorsa None döner.
+
+    Returns:
+        H (3x3, Öğrenci -> Şablon, tam çözünürlük) veya None
+    """
+    if result is None:
+        result = AlignmentResult()
+    h_t, w_t = img_template.shape[:2]
+    h_s, w_s = img_student.shape[:2]
+    if abs((w_s / h_s) / (w_t / h_t) - 1.0) > PHASE_MAX_ASPECT_DIFF:
+        return None
+
+    t0 = time.perf_counter()
+    tmpl_canvas, s_t, tmpl_lp, tmpl_thumb = _phase_reference(img_template, template_features)
+    stud_canvas, s_s = _phase_canvas(img_student)
+    if _ncc(tmpl_thumb, _orientation_thumb(stud_canvas, (ORIENT_THUMB_DIM, ORIENT_THUMB_DIM))) < PHASE_MIN_THUMB_NCC:
+        result.add_time("phase", t0)
+        return None
+
+    # Dönme + ölçek (log-polar eksenlerinde öteleme)
+    (d_logr, d_theta), _ = cv2.phaseCorrelate(tmpl_lp, _log_polar_spectrum(stud_canvas))
+    angle = d_theta * 360.0 / PHASE_DIM
+    scale = float(np.exp(d_logr * np.log(PHASE_DIM / 2.0) / PHASE_DIM))
+    if abs(angle) > PHASE_MAX_ROTATION:
+        result.add_time("phase", t0)
+        return None
+
+    # Öteleme
+    window, _ = _phase_filters()
+    A = np.vstack([cv2.getRotationMatrix2D((PHASE_DIM / 2.0, PHASE_DIM / 2.0), angle, scale), [0, 0, 1]])
+    rotated = cv2.warpAffine(stud_canvas, A[:2], (PHASE_DIM, PHASE_DIM))
+    (tx, ty), response = cv2.phaseCorrelate(tmpl_canvas * window, rotated * window)
+    A[0, 2] -= tx
+    A[1, 2] -= ty
+
+    # Doğrulama: Hizalanmış tuval şablonla örtüşmeli (Yanlış sayfa / perspektifli fotoğraf elenir)
+    aligned = cv2.warpAffine(stud_canvas, A[:2], (PHASE_DIM, PHASE_DIM))
+    ink = (tmpl_canvas > 0) | (aligned > 0)
+    a, b = tmpl_canvas[ink], aligned[ink]
+    verify = _ncc(a - a.mean(), b - b.mean()) if ink.any() else 0.0
+    result.add_time("phase", t0)
+    if response < PHASE_MIN_RESPONSE or verify < PHASE_MIN_VERIFY_NCC:
+        logger.info(f"[Alignment] Faz korelasyonu zayıf (tepe {response:.2f}, ncc {verify:.2f}), özellik eşleştirmeye geçiliyor.")
+        return None
+
+    H = np.diag([1.0 / s_t, 1.0 / s_t, 1.0]) @ A @ np.diag([s_s, s_s, 1.0])
+    if not validate_homography(H, h_s, w_s, h_t, w_t):
+        return None
+
+    # Uyum kalitesi: Örtüşen mürekkep pikselleri / toplam mürekkep; hata = hizalanmış tuvalde kalan öteleme
+    t0 = time.perf_counter()
+    (rx, ry), _ = cv2.phaseCorrelate(tmpl_canvas * window, aligned * window)
+    result.matches = int(np.count_nonzero(ink))
+    result.inliers = int(np.count_nonzero((tmpl_canvas > 0) & (aligned > 0)))
+    result.reproj_error = float(np.hypot(rx, ry) / s_t)
+    result.add_time("phase", t0)
+    return H
+
+def _ecc_gray(img, max_dim):
+    small, scale = _resize_for_compute(img, max_dim)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if len(small.shape) == 3 else small
+    return gray, scale
+
+def _try_align_prior(img_template, img_student, prior, template_features=None, result=None):
+    """
+    Önceki sayfanın kazanan yapılandırmasını (yöntem + açı) tek seferde dener:
+    düşük özellik bütçesi + önsel homografi etrafında güdümlü eşleştirme.
+    Sonuç diğer yollar gibi validate_homography ile doğrulanır.
+
+    Returns:
+        H (Öğrenci -> Şablon, orijinal öğrenci koordinatlarında) veya None
+    """
+    if prior.method not in ("PYRAMID", "SIFT", "ORB", "AKAZE"):
+        return None # MARKER / PHASE / VERIFIED zaten en başta ve ucuz
+    h_t, w_t = img_template.shape[:2]
+    h_s, w_s = img_student.shape[:2]
+    angle = prior.angle or 0
+    R = _rotation_matrix(angle, w_s, h_s)
+    rot_img = _rotate_90s(img_student, angle)
+    # Önsel H orijinal koordinatlarda; döndürülmüş öğrenci görüntüsüne taşınır
+    prior_H = prior.homography @ np.linalg.inv(R)
+    radius = PRIOR_SEARCH_RADIUS * np.hypot(w_t, h_t)
+
+    if prior.method == "PYRAMID":
+        H = _try_align_pyramid(img_template, rot_img, template_features, result,
+                               nfeatures=int(PYRAMID_COARSE_FEATURES * PRIOR_FEATURE_RATIO),
+                               prior_H=prior_H, search_radius=radius)
+    elif prior.method == "SIFT":
+        budget = MASKED_STUDENT_NFEATURES if template_features is not None and template_features.masked else SIFT_NFEATURES
+        H = _estimate_homography("SIFT", img_template, rot_img, template_features,
+                                 nfeatures=int(budget * PRIOR_FEATURE_RATIO), result=result,
+                                 prior_H=prior_H, search_radius=radius)
+    else:
+        H = _estimate_homography(prior.method, img_template, rot_img,
+                                 nfeatures=int(ORB_NFEATURES * PRIOR_FEATURE_RATIO), result=result,
+                                 prior_H=prior_H, search_radius=radius)
+    return H @ R if H is not None else None
+
+def _try_align_pyramid(img_template, img_student, template_features=None, result=None,
+                       nfeatures=PYRAMID_COARSE_FEATURES, prior_H=None, search_radius=None):
+    """
+    Kaba -> İnce hizalama.
+
+    1. ~600px görüntüde az sayıda SIFT özelliği ile homografi tahmini.
+    2. Daha yüksek seviyelerde cv2.findTransformECC ile alt-piksel iyileştirme.
+    ECC ıraksarsa (hata / aşırı sapma / geçersiz geometri) None döner ve
+    çağıran taraf tam SIFT yoluna düşer.
+
+    Returns:
+        H (3x3, Öğrenci -> Şablon, tam çözünürlük) veya None
+    """
+    coarse_feats = template_features.coarse if template_features is not None else None
+    if coarse_feats is None:
+        coarse_feats = _compute_features(img_template, PYRAMID_COARSE_DIM, PYRAMID_COARSE_FEATURES)
+        if coarse_feats is None: return None
+
+    if result is None:
+        result = AlignmentResult()
+    H = _estimate_homography("SIFT", img_template, img_student, coarse_feats,
+                             max_dim=PYRAMID_COARSE_DIM, nfeatures=nfeatures, result=result,
+                             prior_H=prior_H, search_radius=search_radius)
+    if H is None: return None
+    t0 = time.perf_counter()
+
+    h_t, w_t = img_template.shape[:2]
+    h_s, w_s = img_student.shape[:2]
+    corners = np.float32([[0, 0], [w_t, 0], [w_t, h_t], [0, h_t]]).reshape(-1, 1, 2)
+    try:
+        coarse_corners = cv2.perspectiveTransform(corners, np.linalg.inv(H))
+    except np.linalg.LinAlgError:
+        return None
+
+    # ECC warp: Şablon -> Öğrenci (W = inv(H))
+    W = np.linalg.inv(H)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, ECC_MAX_ITER, ECC_EPS)
+    for dim in PYRAMID_REFINE_DIMS:
+        gray_t, s_t = _ecc_gray(img_template, dim)
+        gray_s, s_s = _ecc_gray(img_student, dim)
+        S_t = np.diag([s_t, s_t, 1.0])
+        S_s = np.diag([s_s, s_s, 1.0])
+        W_level = (S_s @ W @ np.linalg.inv(S_t)).astype(np.float32)
+        W_level /= W_level[2, 2]
+        try:
+            _, W_level = cv2.findTransformECC(gray_t, gray_s, W_level, cv2.MOTION_HOMOGRAPHY, criteria, None, 5)
+        except cv2.error:
+            result.add_time("refine", t0)
+            logger.info(f"[Alignment] Piramit: ECC ıraksadı ({dim}px), tam SIFT'e dönülüyor.")
+            return None
+        W = np.linalg.inv(S_s) @ W_level.astype(np.float64) @ S_t
+
+    result.add_time("refine", t0)
+    try:
+        H_refined = np.linalg.inv(W)
+    except np.linalg.LinAlgError:
+        return None
+    H_refined /= H_refined[2, 2]
+
+    # Divergence check: refined corners must stay close to the coarse estimate
+    refined_corners = cv2.perspectiveTransform(corners, W)
+    max_shift = np.max(np.linalg.norm(refined_corners - coarse_corners, axis=2))
+    if max_shift > PYRAMID_MAX_CORNER_SHIFT * np.hypot(w_s, h_s):
+        logger.info(f"[Alignment] Piramit: ECC kaba tahminden çok saptı ({max_shift:.1f}px).")
+        return None
+
+    if not validate_homography(H_refined, h_s, w_s, h_t, w_t):
+        return None
 
+    # Kalite istatistikleri döndürülen (ECC ile iyileştirilmiş) homografiyi tanımlasın:
+    # kaba SIFT iç noktaları (tam çözünürlük) H_refined ile yeniden izdüşürülür
+    if result.fit_points is not None:
+        _record_reproj_error(result, H_refined)
+    return H_refined
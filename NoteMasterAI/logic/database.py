@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import json
 from datetime import datetime
 
 def init_db(db_path):
@@ -43,6 +44,26 @@ def init_db(db_path):
     )
     ''')
     
+    # Alignment Diagnostics Table (one row per student page)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alignment_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        page_idx INTEGER,
+        success INTEGER,
+        method TEXT,
+        angle INTEGER,
+        inliers INTEGER,
+        matches INTEGER,
+        inlier_ratio REAL,
+        reproj_error REAL,
+        total_ms REAL,
+        timings TEXT,
+        homography TEXT,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )
+    ''')
+    
     # MIGRATION: Ensure new columns exist
     try:
         cursor.execute("ALTER TABLE students ADD COLUMN student_number TEXT")
@@ -63,11 +84,21 @@ def init_db(db_path):
         cursor.execute("ALTER TABLE zone_results ADD COLUMN key_crop_path TEXT")
     except sqlite3.OperationalError:
         pass
+
+    try:
+        cursor.execute("ALTER TABLE students ADD COLUMN model_name TEXT")
+    except sqlite3.OperationalError:
+        pass
+
+    try:
+        cursor.execute("ALTER TABLE alignment_results ADD COLUMN warm_start INTEGER DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass
         
     conn.commit()
     conn.close()
 
-def save_student_header(db_path, name, unit_path, student_number="", class_name=""):
+def save_student_header(db_path, name, unit_path, student_number="", class_name="", model_name=""):
     """
     Creates a new student record and returns the student_id.
     """
@@ -75,9 +106,9 @@ def save_student_header(db_path, name, unit_path, student_number="", class_name=
     cursor = conn.cursor()
     
     cursor.execute('''
-    INSERT INTO students (name, unit_path, student_number, class_name, created_at) 
-    VALUES (?, ?, ?, ?, ?)
-    ''', (name, unit_path, student_number, class_name, datetime.now()))
+    INSERT INTO students (name, unit_path, student_number, class_name, model_name, created_at) 
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', (name, unit_path, student_number, class_name, model_name, datetime.now()))
     
     student_id = cursor.lastrowid
     conn.commit()
@@ -128,6 +159,55 @@ def save_zone_result(db_path, student_id, z_res):
     conn.commit()
     conn.close()
 
+def save_alignment_result(db_path, student_id, page_idx, a_res):
+    """
+    a_res: AlignmentResult.to_dict() çıktısı
+    (success, method, angle, warm_start, inliers, matches, inlier_ratio, reproj_error, total_ms, timings, homography)
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    INSERT INTO alignment_results (
+        student_id, page_idx, success, method, angle, warm_start, inliers, matches,
+        inlier_ratio, reproj_error, total_ms, timings, homography
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        student_id,
+        page_idx,
+        int(bool(a_res.get("success"))),
+        a_res.get("method"),
+        a_res.get("angle", 0),
+        int(bool(a_res.get("warm_start"))),
+        a_res.get("inliers", 0),
+        a_res.get("matches", 0),
+        a_res.get("inlier_ratio", 0.0),
+        a_res.get("reproj_error"),
+        a_res.get("total_ms", 0.0),
+        json.dumps(a_res.get("timings", {})),
+        json.dumps(a_res.get("homography"))
+    ))
+    
+    conn.commit()
+    conn.close()
+
+def get_alignment_results(db_path, student_id=None):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    if student_id is None:
+        cursor.execute('SELECT * FROM alignment_results ORDER BY student_id, page_idx')
+    else:
+        cursor.execute('SELECT * FROM alignment_results WHERE student_id = ? ORDER BY page_idx', (student_id,))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    
+    for r in rows:
+        r['timings'] = json.loads(r['timings']) if r['timings'] else {}
+        r['homography'] = json.loads(r['homography']) if r['homography'] else None
+    return rows
+
 def get_all_results(db_path):
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+# --- FIDUCIAL (ArUco) SETTINGS ---
+# Boş sınav sayfasının köşelerine basılan işaretler:
+# 0 = Sol Üst, 1 = Sağ Üst, 2 = Sağ Alt, 3 = Sol Alt
+MARKER_DICT = cv2.aruco.DICT_4X4_50 if hasattr(cv2, "aruco") else None
+MARKER_IDS = (0, 1, 2, 3)
+MARKER_SIZE_RATIO = 0.035    # Kenar uzunluğu / sayfa kısa kenarı (300 DPI A4'te ~87px ≈ 7mm)
+MARKER_MARGIN_RATIO = 0.015  # Sayfa kenarından boşluk / kısa kenar
+DETECT_MAX_DIM = 1600        # Tespit bu boyuta küçültülmüş gri görüntüde yapılır
+MIN_MARKERS = 3              # Homografi için gereken ortak işaret (her biri 4 köşe verir)
+
+def is_available():
+    """OpenCV derlemesinde aruco modülü var mı?"""
+    return MARKER_DICT is not None
+
+def _dictionary():
+    if hasattr(cv2.aruco, "getPredefinedDictionary"):
+        return cv2.aruco.getPredefinedDictionary(MARKER_DICT)
+    return cv2.aruco.Dictionary_get(MARKER_DICT)
+
+def _marker_image(marker_id, side):
+    dictionary = _dictionary()
+    if hasattr(cv2.aruco, "generateImageMarker"):
+        return cv2.aruco.generateImageMarker(dictionary, marker_id, side)
+    return cv2.aruco.drawMarker(dictionary, marker_id, side)
+
+def add_markers(pil_img):
+    """
+    Sayfanın dört köşesine ArUco işaretlerini (beyaz sessiz bölge ile) çizer.
+
+    Returns: Yeni PIL Image (RGB)
+    """
+    img = np.array(pil_img.convert('RGB'))
+    h, w = img.shape[:2]
+    side = max(24, int(min(h, w) * MARKER_SIZE_RATIO))
+    margin = max(4, int(min(h, w) * MARKER_MARGIN_RATIO))
+    quiet = max(2, side // 6)
+
+    origins = {
+        0: (margin, margin),
+        1: (w - margin - side, margin),
+        2: (w - margin - side, h - margin - side),
+        3: (margin, h - margin - side),
+    }
+    for marker_id in MARKER_IDS:
+        x, y = origins[marker_id]
+        img[y - quiet:y + side + quiet, x - quiet:x + side + quiet] = 255
+        marker = _marker_image(marker_id, side)
+        img[y:y + side, x:x + side] = marker[:, :, None]
+
+    return Image.fromarray(img)
+
+def detect_markers(img_bgr):
+    """
+    Görüntüdeki bilinen işaretleri bulur.
+
+    Returns: {marker_id: (4, 2) float32 köşe noktaları (orijinal piksel koordinatlarında)}
+    """
+    if not is_available() or img_bgr is None:
+        return {}
+
+    gray = img_bgr if img_bgr.ndim == 2 else cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape[:2]
+    scale = 1.0
+    if max(h, w) > DETECT_MAX_DIM:
+        scale = DETECT_MAX_DIM / max(h, w)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    try:
+        if hasattr(cv2.aruco, "ArucoDetector"):
+            detector = cv2.aruco.ArucoDetector(_dictionary(), cv2.aruco.DetectorParameters())
+            corners, ids, _ = detector.detectMarkers(gray)
+        else:
+            corners, ids, _ = cv2.aruco.detectMarkers(gray, _dictionary())
+    except cv2.error:
+        return {}
+
+    found = {}
+    if ids is None:
+        return found
+    for c, marker_id in zip(corners, ids.ravel()):
+        marker_id = int(marker_id)
+        if marker_id in MARKER_IDS and marker_id not in found:
+            found[marker_id] = (c.reshape(4, 2) / scale).astype(np.float32)
+
+    # Küçültülmüş tespitte ~1px/scale hata olur: köşeleri tam çözünürlükte iyileştir
+    if found and scale < 1.0:
+        full_gray = img_bgr if img_bgr.ndim == 2 else cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        pts = np.concatenate(list(found.values())).reshape(-1, 1, 2)
+        win = max(3, int(round(1.5 / scale)))
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.05)
+        pts = cv2.cornerSubPix(full_gray, pts, (win, win), (-1, -1), criteria)
+        for k, marker_id in enumerate(found):
+            found[marker_id] = pts[4 * k:4 * k + 4].reshape(4, 2)
+    return found
+
+def markers_to_array(markers):
+    """{id: (4,2)} -> (K, 9) float32 [id, x0, y0, ..., x3, y3] (kaydetmek için)."""
+    rows = [[marker_id] + list(corners.ravel()) for marker_id, corners in sorted(markers.items())]
+    return np.array(rows, dtype=np.float32).reshape(-1, 9)
+
+def markers_from_array(arr):
+    return {int(r[0]): r[1:].reshape(4, 2).astype(np.float32) for r in np.asarray(arr).reshape(-1, 9)}
+
+def marker_correspondences(template_markers, student_markers):
+    """
+    Ortak işaretlerin köşelerinden nokta eşleşmeleri üretir.
+
+    Returns: (src_pts (şablon), dst_pts (öğrenci)) veya işaret sayısı yetersizse None
+    """
+    common = sorted(set(template_markers) & set(student_markers))
+    if len(common) < MIN_MARKERS:
+        return None
+    src = np.concatenate([template_markers[i] for i in common]).reshape(-1, 1, 2)
+    dst = np.concatenate([student_markers[i] for i in common]).reshape(-1, 1, 2)
+    return src, dst
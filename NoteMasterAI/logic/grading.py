@@ -6,12 +6,24 @@ import numpy as np
 from PIL import Image
 from google.cloud import vision
 import google.generativeai as genai
-from logic import utils
+from logic import utils, ai_cache
 
 # Global variables to act as a fallback for keys if needed, 
 # although we prefer passing them or environment variables.
 SERVICE_ACCOUNT_FILE = "service-account.json"
 
+def _json_text(text):
+    """Gemini yanıtındaki ```json çitlerini temizler."""
+    return text.replace("```json", "").replace("```", "").strip()
+
+def _is_json(text):
+    """Yalnızca ayrıştırılabilen yanıtlar önbelleğe alınır."""
+    try:
+        json.loads(_json_text(text))
+        return True
+    except ValueError:
+        return False
+
 def setup_apis(api_key=None, service_account_path=None):
     """
     API anahtarlarını ayarlar.
@@ -97,13 +109,14 @@ def get_text_from_image(_vision_client, image_cv2):
         print(f"Cloud Vision API çağrılırken hata: {e}")
         return ""
 
-def get_gemini_score(_gemini_model, ogrenci_metni, ideal_metin, baglam_metni, soru_tipi, sorunun_gorseli=None, ogrenci_gorseli=None, teacher_prompt="", question_prompt="", preprocess=True):
+def get_gemini_score(_gemini_model, ogrenci_metni, ideal_metin, baglam_metni, soru_tipi, sorunun_gorseli=None, ogrenci_gorseli=None, teacher_prompt="", question_prompt="", preprocess=True, use_cache=True):
     """
     Öğrenci cevabını puanlar.
     
     Args:
         sorunun_gorseli (PIL.Image or bytes, optional): Sorunun orijinal metnini/görselini içeren kırpılmış alan.
         ogrenci_gorseli (PIL.Image, optional): Öğrencinin cevabını içeren görsel (crop).
+        use_cache (bool): False ise AI yanıt önbelleği atlanır (bkz. logic/ai_cache.py).
     """
     
     # 1. Base Prompt with Relaxed Rules
@@ -176,12 +189,10 @@ Cevap anahtarı senin algını kör etmesin. Gözlerinle gördüğün gerçeği
         generation_config = genai.types.GenerationConfig(
             response_mime_type="application/json"
         )
-        response = _gemini_model.generate_content(
-            content_parts,
-            generation_config=generation_config
-        )
+        response_text = ai_cache.generate_content(_gemini_model, content_parts, generation_config=generation_config,
+                                                  use_cache=use_cache, validate=_is_json)
         
-        json_output = json.loads(response.text)
+        json_output = json.loads(_json_text(response_text))
         
         # FIX: Handle list response (Gemini sometimes returns [{}])
         if isinstance(json_output, list):
@@ -207,10 +218,6 @@ Cevap anahtarı senin algını kör etmesin. Gözlerinle gördüğün gerçeği
 
     except Exception as e:
         print(f"Gemini API hatası: {e}")
-        try:
-            print(f"Gemini Ham Yanıtı: {response.prompt_feedback}")
-        except:
-            pass
         
         return {
             "okunan_cevap": ogrenci_metni,
@@ -245,11 +252,15 @@ Cevap anahtarı senin algını kör etmesin. Gözlerinle gördüğün gerçeği
         
     content_parts.append(f"\n\n[ÖĞRENCİ CEVABI (OCR Metni - Hatalı olabilir)]:\n{ogrenci_metni}")
 
-def get_ai_comparison_result(gemini_model, student_crop, key_crop, question_type="Çoktan Seçmeli", preprocess=True):
+def get_ai_comparison_result(gemini_model, student_crop, key_crop, question_type="Çoktan Seçmeli", preprocess=True, key_value=None, use_cache=True):
     """
     Compares Student Answer vs Key Answer using Gemini Vision.
+    If `key_value` (e.g. "C" / "Doğru", from the compiled answer key) is given,
+    only the student crop is sent and the key crop is ignored.
     Returns: { "match": bool, "student_val": str, "key_val": str, "reason": str }
     """
+    if key_value:
+        return _get_ai_known_key_result(gemini_model, student_crop, key_value, question_type, preprocess, use_cache)
     
     # Preprocess both
     s_cv = cv2.cvtColor(np.array(student_crop), cv2.COLOR_RGB2BGR)
@@ -297,14 +308,78 @@ def get_ai_comparison_result(gemini_model, student_crop, key_crop, question_type
     """
     
     try:
-        response = gemini_model.generate_content([prompt, "CEVAP ANAHTARI:", k_pil, "ÖĞRENCİ CEVABI:", s_pil])
-        text = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
+        response_text = ai_cache.generate_content(gemini_model, [prompt, "CEVAP ANAHTARI:", k_pil, "ÖĞRENCİ CEVABI:", s_pil],
+                                                  use_cache=use_cache, validate=_is_json)
+        return json.loads(_json_text(response_text))
     except Exception as e:
         print(f"AI Comparison Error: {e}")
         return {"match": False, "student_val": "?", "key_val": "?", "reason": str(e)}
 
-def parse_student_info(gemini_model, header_image_pil):
+def _get_ai_known_key_result(gemini_model, student_crop, key_value, question_type, preprocess, use_cache=True):
+    """Doğru cevap biliniyorken sadece öğrencinin işaretini okutur (Tek görsel)."""
+    s_cv = cv2.cvtColor(np.array(student_crop), cv2.COLOR_RGB2BGR)
+    if preprocess:
+        s_cv = utils.preprocess_for_gemini(s_cv)
+    s_pil = Image.fromarray(cv2.cvtColor(s_cv, cv2.COLOR_BGR2RGB))
+    
+    prompt = f"""
+    Sen keskin gözlü bir optik okuma asistanısın.
+    Sana öğrencinin sınav kağıdından kesilen bir parçayı veriyorum.
+    
+    SORU TİPİ: {question_type}
+    DOĞRU CEVAP: {key_value}
+    
+    GÖREVİN:
+    1. Öğrencinin hangi şıkkı (A, B, C, D, E veya Doğru/Yanlış) işaretlediğini bul.
+       - İşaretleme türü daire içine alma, çarpı (X), tik (✓) veya karalama olabilir.
+       - Öğrenci bir şıkkı karalayıp BAŞKA bir şıkkı net işaretlediyse, SON KARARINI kabul et.
+       - Silik veya çok hafif izleri "silinmiş" kabul et.
+    2. Öğrenci cevabı == DOĞRU CEVAP ise "match": true, değilse false.
+       - Birden fazla şık EŞİT derecede işaretliyse (kararsız) "match": false.
+    
+    ÇIKTI (Sadece JSON):
+    {{
+        "student_val": "Tespit edilen öğrenci cevabı (Örn: 'A' veya 'BOŞ')",
+        "match": true/false,
+        "reason": "Kısa ve net açıklama"
+    }}
+    """
+    
+    try:
+        response_text = ai_cache.generate_content(gemini_model, [prompt, "ÖĞRENCİ CEVABI:", s_pil],
+                                                  use_cache=use_cache, validate=_is_json)
+        data = json.loads(_json_text(response_text))
+        data["key_val"] = key_value
+        return data
+    except Exception as e:
+        print(f"AI Comparison Error: {e}")
+        return {"match": False, "student_val": "?", "key_val": key_value, "reason": str(e)}
+
+def read_key_answer(gemini_model, key_crop_pil, question_type="Çoktan Seçmeli", use_cache=True):
+    """
+    Cevap anahtarı kırpımındaki işaretli şıkkı okur (Anahtar derlemede bir kez).
+    Returns: str (Örn: 'C' / 'Doğru'), "" (okunamadı) veya None (API hatası, tekrar denenebilir)
+    """
+    prompt = f"""
+    Bu görsel bir CEVAP ANAHTARINDAN kesilmiş tek bir sorudur.
+    SORU TİPİ: {question_type}
+    
+    GÖREV: İşaretli (doğru) şıkkı bul. Çoktan seçmelide sadece harf (A-E),
+    Doğru-Yanlış sorusunda "Doğru" veya "Yanlış" döndür. Emin değilsen "" döndür.
+    
+    ÇIKTI (Sadece JSON):
+    {{"key_val": "C"}}
+    """
+    
+    try:
+        response_text = ai_cache.generate_content(gemini_model, [prompt, key_crop_pil],
+                                                  use_cache=use_cache, validate=_is_json)
+        return str(json.loads(_json_text(response_text)).get("key_val", "")).strip()
+    except Exception as e:
+        print(f"Key Reading Error: {e}")
+        return None
+
+def parse_student_info(gemini_model, header_image_pil, use_cache=True):
     """
     Uses Gemini to extract Name, Class, and Number from the header image.
     Returns: dict { 'name': str, 'class_name': str, 'number': str }
@@ -335,9 +410,9 @@ def parse_student_info(gemini_model, header_image_pil):
     """
     
     try:
-        response = gemini_model.generate_content([prompt, processed_pil])
-        text = response.text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(text)
+        response_text = ai_cache.generate_content(gemini_model, [prompt, processed_pil],
+                                                  use_cache=use_cache, validate=_is_json)
+        data = json.loads(_json_text(response_text))
         # Normalize keys just in case
         return {
             "name": data.get("name", "").strip(),
@@ -2,8 +2,14 @@
 import os
 import json
 import shutil
+import hashlib
+import cv2
+import numpy as np
 from PIL import Image
 
+# Derlenmiş cevap anahtarı (key_compiled.json + key_crops/)
+KEY_COMPILED_VERSION = 2 # 2: Anahtar kırpımı baloncuk geometrisiyle okunur (PageOMR ile aynı kural)
+
 class ModelManager:
     def __init__(self, models_dir="Models"):
         self.models_dir = models_dir
@@ -52,12 +58,241 @@ class ModelManager:
         from logic.pdf_utils import pdf_to_images
         return pdf_to_images(bytes_data)
 
+    def _features_dir(self, model_name):
+        return os.path.join(self.models_dir, model_name, "features")
+
+    def _page_zones(self, zones, page_idx):
+        """zones: {page_idx: [zone]} (Anahtarlar int veya str olabilir)"""
+        if not zones: return []
+        return zones.get(page_idx, zones.get(str(page_idx), []))
+
+    def build_template_features(self, model_name, images, zones=None):
+        """
+        Her şablon sayfası için SIFT özelliklerini + FLANN indeksini hesaplar
+        ve 'features/page_{i}' olarak model klasörüne kaydeder.
+        zones verilirse cevap bölgeleri özellik çıkarımında maskelenir.
+        """
+        from logic.alignment import compute_template_features
+
+        feat_dir = self._features_dir(model_name)
+        os.makedirs(feat_dir, exist_ok=True)
+
+        features = []
+        for i, im in enumerate(images):
+            img_cv = cv2.cvtColor(np.array(im.convert('RGB')), cv2.COLOR_RGB2BGR)
+            feats = compute_template_features(img_cv, self._page_zones(zones, i))
+            if feats is not None:
+                try:
+                    feats.save(os.path.join(feat_dir, f"page_{i}"))
+                except Exception as e:
+                    print(f"Özellik önbelleği kaydedilemedi (Sayfa {i}): {e}")
+            features.append(feats)
+        return features
+
+    def load_template_features(self, model_name, images=None, zones=None):
+        """
+        Kayıtlı şablon özelliklerini yükler. Eksik, eski sürüm veya bölgeleri
+        değişmiş sayfalar yeniden hesaplanıp kaydedilir.
+        zones verilmezse config.json'dan okunur.
+
+        Returns: list (Sayfa başına TemplateFeatures veya None)
+        """
+        from logic.alignment import TemplateFeatures, compute_template_features, zones_signature
+
+        if images is None or zones is None:
+            loaded = self.load_model(model_name)
+            if not loaded: return []
+            if images is None: images = loaded[1]
+            if zones is None: zones = loaded[0].get("zones", {})
+
+        feat_dir = self._features_dir(model_name)
+        features = []
+        for i, im in enumerate(images):
+            path = os.path.join(feat_dir, f"page_{i}")
+            feats = TemplateFeatures.load(path)
+
+            w, h = im.size
+            page_zones = self._page_zones(zones, i)
+            if feats is None or feats.shape != (h, w) or feats.zones_hash != zones_signature(page_zones):
+                img_cv = cv2.cvtColor(np.array(im.convert('RGB')), cv2.COLOR_RGB2BGR)
+                feats = compute_template_features(img_cv, page_zones)
+                if feats is not None:
+                    try:
+                        os.makedirs(feat_dir, exist_ok=True)
+                        feats.save(path)
+                    except Exception as e:
+                        print(f"Özellik önbelleği kaydedilemedi (Sayfa {i}): {e}")
+            features.append(feats)
+        return features
+
+    def build_page_descriptors(self, model_name, images):
+        """
+        Model yönlendirme için sayfa başına global tanımlayıcıları hesaplar
+        ve 'features/global.npz' olarak kaydeder.
+        """
+        from logic.model_router import page_descriptor, PAGE_DESCRIPTOR_VERSION
+
+        descs = np.stack([
+            page_descriptor(cv2.cvtColor(np.array(im.convert('RGB')), cv2.COLOR_RGB2BGR)) for im in images
+        ]) if images else np.zeros((0, 0), np.float32)
+        sizes = np.array([im.size for im in images]).reshape(-1, 2)
+        try:
+            feat_dir = self._features_dir(model_name)
+            os.makedirs(feat_dir, exist_ok=True)
+            np.savez(os.path.join(feat_dir, "global.npz"), version=PAGE_DESCRIPTOR_VERSION,
+                     descriptors=descs, sizes=sizes)
+        except Exception as e:
+            print(f"Sayfa tanımlayıcıları kaydedilemedi ({model_name}): {e}")
+        return descs
+
+    def load_page_descriptors(self, model_name):
+        """
+        Kayıtlı global sayfa tanımlayıcılarını yükler (P, D). Eksik veya eski
+        ise model görüntülerinden yeniden hesaplanır.
+        """
+        from logic.model_router import PAGE_DESCRIPTOR_VERSION
+
+        path = os.path.join(self._features_dir(model_name), "global.npz")
+        images_dir = os.path.join(self.models_dir, model_name, "images")
+        page_count = len(os.listdir(images_dir)) if os.path.isdir(images_dir) else 0
+        if os.path.exists(path):
+            try:
+                data = np.load(path)
+                if int(data["version"]) == PAGE_DESCRIPTOR_VERSION and len(data["descriptors"]) == page_count:
+                    return data["descriptors"]
+            except Exception as e:
+                print(f"Sayfa tanımlayıcıları okunamadı ({model_name}): {e}")
+
+        loaded = self.load_model(model_name)
+        if not loaded: return None
+        return self.build_page_descriptors(model_name, loaded[1])
+
+    def _read_key_bytes(self, model_name):
+        key_path = os.path.join(self.models_dir, model_name, "key.pdf")
+        if not os.path.exists(key_path): return None
+        with open(key_path, "rb") as f:
+            return f.read()
+
+    def _key_signature(self, key_bytes, zones):
+        """key.pdf içeriği + ÇS/DY bölgelerinin konum/cevap bilgisi (Derlemenin geçerliliği)."""
+        from logic.omr import OMR_ZONE_TYPES
+        h = hashlib.sha256(key_bytes or b"")
+        for p_idx in sorted(zones or {}, key=int):
+            for z in self._page_zones(zones, p_idx):
+                if z.get("zone_type") not in OMR_ZONE_TYPES: continue
+                h.update(repr((int(p_idx), z.get("id"), z.get("zone_type"), round(float(z["left"])), round(float(z["top"])),
+                               round(float(z["width"])), round(float(z["height"])), z.get("answer", ""),
+                               z.get("num_options", 5), z.get("layout", "dikey"))).encode("utf-8"))
+        return h.hexdigest()
+
+    def compile_key(self, model_name, zones=None, key_bytes=None, read_key_ai=None):
+        """
+        Cevap anahtarını bir kez derler: Her ÇS/DY bölgesinin anahtar kırpımı
+        (Gemini için ön işlenmiş) 'key_crops/' altına yazılır ve doğru cevap
+        bölgenin "answer" alanından, anahtar sayfasından (OMR) veya verilirse
+        `read_key_ai(pil_crop, zone_type)` ile tek bir AI çağrısından belirlenir.
+        "ai_tried": AI okuması yapıldı (sonuç geçersiz olsa bile); bu bölgeler
+        tekrar derlemeyi tetiklemez. read_key_ai None döndürürse (API hatası) denenmemiş sayılır.
+
+        Returns: {"version", "signature", "zones": {zone_id: {"page", "key_value", "source", "crop", "ai_tried"}}}
+        """
+        from logic import omr, utils
+        from logic.pdf_utils import iter_pdf_images
+
+        sp = os.path.join(self.models_dir, model_name)
+        if zones is None:
+            loaded = self.load_model(model_name)
+            zones = loaded[0].get("zones", {}) if loaded else {}
+        if key_bytes is None:
+            key_bytes = self._read_key_bytes(model_name)
+        # Only key pages holding MC/TF zones are rasterised, one at a time (ascending page order)
+        omr_pages = [int(p) for p in zones if any(z.get("zone_type") in omr.OMR_ZONE_TYPES for z in self._page_zones(zones, p))]
+        key_pages = iter_pdf_images(key_bytes, pages=omr_pages) if key_bytes else iter(())
+        next_key = next(key_pages, None)
+
+        crops_dir = os.path.join(sp, "key_crops")
+        shutil.rmtree(crops_dir, ignore_errors=True)
+        os.makedirs(crops_dir, exist_ok=True)
+
+        entries = {}
+        for p_idx in sorted(zones, key=int):
+            page = int(p_idx)
+            k_page = None
+            if next_key is not None and next_key[0] == page:
+                k_page = cv2.cvtColor(np.array(next_key[1].convert('RGB')), cv2.COLOR_RGB2BGR)
+                next_key = next(key_pages, None)
+            for z in self._page_zones(zones, p_idx):
+                z_type = z.get("zone_type")
+                if z_type not in omr.OMR_ZONE_TYPES or not z.get("id"): continue
+                n = 2 if z_type == "Doğru-Yanlış" else int(z.get("num_options", 5))
+                layout = z.get("layout", "dikey")
+
+                key_crop, crop_name = None, ""
+                if k_page is not None:
+                    h_k, w_k = k_page.shape[:2]
+                    kx = max(0, min(int(z["left"]), w_k - 1))
+                    ky = max(0, min(int(z["top"]), h_k - 1))
+                    kw = max(1, min(int(z["width"]), w_k - kx))
+                    kh = max(1, min(int(z["height"]), h_k - ky))
+                    key_crop = k_page[ky:ky + kh, kx:kx + kw]
+                    key_proc = utils.preprocess_for_gemini(key_crop)
+                    crop_name = str(z["id"]).replace("/", "-") + ".jpg"
+                    cv2.imwrite(os.path.join(crops_dir, crop_name), key_proc)
+
+                key_val, source = omr.decide_key(z_type, n, layout, z.get("answer", ""), key_crop, zone=z)
+                ai_tried = False
+                if not key_val and read_key_ai is not None and key_crop is not None:
+                    ai_val = read_key_ai(Image.fromarray(cv2.cvtColor(key_proc, cv2.COLOR_BGR2RGB)), z_type)
+                    ai_tried = ai_val is not None
+                    if ai_val in omr.option_labels(z_type, n):
+                        key_val, source = ai_val, "ai"
+
+                entries[z["id"]] = {"page": page, "key_value": key_val, "source": source, "crop": crop_name,
+                                    "ai_tried": ai_tried}
+
+        compiled = {"version": KEY_COMPILED_VERSION, "signature": self._key_signature(key_bytes, zones), "zones": entries}
+        with open(os.path.join(sp, "key_compiled.json"), "w") as f:
+            json.dump(compiled, f, indent=4)
+        undecided = sum(1 for e in entries.values() if not e["key_value"])
+        print(f"[Model] Cevap anahtarı derlendi ({model_name}): {len(entries)} bölge, {undecided} karar verilemedi.")
+        return compiled
+
+    def load_compiled_key(self, model_name, zones=None, key_bytes=None):
+        """
+        Derlenmiş cevap anahtarını yükler. key.pdf veya bölgeler derlemeden
+        sonra değiştiyse None döner (Yeniden derlenmeli).
+        """
+        path = os.path.join(self.models_dir, model_name, "key_compiled.json")
+        if not os.path.exists(path): return None
+        try:
+            with open(path, "r") as f:
+                compiled = json.load(f)
+        except Exception as e:
+            print(f"Derlenmiş anahtar okunamadı ({model_name}): {e}")
+            return None
+
+        if zones is None:
+            loaded = self.load_model(model_name)
+            zones = loaded[0].get("zones", {}) if loaded else {}
+        if key_bytes is None:
+            key_bytes = self._read_key_bytes(model_name)
+        if compiled.get("version") != KEY_COMPILED_VERSION or compiled.get("signature") != self._key_signature(key_bytes, zones):
+            return None
+        return compiled
+
     def save_model(self, model_name, images, zones, pdf_key_bytes=None, pdf_slides_bytes=None):
         sp = os.path.join(self.models_dir, model_name)
         os.makedirs(os.path.join(sp, "images"), exist_ok=True)
         
         ref_width, ref_height = images[0].size
         
+        # OMR bubble geometry, detected once on the blank pages (stored in the zones)
+        from logic.omr import annotate_bubbles
+        for i, im in enumerate(images):
+            page_zones = self._page_zones(zones, i)
+            if page_zones:
+                annotate_bubbles(cv2.cvtColor(np.array(im.convert('RGB')), cv2.COLOR_RGB2BGR), page_zones)
+        
         cfg = {
             "model_name": model_name,
             "ref_width": ref_width,
@@ -70,6 +305,10 @@ class ModelManager:
             
         for i, im in enumerate(images): 
             im.save(os.path.join(sp, "images", f"page_{i}.png"))
+
+        # Precompute alignment features for the template pages
+        self.build_template_features(model_name, images, zones)
+        self.build_page_descriptors(model_name, images)
             
         # Save composite PDF for reference
         images[0].save(
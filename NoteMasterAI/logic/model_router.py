@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+from logic import alignment
+from logic.page_matching import PageMatcher
+
+# --- MODEL YÖNLENDİRME AYARLARI ---
+# Her model sayfası için küçük bir global tanımlayıcı (kare küçük resim) tutulur.
+# Öğrenci sayfası 4 yönde tüm model sayfalarıyla tek bir matris çarpımında karşılaştırılır.
+ROUTER_THUMB_DIM = 32       # Tanımlayıcı: ROUTER_THUMB_DIM x ROUTER_THUMB_DIM
+ROUTER_MIN_SCORE = 0.45     # En iyi model bu korelasyonun altındaysa sayfa tanınmadı sayılır
+ROUTER_MIN_MARGIN = 0.08    # İlk iki model arası fark bundan azsa özellik oylamasıyla doğrulanır
+PAGE_DESCRIPTOR_VERSION = 1
+
+def page_descriptor(img):
+    """Sayfa (BGR/Gri) için birim uzunlukta global tanımlayıcı (ROUTER_THUMB_DIM^2 float32)."""
+    thumb = alignment._orientation_thumb(img, size=(ROUTER_THUMB_DIM, ROUTER_THUMB_DIM))
+    return _normalize(thumb.ravel())
+
+def _normalize(vec):
+    vec = np.float32(vec)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+def _rotated_descriptors(img):
+    """Öğrenci sayfasının 4 yöndeki tanımlayıcıları (4, D). Döndürme küçük resimde yapılır."""
+    thumb = alignment._orientation_thumb(img, size=(ROUTER_THUMB_DIM, ROUTER_THUMB_DIM))
+    return np.stack([_normalize(np.rot90(thumb, k).ravel()) for k in range(4)])
+
+class ModelRouter:
+    """
+    Karışık taramalarda her öğrenciyi doğru sınav modeline yönlendirir.
+
+    Model sayfalarının global tanımlayıcıları model klasöründe önbelleklenir
+    (bkz. ModelManager.load_page_descriptors). Belirsiz durumlarda kaba SIFT
+    oylamasıyla (PageMatcher) doğrulanır.
+
+    Kullanım:
+        router = ModelRouter(manager)
+        router.set_templates({name: (tmpl_cvs, template_features)})  # İsteğe bağlı, yüklenmiş şablonlar
+        model_name, report = router.classify_student(stud_cvs)
+    """
+
+    def __init__(self, manager, model_names=None):
+        self.manager = manager
+        self.model_names = []
+        descs, labels = [], []
+        for name in model_names or manager.list_models():
+            page_descs = manager.load_page_descriptors(name)
+            if page_descs is None or len(page_descs) == 0: continue
+            self.model_names.append(name)
+            descs.append(page_descs)
+            labels.extend((name, p_idx) for p_idx in range(len(page_descs)))
+
+        self.labels = labels
+        self.descriptors = np.concatenate(descs) if descs else np.zeros((0, ROUTER_THUMB_DIM ** 2), np.float32)
+        self.templates = {} # {model: (şablon sayfaları BGR, TemplateFeatures listesi)}
+        self._matcher = None
+        self._matcher_labels = None
+
+    def set_templates(self, templates):
+        """
+        Çağıranın zaten yüklediği şablonlar (örn. GradingWorker bağlamları).
+        Özellik oylaması bunları kullanır; verilmeyen modeller ModelManager'dan yüklenir.
+        """
+        self.templates = dict(templates)
+        self._matcher = None
+        self._matcher_labels = None
+
+    def _model_templates(self, name):
+        """Returns: (şablon sayfaları BGR, TemplateFeatures listesi) veya None"""
+        if name in self.templates:
+            return self.templates[name]
+        loaded = self.manager.load_model(name)
+        if not loaded: return None
+        config, pil_pages = loaded
+        feats = self.manager.load_template_features(name, pil_pages, config.get("zones", {}))
+        return [cv2.cvtColor(np.array(im.convert('RGB')), cv2.COLOR_RGB2BGR) for im in pil_pages], feats
+
+    def page_scores(self, img):
+        """Returns: {model_name: en iyi sayfa korelasyonu} (4 yönün en iyisi)"""
+        if len(self.labels) == 0 or img is None: return {}
+        sims = (_rotated_descriptors(img) @ self.descriptors.T).max(axis=0)
+        scores = {}
+        for (name, _), sim in zip(self.labels, sims):
+            scores[name] = max(scores.get(name, -1.0), float(sim))
+        return scores
+
+    def classify_student(self, student_images):
+        """
+        Öğrencinin tüm sayfalarını değerlendirip tek bir model seçer.
+
+        Returns: (model_name veya None, report)
+            report: {"scores": {model: ortalama skor}, "method": "thumbnail" | "features" | None}
+        """
+        if not self.model_names:
+            return None, {"scores": {}, "method": None}
+        if len(self.model_names) == 1:
+            return self.model_names[0], {"scores": {}, "method": "single"}
+
+        totals = {name: 0.0 for name in self.model_names}
+        for img in student_images:
+            for name, sc in self.page_scores(img).items():
+                totals[name] += sc
+        n = max(1, len(student_images))
+        scores = {name: total / n for name, total in totals.items()}
+        ranked = sorted(scores, key=scores.get, reverse=True)
+
+        best = ranked[0]
+        margin = scores[best] - scores[ranked[1]]
+        report = {"scores": scores, "method": "thumbnail"}
+        if scores[best] >= ROUTER_MIN_SCORE and margin >= ROUTER_MIN_MARGIN:
+            return best, report
+
+        # Belirsiz: Kaba SIFT oylaması (Tüm modellerin sayfaları tek indekste)
+        votes = self._feature_votes(student_images)
+        report["method"] = "features"
+        report["votes"] = votes
+        if votes and max(votes.values()) > 0:
+            return max(votes, key=votes.get), report
+        return None, report
+
+    def _feature_votes(self, student_images):
+        if self._matcher is None:
+            images, features, labels = [], [], []
+            for name in self.model_names:
+                templates = self._model_templates(name)
+                if templates is None: continue
+                tmpl_cvs, feats = templates
+                feats = feats or []
+                for p_idx, tmpl_cv in enumerate(tmpl_cvs):
+                    images.append(tmpl_cv)
+                    features.append(feats[p_idx] if p_idx < len(feats) else None)
+                    labels.append(name)
+            self._matcher = PageMatcher(images, features)
+            self._matcher_labels = labels
+
+        votes = {}
+        for img in student_images:
+            for label, v in zip(self._matcher_labels, self._matcher.votes(img)):
+                votes[label] = votes.get(label, 0) + int(v)
+        return votes
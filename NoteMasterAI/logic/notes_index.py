@@ -0,0 +1,141 @@
+import re
+import hashlib
+import threading
+import numpy as np
+from logic import text_extraction
+
+# --- DERS NOTU ARAMA AYARLARI ---
+# Ders notları sayfa düzeyinde parçalara bölünür (uzun sayfalar kelime pencerelerine),
+# her bölge için yalnızca cevap anahtarı / soru notuna en ilgili parçalar (BM25) gönderilir.
+NOTES_CHUNK_WORDS = 250     # Bundan uzun sayfalar pencerelere bölünür
+NOTES_CHUNK_OVERLAP = 50    # Ardışık pencerelerin ortak kelime sayısı
+NOTES_TOP_K = 3             # Bölge başına gönderilen parça sayısı
+NOTES_MAX_CHARS = 4000      # Notların tamamı bundan kısaysa arama yapılmadan tamamı gönderilir
+NOTES_STEM_LEN = 5          # Türkçe için kök yaklaşımı: kelimenin ilk N harfi
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Sık geçen, ayırt edici olmayan kelimeler (küçük harf, kök kısaltmasından önce)
+STOPWORDS = {
+    "ve", "ile", "bir", "bu", "şu", "o", "da", "de", "ki", "mi", "mı", "mu", "mü", "için", "gibi",
+    "daha", "çok", "en", "ya", "veya", "ama", "fakat", "ise", "olan", "olarak", "her", "hem",
+    "ne", "nasıl", "neden", "hangi", "kadar", "sonra", "önce", "the", "of", "and", "a", "an", "to", "in", "is"
+}
+_TOKEN_RE = re.compile(r"[0-9a-zçğıöşüâîû]+")
+
+def _lower_tr(text):
+    """Türkçe büyük/küçük harf dönüşümü (İ -> i, I -> ı)."""
+    return text.replace("İ", "i").replace("I", "ı").lower()
+
+def tokenize(text):
+    """Küçük harf, noktalama temizliği, durak kelimeleri ve ilk-N-harf kök yaklaşımı."""
+    tokens = []
+    for tok in _TOKEN_RE.findall(_lower_tr(text or "")):
+        if len(tok) < 2 or tok in STOPWORDS: continue
+        tokens.append(tok[:NOTES_STEM_LEN])
+    return tokens
+
+def split_pages(pages):
+    """
+    pages: [(sayfa no, metin)]
+    Returns: [{"page": sayfa no, "text": parça metni}] Uzun sayfalar örtüşen kelime pencerelerine bölünür.
+    """
+    chunks = []
+    step = max(1, NOTES_CHUNK_WORDS - NOTES_CHUNK_OVERLAP)
+    for page_no, text in pages:
+        words = (text or "").split()
+        if not words: continue
+        if len(words) <= NOTES_CHUNK_WORDS:
+            chunks.append({"page": page_no, "text": " ".join(words)})
+            continue
+        for start in range(0, len(words) - NOTES_CHUNK_OVERLAP, step):
+            chunks.append({"page": page_no, "text": " ".join(words[start:start + NOTES_CHUNK_WORDS])})
+    return chunks
+
+class NotesIndex:
+    """
+    Ders notları üzerinde BM25 sözcüksel arama.
+
+    Kullanım:
+        index = NotesIndex.from_pdf(pdf_bytes)
+        hits = index.search("fotosentez klorofil ışık", k=3)   # [(skor, parça)]
+        context = index.context_for(ideal_text + " " + question_note)
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.total_chars = sum(len(c["text"]) for c in chunks)
+        self.vocab = {}
+        postings = [] # (terim, parça, tf)
+        doc_len = np.zeros(len(chunks), dtype=np.float32)
+        for c_idx, chunk in enumerate(chunks):
+            tokens = tokenize(chunk["text"])
+            doc_len[c_idx] = len(tokens)
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                postings.append((self.vocab.setdefault(tok, len(self.vocab)), c_idx, tf))
+
+        # Terim başına (parça indeksleri, BM25 ağırlıkları) - sorgu anında yalnızca toplama yapılır
+        n_docs = max(1, len(chunks))
+        avg_len = float(doc_len.mean()) if len(chunks) else 1.0
+        df = np.zeros(len(self.vocab), dtype=np.float32)
+        for t_idx, _, _ in postings:
+            df[t_idx] += 1
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        by_term = [[] for _ in range(len(self.vocab))]
+        for t_idx, c_idx, tf in postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[c_idx] / max(avg_len, 1e-6))
+            by_term[t_idx].append((c_idx, idf[t_idx] * tf * (BM25_K1 + 1) / (tf + norm)))
+        self._postings = [(np.array([c for c, _ in p], dtype=np.int32), np.array([w for _, w in p], dtype=np.float32))
+                          for p in by_term]
+
+    @classmethod
+    def from_pages(cls, pages):
+        return cls(split_pages(pages))
+
+    @classmethod
+    def from_pdf(cls, pdf_bytes):
+        """PDF özetine göre süreç içinde önbelleklenir (sayfa metinleri: text_extraction önbelleği)."""
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        with _INDEX_LOCK:
+            if digest in _INDEXES:
+                return _INDEXES[digest]
+        pages = [(rec["page"], rec["text"]) for rec in text_extraction.get_pdf_pages(pdf_bytes)]
+        index = cls.from_pages(pages)
+        with _INDEX_LOCK:
+            _INDEXES[digest] = index
+        return index
+
+    def search(self, query, k=NOTES_TOP_K):
+        """Returns: [(skor, parça)] skoru > 0 olan en iyi k parça, skor sırasıyla."""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for tok in set(tokenize(query)):
+            t_idx = self.vocab.get(tok)
+            if t_idx is None: continue
+            docs, weights = self._postings[t_idx]
+            scores[docs] += weights
+        if not scores.any():
+            return []
+        k = min(k, int((scores > 0).sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+    def full_text(self):
+        return "\n\n".join(f"--- SAYFA {c['page']} ---\n{c['text']}" for c in self.chunks)
+
+    def context_for(self, query, k=NOTES_TOP_K):
+        """
+        Bölgeye gönderilecek [DERS NOTLARI] metni.
+        Notlar NOTES_MAX_CHARS'tan kısaysa tamamı, değilse en ilgili k parça (sayfa sırasıyla).
+        """
+        if self.total_chars <= NOTES_MAX_CHARS:
+            return self.full_text()
+        hits = sorted(self.search(query, k), key=lambda h: h[1]["page"])
+        return "\n\n".join(f"--- SAYFA {chunk['page']} ---\n{chunk['text']}" for _, chunk in hits)
+
+_INDEXES = {}
+_INDEX_LOCK = threading.Lock()
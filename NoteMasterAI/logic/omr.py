@@ -1,6 +1,25 @@
 import cv2
 import numpy as np
 
+# --- YEREL OMR (Gemini'den önce) ---
+# Skorlar seçenek dilimlerindeki siyah piksel oranıdır; basılı daire/harf gibi
+# her seçenekte ortak olan mürekkep taban çizgisi (medyan) olarak çıkarılır.
+OMR_MARK_FILL = 0.05      # Taban üstü dolu oran (dilim alanına göre) bundan azsa işaret yok sayılır
+OMR_MIN_MARGIN = 0.5      # (1. - 2.) / 1. marj bundan düşükse karar Gemini'ye bırakılır
+OMR_MULTI_MARK = 0.6      # 1. işaretin bu oranına ulaşan her seçenek ayrı işaret sayılır
+MC_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ" # 26'dan fazla seçenekte AA, AB, ... ile devam edilir
+TF_LABELS = ["Doğru", "Yanlış"]
+OMR_ZONE_TYPES = ("Çoktan Seçmeli", "Doğru-Yanlış")
+
+# --- BALONCUK GEOMETRİSİ (Model kaydında bir kez) ---
+# Boş şablonda her seçeneğin dairesi bulunur ve bölgeye "bubbles" olarak yazılır:
+# [[cx, cy, r], ...] bölgenin sol üst köşesine göre. Bulunamazsa eşit dilimler kullanılır.
+BUBBLE_MIN_RADIUS = 3          # px
+BUBBLE_MIN_CIRCULARITY = 0.6   # Kontur alanı / çevrel daire alanı
+BUBBLE_RADIUS_TOLERANCE = 0.3  # Seçeneklerin yarıçapı medyandan en fazla bu oranda sapabilir
+BUBBLE_SAMPLE_RATIO = 0.7      # Örneklenen kare = daire içine çizilen karenin bu oranı (Çerçeve çizgisi dışarıda kalır)
+BUBBLE_MARK_FILL = 0.25        # Küçük örnek karede basılı harf tek başına OMR_MARK_FILL'i aşabilir
+
 def _get_omr_scores(thresh_image, num_options, layout):
     """(YARDIMCI) Görüntüyü Dikey/Yatay böl ve puanları döndür."""
     h, w = thresh_image.shape
@@ -121,3 +140,313 @@ def process_visual_comparison(student_img, key_img, num_options=5, layout="dikey
     is_correct = (student_idx == correct_idx) and (correct_idx != -1)
     
     return student_idx, correct_idx, is_correct
+
+def _binarize(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    try:
+        blur = cv2.GaussianBlur(gray, (5, 5), 0)
+        _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    except cv2.error:
+        _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV)
+    return thresh
+
+def _option_rects(x, y, w, h, num_options, layout):
+    """_get_omr_scores ile aynı eşit dilimler: (num_options, 4) [x0, y0, x1, y1]"""
+    rects = []
+    for i in range(num_options):
+        if layout == "yatay":
+            step = w // num_options
+            rects.append((x + i * step, y, x + ((i + 1) * step if i < num_options - 1 else w), y + h))
+        else:
+            step = h // num_options
+            rects.append((x, y + i * step, x + w, y + ((i + 1) * step if i < num_options - 1 else h)))
+    return np.int32(rects)
+
+def _marks_from_ink(ink, option_area, counts, min_fill=OMR_MARK_FILL):
+    """
+    Vektörel karar: Z bölge x K seçenek.
+
+    ink: (Z, K) siyah piksel sayıları (olmayan seçenekler NaN)
+    option_area: (Z, 1) veya (Z, K) örneklenen alan, counts: (Z,) seçenek sayısı
+    min_fill: İşaret eşiği (skaler veya (Z,))
+    Returns: index (Z,), scores (Z, K), margin (Z,), multi (Z,)
+    """
+    # 2 seçenekte medyan işaretli olanı da yutar: Taban = en az dolu seçenek
+    baseline = np.where(counts > 2, np.nanmedian(ink, axis=1), np.nanmin(ink, axis=1))
+    scores = np.maximum(ink - baseline[:, None], 0) / option_area
+    filled = np.nan_to_num(scores, nan=-1.0)
+
+    rows = np.arange(len(ink))
+    order = np.argsort(-filled, axis=1, kind="stable")
+    first = filled[rows, order[:, 0]]
+    second = np.maximum(filled[rows, order[:, 1]], 0)
+    marked = first >= min_fill
+
+    index = np.where(marked, order[:, 0], -1)
+    margin = np.where(marked, (first - second) / np.maximum(first, 1e-9), 0.0)
+    multi = marked & ((filled >= OMR_MULTI_MARK * first[:, None]).sum(axis=1) > 1)
+    return index, scores, margin, multi
+
+def read_marks(image, num_options=5, layout="dikey"):
+    """
+    Seçenek dilimlerini okur ve skor dağılımından güven marjı çıkarır.
+
+    Returns: dict
+        index: İşaretli seçenek (-1 = boş / okunamadı)
+        scores: Taban çizgisi çıkarılmış dolu oranları (dilim alanına göre)
+        margin: (1. - 2.) / 1. (0 = kararsız, 1 = tek net işaret)
+        multi: Birden fazla seçenek işaretli mi?
+    """
+    empty = {"index": -1, "scores": [], "margin": 0.0, "multi": False}
+    if image is None or image.size == 0 or num_options < 2: return empty
+
+    thresh = _binarize(image)
+    h, w = thresh.shape[:2]
+    ink = np.float64([[cv2.countNonZero(split) for split in _get_omr_scores(thresh, num_options, layout)]])
+    index, scores, margin, multi = _marks_from_ink(ink, np.float64([[max(1.0, h * w / num_options)]]),
+                                                   np.int32([num_options]))
+    return {"index": int(index[0]), "scores": scores[0].tolist(), "margin": float(margin[0]), "multi": bool(multi[0])}
+
+def detect_bubbles(template_crop, num_options=5, layout="dikey"):
+    """
+    Boş şablon kırpımında seçenek dairelerini bulur (Kontur analizi, olmazsa Hough).
+
+    Returns: [[cx, cy, r], ...] (seçenek sırasıyla, kırpım koordinatlarında) veya
+             tam olarak num_options daire bulunamazsa None
+    """
+    if template_crop is None or template_crop.size == 0 or num_options < 2: return None
+    h, w = template_crop.shape[:2]
+    along = h if layout != "yatay" else w
+    max_r = 0.55 * min(along / num_options, w if layout != "yatay" else h)
+    if max_r < BUBBLE_MIN_RADIUS: return None
+
+    # 1. Kontur analizi (Halka kenarlarının iç/dış konturları aynı merkezde birleşir)
+    contours, _ = cv2.findContours(_binarize(template_crop), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    circles = []
+    for c in contours:
+        (cx, cy), r = cv2.minEnclosingCircle(c)
+        if r < BUBBLE_MIN_RADIUS or r > max_r: continue
+        _, _, bw, bh = cv2.boundingRect(c)
+        if not 0.8 <= bw / max(1, bh) <= 1.25: continue
+        if cv2.contourArea(c) / (np.pi * r * r) < BUBBLE_MIN_CIRCULARITY: continue
+        circles.append((cx, cy, r))
+    bubbles = _pick_bubbles(circles, num_options, layout)
+
+    # 2. Hough (Kesikli veya ince çizilmiş daireler)
+    if bubbles is None:
+        gray = cv2.cvtColor(template_crop, cv2.COLOR_BGR2GRAY) if template_crop.ndim == 3 else template_crop
+        found = cv2.HoughCircles(cv2.medianBlur(gray, 3), cv2.HOUGH_GRADIENT, dp=1, minDist=0.6 * along / num_options,
+                                 param1=100, param2=15, minRadius=BUBBLE_MIN_RADIUS, maxRadius=int(max_r))
+        if found is not None:
+            bubbles = _pick_bubbles([tuple(c) for c in found[0]], num_options, layout)
+    return bubbles
+
+def _pick_bubbles(circles, num_options, layout):
+    """Eş merkezlileri birleştirir, yarıçapı tutarlı num_options daireyi seçer."""
+    kept = []
+    for cx, cy, r in sorted(circles, key=lambda c: -c[2]):
+        if all(np.hypot(cx - kx, cy - ky) > 0.5 * kr for kx, ky, kr in kept):
+            kept.append((cx, cy, r))
+    if len(kept) < num_options: return None
+
+    # Harf/işaret gibi küçük adaylar elenir: En büyük num_options dairenin medyanı referans
+    ref = np.median([r for _, _, r in kept[:num_options]])
+    kept = [c for c in kept if abs(c[2] - ref) <= BUBBLE_RADIUS_TOLERANCE * ref]
+    if len(kept) != num_options: return None
+
+    axis = 0 if layout == "yatay" else 1
+    return [[round(float(cx), 1), round(float(cy), 1), round(float(r), 1)]
+            for cx, cy, r in sorted(kept, key=lambda c: c[axis])]
+
+def annotate_bubbles(img_template, page_zones):
+    """
+    Sayfanın ÇS/DY bölgelerine baloncuk geometrisini yazar (z["bubbles"], z["bubbles_size"]).
+    Bulunamayan bölgelerden eski kayıt silinir (Eşit dilimlere dönülür).
+
+    Returns: Geometrisi bulunan bölge sayısı
+    """
+    found = 0
+    h_t, w_t = img_template.shape[:2]
+    for z in page_zones:
+        if z.get("zone_type") not in OMR_ZONE_TYPES: continue
+        x, y = max(0, int(z["left"])), max(0, int(z["top"]))
+        w, h = min(int(z["width"]), w_t - x), min(int(z["height"]), h_t - y)
+        n = 2 if z["zone_type"] == "Doğru-Yanlış" else int(z.get("num_options", 5))
+        bubbles = detect_bubbles(img_template[y:y + h, x:x + w], n, z.get("layout", "dikey")) if w > 0 and h > 0 else None
+        if bubbles is None:
+            z.pop("bubbles", None)
+            z.pop("bubbles_size", None)
+            continue
+        z["bubbles"] = bubbles
+        z["bubbles_size"] = [int(z["width"]), int(z["height"])]
+        found += 1
+    return found
+
+def zone_bubbles(z, num_options):
+    """Bölgenin kayıtlı baloncukları (bölge boyutu değişmemişse), yoksa None."""
+    bubbles = z.get("bubbles")
+    if not bubbles or len(bubbles) != num_options: return None
+    if z.get("bubbles_size") != [int(z["width"]), int(z["height"])]: return None
+    return bubbles
+
+class PageOMR:
+    """
+    Bir sayfadaki tüm Çoktan Seçmeli / Doğru-Yanlış bölgelerini tek geçişte okur.
+
+    Seçenek dilimleri şablon koordinatlarında bir kez hesaplanır; okumada
+    hizalanmış sayfa (veya bölgelerin ortak kutusu) bir kez eşiklenir ve her
+    dilimin siyah piksel sayısı integral görüntüden (4 okuma) alınır.
+
+    Kullanım:
+        page_omr = PageOMR(page_zones)
+        x, y, w, h = page_omr.bbox
+        marks = page_omr.read(page_view.crop(x, y, w, h), offset=(x, y))
+        marks[zone_id]  # read_marks ile aynı biçim
+    """
+
+    def __init__(self, zones):
+        self.zones = [z for z in zones if z.get("zone_type") in OMR_ZONE_TYPES]
+        self.counts = np.int32([2 if z["zone_type"] == "Doğru-Yanlış" else int(z.get("num_options", 5))
+                                for z in self.zones])
+        k = int(self.counts.max()) if len(self.zones) else 0
+        # (Z, K, 4) dilimler; olmayan seçenekler boş dikdörtgen (0 alan) + valid=False
+        self.rects = np.zeros((len(self.zones), k, 4), np.int32)
+        self.valid = np.zeros((len(self.zones), k), bool)
+        self.sampled = np.zeros(len(self.zones), bool) # Baloncuk geometrisi var mı?
+        for i, z in enumerate(self.zones):
+            n = self.counts[i]
+            x, y = int(z["left"]), int(z["top"])
+            bubbles = zone_bubbles(z, n)
+            if bubbles is not None:
+                # Dairenin içindeki kare (Halkanın çizgisi dışarıda kalır)
+                b = np.float64(bubbles)
+                a = np.maximum(1.0, b[:, 2] * BUBBLE_SAMPLE_RATIO / np.sqrt(2))
+                self.rects[i, :n] = np.round(np.stack([x + b[:, 0] - a, y + b[:, 1] - a,
+                                                       x + b[:, 0] + a, y + b[:, 1] + a], axis=1))
+                self.sampled[i] = True
+            else:
+                self.rects[i, :n] = _option_rects(x, y, int(z["width"]), int(z["height"]), n, z.get("layout", "dikey"))
+            self.valid[i, :n] = True
+
+        if len(self.zones):
+            x0, y0 = self.rects[..., 0][self.valid].min(), self.rects[..., 1][self.valid].min()
+            x1, y1 = self.rects[..., 2][self.valid].max(), self.rects[..., 3][self.valid].max()
+            self.bbox = (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+        else:
+            self.bbox = (0, 0, 0, 0)
+
+    def read_matrix(self, page_img, offset=(0, 0)):
+        """
+        Returns: index (Z,), scores (Z, K), margin (Z,), multi (Z,) — self.zones sırasıyla
+        """
+        thresh = _binarize(page_img)
+        h, w = thresh.shape[:2]
+        ii = cv2.integral((thresh > 0).astype(np.uint8))
+
+        r = self.rects - np.int32([offset[0], offset[1], offset[0], offset[1]])
+        x0, x1 = np.clip(r[..., 0], 0, w), np.clip(r[..., 2], 0, w)
+        y0, y1 = np.clip(r[..., 1], 0, h), np.clip(r[..., 3], 0, h)
+        ink = (ii[y1, x1] - ii[y0, x1] - ii[y1, x0] + ii[y0, x0]).astype(np.float64)
+        ink[~self.valid] = np.nan
+
+        # Dilimlerde read_marks ile aynı: bölge alanı / seçenek sayısı (kırpılmış);
+        # baloncuklarda örneklenen karenin kendi alanı
+        zone_area = (x1.max(axis=1, where=self.valid, initial=0) - x0.min(axis=1, where=self.valid, initial=w)) * \
+                    (y1.max(axis=1, where=self.valid, initial=0) - y0.min(axis=1, where=self.valid, initial=h))
+        option_area = np.where(self.sampled[:, None], (x1 - x0) * (y1 - y0),
+                               (zone_area / np.maximum(1, self.counts))[:, None])
+        min_fill = np.where(self.sampled, BUBBLE_MARK_FILL, OMR_MARK_FILL)
+        return _marks_from_ink(ink, np.maximum(1.0, option_area), self.counts, min_fill)
+
+    def read(self, page_img, offset=(0, 0)):
+        """Returns: {zone id: {"index", "scores", "margin", "multi"}}"""
+        if not self.zones or page_img is None or page_img.size == 0:
+            return {}
+        index, scores, margin, multi = self.read_matrix(page_img, offset)
+        return {
+            z.get("id", i): {
+                "index": int(index[i]),
+                "scores": scores[i, :self.counts[i]].tolist(),
+                "margin": float(margin[i]),
+                "multi": bool(multi[i])
+            }
+            for i, z in enumerate(self.zones)
+        }
+
+def read_zone_marks(image, z):
+    """
+    Tek bölge kırpımını (bölge koordinatlarında) okur. Baloncuk geometrisi varsa
+    PageOMR ile aynı kural (örneklenen kareler + BUBBLE_MARK_FILL), yoksa eşit dilimler (read_marks).
+
+    Returns: read_marks ile aynı biçimde dict
+    """
+    n = 2 if z.get("zone_type") == "Doğru-Yanlış" else int(z.get("num_options", 5))
+    if image is None or image.size == 0 or z.get("zone_type") not in OMR_ZONE_TYPES or zone_bubbles(z, n) is None:
+        return read_marks(image, n, z.get("layout", "dikey"))
+    return PageOMR([dict(z, left=0, top=0, id=0)]).read(image)[0]
+
+def _mc_label(index):
+    """0 -> A, 25 -> Z, 26 -> AA (Tablo sütun adları gibi)."""
+    label = ""
+    index += 1
+    while index > 0:
+        index, rem = divmod(index - 1, len(MC_LABELS))
+        label = MC_LABELS[rem] + label
+    return label
+
+def option_labels(zone_type, num_options=5):
+    return TF_LABELS if zone_type == "Doğru-Yanlış" else [_mc_label(i) for i in range(num_options)]
+
+def decide_key(zone_type, num_options=5, layout="dikey", key_value="", key_img=None, zone=None):
+    """
+    Bölgenin doğru cevabı: Önce `key_value` (bölgenin "answer" alanı), yoksa
+    cevap anahtarı kırpımından güvenle okunan işaret. `zone` verilirse kırpım
+    öğrenci sayfasıyla aynı baloncuk geometrisiyle okunur (read_zone_marks).
+
+    Returns: (etiket veya "", kaynak: "answer" | "omr" | "")
+    """
+    if zone_type == "Doğru-Yanlış": num_options = 2
+    labels = option_labels(zone_type, num_options)
+    key_val = str(key_value or "").strip()
+    if key_val in labels:
+        return key_val, "answer"
+    if key_img is not None:
+        key = read_zone_marks(key_img, zone) if zone is not None else read_marks(key_img, num_options, layout)
+        if key["index"] >= 0 and not key["multi"] and key["margin"] >= OMR_MIN_MARGIN:
+            return labels[key["index"]], "omr"
+    return "", ""
+
+def local_comparison(student_img, zone_type, num_options=5, layout="dikey", key_value="", key_img=None, marks=None, zone=None):
+    """
+    Çoktan Seçmeli / Doğru-Yanlış bölgesini yerelde puanlar.
+
+    Anahtar önce `key_value` (bölgenin "answer" alanı, örn: "C" / "Doğru"),
+    yoksa cevap anahtarı kırpımından okunur. `marks` (PageOMR.read) verilirse
+    öğrenci kırpımı yeniden okunmaz. `zone` verilirse anahtar ve öğrenci
+    kırpımları bölgenin baloncuk geometrisiyle okunur.
+
+    Returns: (get_ai_comparison_result ile aynı biçimde dict, confident)
+        confident False ise (düşük marj, çoklu işaret, boş, anahtar okunamadı)
+        sonuç Gemini'ye sorulmalıdır.
+    """
+    if zone_type == "Doğru-Yanlış": num_options = 2
+    labels = option_labels(zone_type, num_options)
+    key_val, _ = decide_key(zone_type, num_options, layout, key_value, key_img, zone)
+
+    if marks is None:
+        marks = read_zone_marks(student_img, zone) if zone is not None else read_marks(student_img, num_options, layout)
+    student_val = labels[marks["index"]] if marks["index"] >= 0 else "BOŞ"
+    confident = bool(key_val) and marks["index"] >= 0 and not marks["multi"] and marks["margin"] >= OMR_MIN_MARGIN
+
+    if marks["multi"]:
+        reason = "Birden fazla işaret"
+    else:
+        reason = f"OMR: Anahtar {key_val or '?'}, Öğrenci {student_val} (marj {marks['margin']:.2f})"
+    return {
+        "match": confident and student_val == key_val,
+        "student_val": student_val,
+        "key_val": key_val or "?",
+        "reason": reason,
+        "margin": marks["margin"],
+        "multi": marks["multi"]
+    }, confident
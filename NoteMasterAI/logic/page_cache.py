@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+
+# --- SAYFA ÖNBELLEĞİ AYARLARI ---
+# Rasterleştirilmiş PDF sayfaları, PDF içeriğinin SHA-256 özeti ile adreslenen
+# ham .npy dosyaları olarak saklanır (Çözme maliyeti yok: np.load ~ disk okuma hızı).
+# Anahtar: (özet, sayfa, DPI, renk modu, arka uç). Arka uçlar (pdfium / poppler) kenar yumuşatma ve renk
+# dönüşümünde küçük farklar üretir; birbirlerinin sayfalarını kullanmazlar.
+# Boyut sınırı aşılınca en eski kullanılan silinir (LRU, mtime). Belge başına sayfa sayısı (.json) da
+# sınıra dahildir ve belgenin son sayfasıyla birlikte silinir.
+# Yalnızca tekrar tekrar çevrilen şablon / cevap anahtarı kaynakları içindir; öğrenci PDF'leri
+# (çok sayıda, genelde bir kez okunur) use_cache=False ile çevrilir, aksi halde şablonları tahliye ederler.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # NoteMasterAI/
+PAGE_CACHE_DIR = os.path.join(BASE_DIR, "cache", "pages")
+PAGE_CACHE_MAX_MB = 2048        # 300 DPI A4 RGB sayfa ~26 MB
+PAGE_CACHE_EVICT_RATIO = 0.9    # Tahliye, toplam boyut sınırın bu oranına inene kadar sürer
+
+def pdf_digest(pdf_bytes):
+    """PDF içeriğinin SHA-256 özeti (önbellek anahtarı)."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+class PageCache:
+    """
+    İçerik adresli, diskte tutulan rasterleştirilmiş sayfa önbelleği.
+
+    Kullanım:
+        cache = get_page_cache()
+        digest = pdf_digest(pdf_bytes)
+        img = cache.get(digest, 0, 300, "RGB", "pdfium")    # PIL Image veya None
+        cache.put(digest, 0, 300, "RGB", "pdfium", img)
+    """
+
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, max_mb=PAGE_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._size = None # Toplam .npy + .json boyutu (ilk yazmada taranır)
+
+    def _dir(self, digest):
+        return os.path.join(self.cache_dir, digest[:2])
+
+    def _path(self, digest, page, dpi, mode, renderer):
+        return os.path.join(self._dir(digest), f"{digest}_{int(page)}_{int(dpi)}_{mode}_{renderer}.npy")
+
+    def _count_path(self, digest):
+        return os.path.join(self._dir(digest), f"{digest}.json")
+
+    def get(self, digest, page, dpi, mode, renderer):
+        """Returns: PIL Image veya None (önbellekte yoksa / okunamazsa)"""
+        path = self._path(digest, page, dpi, mode, renderer)
+        try:
+            arr = np.load(path, allow_pickle=False)
+            os.utime(path) # LRU: son kullanım
+        except (OSError, ValueError):
+            return None
+        return Image.fromarray(arr)
+
+    def put(self, digest, page, dpi, mode, renderer, pil_img):
+        """Sayfayı yazar (atomik: geçici dosya + yeniden adlandırma). Disk hataları yutulur."""
+        path = self._path(digest, page, dpi, mode, renderer)
+        arr = np.asarray(pil_img.convert(mode))
+        tmp = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                np.save(f, arr, allow_pickle=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[PageCache] Sayfa önbelleğe yazılamadı: {e}")
+            if os.path.exists(tmp): os.remove(tmp)
+            return
+        self._added(path)
+
+    def _added(self, path):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                try:
+                    self._size += os.path.getsize(path)
+                except OSError:
+                    return
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def page_count(self, digest):
+        """Önbelleğe alınmış sayfa sayısı veya None (Poppler'a gerek kalmadan)."""
+        path = self._count_path(digest)
+        try:
+            with open(path, "r") as f:
+                pages = int(json.load(f)["pages"])
+            os.utime(path) # LRU: son kullanım
+            return pages
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set_page_count(self, digest, pages):
+        path = self._count_path(digest)
+        try:
+            os.makedirs(self._dir(digest), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump({"pages": int(pages)}, f)
+        except OSError as e:
+            print(f"[PageCache] Sayfa sayısı yazılamadı: {e}")
+            return
+        self._added(path)
+
+    def _entries(self):
+        """[(mtime, boyut, yol)] Tüm önbellek sayfaları ve sayfa sayısı dosyaları."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir(): continue
+            for entry in os.scandir(sub.path):
+                if not entry.name.endswith((".npy", ".json")): continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """
+        En eski kullanılan dosyaları sınırın PAGE_CACHE_EVICT_RATIO oranına inene kadar siler.
+        Son sayfası silinen belgenin sayfa sayısı dosyası da silinir.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * PAGE_CACHE_EVICT_RATIO
+        removed = 0
+        evicted_docs = set()
+        for _, size, path in entries:
+            if total <= target: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if path.endswith(".npy"):
+                removed += 1
+                evicted_docs.add(os.path.basename(path).split("_", 1)[0])
+
+        # Sayfası kalmayan belgelerin sayfa sayısı dosyaları
+        remaining_docs = {os.path.basename(path).split("_", 1)[0] for _, _, path in self._entries() if path.endswith(".npy")}
+        for digest in evicted_docs - remaining_docs:
+            path = self._count_path(digest)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+        if removed:
+            print(f"[PageCache] {removed} sayfa önbellekten çıkarıldı ({total / 1024 / 1024:.0f} MB kaldı).")
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_page_cache():
+    """Süreç genelinde paylaşılan önbellek."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = PageCache()
+        return _CACHE
@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+from logic import alignment
+
+# --- SAYFA EŞLEŞTİRME AYARLARI ---
+# Her öğrenci sayfası, tüm şablon sayfalarının kaba SIFT tanımlayıcılarından
+# oluşan tek bir FLANN indeksinde aranır; eşleşmeler sayfalara oy verir.
+PAGE_MATCH_DIM = 600        # Öğrenci sayfası bu boyuta küçültülür
+PAGE_MATCH_FEATURES = 800   # Öğrenci sayfası için SIFT bütçesi
+PAGE_MATCH_RATIO = 0.75     # Oran testi (Sayfalar arası ortak başlıklar elenir)
+PAGE_MATCH_MIN_VOTES = 30   # Bundan az oy alan sayfa "tanınmadı" sayılır
+PAGE_MATCH_MIN_SHARE = 0.5  # Aday şablon, sayfanın en iyi oyunun en az bu oranını almalı (gürültü oyları elenir)
+
+class PageMatcher:
+    """
+    Sıra dışı veya karışık taranmış öğrenci sayfalarını şablon sayfalarına eşler.
+
+    Kullanım:
+        matcher = PageMatcher(tmpl_cvs, template_features)
+        report = matcher.assign(stud_cvs)
+        report["assignment"]  # {öğrenci sayfası: şablon sayfası}
+    """
+
+    def __init__(self, template_images, template_features=None):
+        template_features = template_features or []
+        descs, labels = [], []
+        self.page_count = len(template_images)
+
+        for i, tmpl_cv in enumerate(template_images):
+            feats = template_features[i] if i < len(template_features) else None
+            coarse = feats.coarse if feats is not None else None
+            if coarse is None and tmpl_cv is not None:
+                coarse = alignment._compute_features(tmpl_cv, alignment.PYRAMID_COARSE_DIM,
+                                                     alignment.PYRAMID_COARSE_FEATURES)
+            if coarse is None: continue
+            descs.append(coarse.descriptors)
+            labels.append(np.full(len(coarse.descriptors), i, dtype=np.int32))
+
+        self.labels = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int32)
+        self.index = None
+        if len(self.labels) > 1:
+            self.index = cv2.flann_Index(np.float32(np.concatenate(descs)), alignment.FLANN_INDEX_PARAMS)
+
+    def votes(self, img_student):
+        """Returns: (page_count,) oy dizisi (Oran testinden geçen eşleşme sayısı)"""
+        votes = np.zeros(self.page_count, dtype=np.int32)
+        if self.index is None or img_student is None:
+            return votes
+        gray, _ = alignment._prepare_gray(img_student, PAGE_MATCH_DIM)
+        _, des = alignment._create_detector("SIFT", PAGE_MATCH_FEATURES).detectAndCompute(gray, None)
+        if des is None or len(des) < 2:
+            return votes
+
+        indices, dists = self.index.knnSearch(np.float32(des), 2, params=alignment.FLANN_SEARCH_PARAMS)
+        dists = np.sqrt(dists)
+        good = dists[:, 0] < PAGE_MATCH_RATIO * dists[:, 1]
+        np.add.at(votes, self.labels[indices[good, 0]], 1)
+        return votes
+
+    def assign(self, student_images):
+        """
+        Öğrenci sayfalarını şablon sayfalarına atar (en yüksek oydan başlayarak,
+        her şablon sayfası en fazla bir kez).
+
+        Returns: dict
+            assignment: {öğrenci sayfası: şablon sayfası}
+            votes: {öğrenci sayfası: oy dizisi (list)}
+            duplicates: [(öğrenci sayfası, şablon sayfası)] Zaten atanmış şablona en çok benzeyen sayfalar
+            unmatched: [öğrenci sayfası] Hiçbir şablona benzemeyen sayfalar
+            missing: [şablon sayfası] Hiçbir öğrenci sayfasıyla eşleşmeyenler
+        """
+        all_votes = {s_idx: self.votes(img) for s_idx, img in enumerate(student_images)}
+
+        candidates = []
+        for s_idx, v in all_votes.items():
+            floor = max(PAGE_MATCH_MIN_VOTES, PAGE_MATCH_MIN_SHARE * v.max()) if len(v) else PAGE_MATCH_MIN_VOTES
+            for t_idx in range(self.page_count):
+                if v[t_idx] >= floor:
+                    candidates.append((int(v[t_idx]), s_idx, t_idx))
+        candidates.sort(reverse=True)
+
+        assignment = {}
+        used = set()
+        for _, s_idx, t_idx in candidates:
+            if s_idx in assignment or t_idx in used: continue
+            assignment[s_idx] = t_idx
+            used.add(t_idx)
+
+        duplicates, unmatched = [], []
+        for s_idx, v in all_votes.items():
+            if s_idx in assignment: continue
+            best = int(np.argmax(v)) if self.page_count else -1
+            if best >= 0 and v[best] >= PAGE_MATCH_MIN_VOTES:
+                duplicates.append((s_idx, best))
+            else:
+                unmatched.append(s_idx)
+
+        # Tanınmayan sayfa, kendi sırasındaki şablon boşsa oraya konur (Eski davranış)
+        for s_idx in list(unmatched):
+            if s_idx < self.page_count and s_idx not in used:
+                assignment[s_idx] = s_idx
+                used.add(s_idx)
+                unmatched.remove(s_idx)
+
+        return {
+            "assignment": dict(sorted(assignment.items())),
+            "votes": {s_idx: v.tolist() for s_idx, v in all_votes.items()},
+            "duplicates": duplicates,
+            "unmatched": unmatched,
+            "missing": [t_idx for t_idx in range(self.page_count) if t_idx not in used]
+        }
@@ -0,0 +1,130 @@
+import shutil
+import threading
+import numpy as np
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# --- PDF RASTERLEŞTİRME ARKA UÇLARI ---
+# "pdfium": Süreç içi (pypdfium2), sayfayı doğrudan NumPy tamponuna çizer. Alt süreç / geçici dosya yok.
+# "poppler": pdf2image + pdftoppm (paketlenmiş poppler/ klasörü veya PATH'teki pdftoppm). Yedek.
+PDF_RENDERER = "auto"   # "auto" = pdfium varsa pdfium, yoksa poppler
+RENDERERS = ["pdfium", "poppler"]
+
+# PDFium iş parçacığı güvenli değildir: süreç içindeki tüm pypdfium2 çağrıları
+# (rasterleştirme + text_extraction) bu kilitle sıralanır
+PDFIUM_LOCK = threading.Lock()
+
+class Rasterizer:
+    """
+    PDF rasterleştirici arayüzü.
+
+    Kullanım:
+        r = get_rasterizer()
+        for p_idx, arr in r.iter_pages(pdf_bytes, [0, 2], dpi=300):
+            ...  # arr: (H, W, 3) RGB uint8 veya grayscale=True ise (H, W)
+    """
+    name = ""
+
+    def is_available(self):
+        raise NotImplementedError
+
+    def page_count(self, pdf_bytes):
+        raise NotImplementedError
+
+    def iter_pages(self, pdf_bytes, indices, dpi, grayscale=False):
+        """indices: Artan sıralı, belge içindeki 0 tabanlı sayfalar. Yields: (sayfa, ndarray)"""
+        raise NotImplementedError
+
+class PdfiumRasterizer(Rasterizer):
+    name = "pdfium"
+    _lock = PDFIUM_LOCK
+
+    def is_available(self):
+        return pdfium is not None
+
+    def page_count(self, pdf_bytes):
+        with self._lock:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+
+    def iter_pages(self, pdf_bytes, indices, dpi, grayscale=False):
+        # Belge sayfa başına değil, bir kez açılır; kilit yalnızca çizim sırasında tutulur
+        with self._lock:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            for p_idx in indices:
+                with self._lock:
+                    page = pdf[p_idx]
+                    try:
+                        bitmap = page.render(scale=dpi / 72.0, grayscale=grayscale, rev_byteorder=True)
+                        arr = bitmap.to_numpy()
+                        if arr.ndim == 3 and arr.shape[2] == 1:
+                            arr = arr[:, :, 0]
+                        elif arr.ndim == 3 and arr.shape[2] == 4:
+                            arr = arr[:, :, :3]
+                        # Bitmap tamponu kapanınca serbest kalır: sahipli, bitişik kopya
+                        arr = np.array(arr, copy=True, order="C")
+                        bitmap.close()
+                    finally:
+                        page.close()
+                yield p_idx, arr
+        finally:
+            with self._lock:
+                pdf.close()
+
+class PopplerRasterizer(Rasterizer):
+    name = "poppler"
+
+    def _poppler_path(self):
+        """Paketlenmiş poppler/ (Windows) veya PATH'teki pdftoppm (None). İkisi de yoksa hata."""
+        from logic.pdf_utils import check_poppler_bundled
+        exists, bin_dir = check_poppler_bundled()
+        if exists:
+            return bin_dir
+        if shutil.which("pdftoppm"):
+            return None
+        raise FileNotFoundError(f"Poppler bulunamadı: {bin_dir}")
+
+    def is_available(self):
+        try:
+            self._poppler_path()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def page_count(self, pdf_bytes):
+        from pdf2image import pdfinfo_from_bytes
+        return int(pdfinfo_from_bytes(pdf_bytes, poppler_path=self._poppler_path())["Pages"])
+
+    def iter_pages(self, pdf_bytes, indices, dpi, grayscale=False):
+        from pdf2image import convert_from_bytes
+        bin_dir = self._poppler_path()
+        for p_idx in indices:
+            images = convert_from_bytes(pdf_bytes, poppler_path=bin_dir, dpi=dpi, grayscale=grayscale,
+                                        first_page=p_idx + 1, last_page=p_idx + 1)
+            if not images: continue
+            yield p_idx, np.asarray(images[0].convert("L" if grayscale else "RGB"))
+
+_RASTERIZERS = {"pdfium": PdfiumRasterizer(), "poppler": PopplerRasterizer()}
+
+def get_rasterizer(name=None):
+    """
+    name: "pdfium" | "poppler" | "auto" | None (None = PDF_RENDERER)
+    "auto": Kullanılabilir ilk arka uç (RENDERERS sırasıyla).
+    """
+    name = name or PDF_RENDERER
+    if name != "auto":
+        rasterizer = _RASTERIZERS[name]
+        if not rasterizer.is_available():
+            raise RuntimeError(f"PDF arka ucu kullanılamıyor: {name}")
+        return rasterizer
+    for candidate in RENDERERS:
+        if _RASTERIZERS[candidate].is_available():
+            return _RASTERIZERS[candidate]
+    raise FileNotFoundError("PDF rasterleştirici bulunamadı: pypdfium2 kurun veya Poppler'ı yükleyin.")
@@ -2,8 +2,9 @@ import io
 import os
 import requests
 import zipfile
-import pdfplumber
-from pdf2image import convert_from_bytes, exceptions
+from PIL import Image
+from logic import page_cache, text_extraction
+from logic.pdf_render import get_rasterizer
 
 # Constants
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # NoteMasterAI/
@@ -96,28 +97,68 @@ def download_and_extract_poppler(download_url):
 
 def get_text_from_pdf(pdf_bytes):
     """
-    Bir PDF dosyasının baytlarını alır, pdfplumber ile okur
-    ve içindeki TÜM metni (doğal metin) döndürür.
+    Bir PDF dosyasının baytlarını alır ve içindeki TÜM metni (doğal metin) döndürür.
+    Sayfa metinleri önbellekli metin çıkarma servisinden gelir (bkz. logic/text_extraction.py).
     """
-    all_text = ""
     if not pdf_bytes:
         return ""
     try:
-        with io.BytesIO(pdf_bytes) as f:
-            with pdfplumber.open(f) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        all_text += f"--- SAYFA {i+1} ---\n{page_text}\n\n"
-        return all_text
+        pages = text_extraction.get_pdf_pages(pdf_bytes)
+        return "".join(f"--- SAYFA {rec['page']} ---\n{rec['text']}\n\n" for rec in pages if rec["text"])
     except Exception as e:
         print(f"PDF metni çıkarılırken hata: {e}")
         return None
 
-def pdf_to_images(pdf_bytes):
-    """Wrapper around pdf2image to use common settings."""
-    exists, bin_dir = check_poppler_bundled()
-    if not exists:
-         raise FileNotFoundError(f"Poppler bulunamadı: {bin_dir}")
-         
-    return convert_from_bytes(pdf_bytes, poppler_path=bin_dir, dpi=PDF_DPI)
+def pdf_page_count(pdf_bytes, renderer=None):
+    """PDF'in sayfa sayısı (sayfalar rasterleştirilmeden)."""
+    return get_rasterizer(renderer).page_count(pdf_bytes)
+
+def iter_pdf_images(pdf_bytes, pages=None, dpi=PDF_DPI, grayscale=False, use_cache=True, renderer=None):
+    """
+    PDF sayfalarını tek tek rasterleştirip üretir (generator).
+    Sayfalar seçilen arka uçla (bkz. logic/pdf_render.py) birer birer çizilir;
+    bellekte aynı anda yalnızca tüketicinin tuttuğu sayfalar bulunur.
+    Daha önce rasterleştirilmiş sayfalar sayfa önbelleğinden okunur (bkz. logic/page_cache.py);
+    tüm sayfalar önbellekteyse rasterleştirici hiç çalıştırılmaz.
+
+    pages: 0 tabanlı sayfa indeksleri (None = hepsi). Belge dışındakiler atlanır.
+    grayscale: True ise sayfalar 'L' modunda (RGB'nin 1/3'ü bellek) üretilir.
+    use_cache: False ise önbellek okunmaz/yazılmaz.
+    renderer: "pdfium" | "poppler" | "auto" (None = pdf_render.PDF_RENDERER)
+
+    Yields: (sayfa indeksi, PIL Image)
+    """
+    rasterizer = get_rasterizer(renderer) # Önbellek anahtarının parçası (arka uçlar piksel düzeyinde farklı)
+    cache = page_cache.get_page_cache() if use_cache else None
+    digest = page_cache.pdf_digest(pdf_bytes) if cache is not None else None
+    mode = "L" if grayscale else "RGB"
+
+    page_count = cache.page_count(digest) if cache is not None else None
+    if page_count is None:
+        page_count = rasterizer.page_count(pdf_bytes)
+        if cache is not None: cache.set_page_count(digest, page_count)
+
+    indices = range(page_count) if pages is None else sorted({int(p) for p in pages if 0 <= int(p) < page_count})
+    missing = []
+    for p_idx in indices:
+        img = cache.get(digest, p_idx, dpi, mode, rasterizer.name) if cache is not None else None
+        if img is None:
+            missing.append(p_idx)
+            continue
+        # Önbellekteki sayfa, önündeki eksik sayfalar çizilmeden verilmez (sıra korunur)
+        if missing:
+            yield from _render_pages(pdf_bytes, missing, dpi, grayscale, rasterizer, cache, digest, mode)
+            missing = []
+        yield p_idx, img
+    if missing:
+        yield from _render_pages(pdf_bytes, missing, dpi, grayscale, rasterizer, cache, digest, mode)
+
+def _render_pages(pdf_bytes, indices, dpi, grayscale, rasterizer, cache, digest, mode):
+    for p_idx, arr in rasterizer.iter_pages(pdf_bytes, indices, dpi, grayscale):
+        img = Image.fromarray(arr)
+        if cache is not None: cache.put(digest, p_idx, dpi, mode, rasterizer.name, img)
+        yield p_idx, img
+
+def pdf_to_images(pdf_bytes, pages=None, dpi=PDF_DPI, grayscale=False):
+    """All pages as a list with common settings (see iter_pdf_images)."""
+    return [img for _, img in iter_pdf_images(pdf_bytes, pages=pages, dpi=dpi, grayscale=grayscale)]
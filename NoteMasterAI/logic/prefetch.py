@@ -0,0 +1,154 @@
+import os
+import re
+import collections
+import threading
+import concurrent.futures
+import cv2
+import numpy as np
+from PIL import Image
+
+# --- ÖĞRENCİ ÖN YÜKLEME AYARLARI ---
+# Sıradaki öğrencilerin PDF'leri ayrı bir süreç havuzunda rasterleştirilir;
+# bu sırada mevcut öğrenciler hizalanır ve AI'a gönderilir.
+PREFETCH_MAX_WORKERS = 2    # Rasterleştirme süreçleri (Hizalama havuzu da çekirdekleri kullanır)
+PREFETCH_LOOKAHEAD = 4      # En fazla bu kadar öğrenci önceden yüklenir
+PREFETCH_MEMORY_MB = 1024   # Tüketilmemiş sayfalar (+ tahmini yoldakiler) için bellek bütçesi
+STUDENT_IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def _natural_key(s):
+    parts = re.split(r'(\d+)', s)
+    return [int(p) if p.isdigit() else p.lower() for p in parts]
+
+def load_unit_images(unit_path):
+    """
+    Bir öğrenci birimini (görüntü klasörü veya PDF) BGR sayfalara dönüştürür.
+    Sayfalar akış halinde çevrilir; tam bir PIL kopyası tutulmaz.
+
+    Returns: (stud_cvs, student_paths) student_paths: Sayfa başına kaynak dosya (PDF için boş)
+    """
+    stud_cvs = []
+    student_paths = []
+    if os.path.isdir(unit_path):
+        img_files = [f for f in os.listdir(unit_path) if f.lower().endswith(STUDENT_IMAGE_EXTS)]
+        img_files.sort(key=_natural_key)
+        for img_f in img_files:
+            try:
+                im = Image.open(os.path.join(unit_path, img_f)).convert("RGB")
+                stud_cvs.append(cv2.cvtColor(np.array(im), cv2.COLOR_RGB2BGR))
+                student_paths.append(os.path.join(unit_path, img_f))
+            except Exception:
+                pass
+    else:
+        from logic.pdf_utils import iter_pdf_images
+        with open(unit_path, "rb") as f:
+            pdf_bytes = f.read()
+        # Öğrenci sayfaları sayfa önbelleğine yazılmaz (şablon / anahtar sayfalarını tahliye etmesin)
+        for _, p_img in iter_pdf_images(pdf_bytes, use_cache=False):
+            if p_img.mode != 'RGB': p_img = p_img.convert('RGB')
+            stud_cvs.append(cv2.cvtColor(np.array(p_img), cv2.COLOR_RGB2BGR))
+    return stud_cvs, student_paths
+
+def _init_worker():
+    # Rasterleştirme süreçleri hizalama havuzuyla çekirdek paylaşır
+    cv2.setNumThreads(1)
+
+def _unit_bytes(unit):
+    return sum(img.nbytes for img in unit[0])
+
+class StudentPrefetcher:
+    """
+    Öğrenci birimlerini sırayla, önden yükleyerek verir.
+
+    En fazla `lookahead` öğrenci havuza gönderilir; tamamlanmış ama henüz
+    tüketilmemiş sayfalar ile yoldaki öğrencilerin tahmini boyutu
+    `memory_mb`'yi aşarsa yeni öğrenci gönderilmez (en az bir öğrenci her zaman yoldadır).
+    Havuz başlatılamazsa birimler tüketim anında aynı süreçte yüklenir.
+
+    Kullanım:
+        with StudentPrefetcher(file_paths) as prefetcher:
+            for unit_path, unit, error in prefetcher:
+                stud_cvs, student_paths = unit  # error varsa unit None
+    """
+
+    def __init__(self, unit_paths, lookahead=PREFETCH_LOOKAHEAD, memory_mb=PREFETCH_MEMORY_MB,
+                 max_workers=PREFETCH_MAX_WORKERS):
+        self.unit_paths = list(unit_paths)
+        self.lookahead = max(1, lookahead)
+        self.memory_budget = int(memory_mb * 1024 * 1024)
+        self._next = 0
+        self._inflight = collections.deque() # [(unit_path, Future)] gönderim sırasıyla
+        self._done_bytes = {} # {Future: bayt} Tamamlanmış, tüketilmemiş
+        self._lock = threading.Lock() # _done_bytes havuzun geri çağırma thread'inden de yazılır
+        self._avg_unit_bytes = 0
+        self._units_seen = 0
+        self.executor = None
+        try:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max(1, min(max_workers, self.lookahead)), initializer=_init_worker
+            )
+        except Exception as e:
+            print(f"[Prefetch] Süreç havuzu başlatılamadı, öğrenciler sırayla yüklenecek: {e}")
+
+    def _held_bytes(self):
+        with self._lock:
+            pending = sum(1 for _, fut in self._inflight if fut not in self._done_bytes)
+            return sum(self._done_bytes.values()) + pending * self._avg_unit_bytes
+
+    def _on_done(self, fut):
+        if not fut.cancelled() and fut.exception() is None:
+            with self._lock:
+                # Tüketici sonucu geri çağırmadan önce almış olabilir
+                if any(f is fut for _, f in self._inflight):
+                    self._done_bytes[fut] = _unit_bytes(fut.result())
+
+    def _fill(self):
+        while self._next < len(self.unit_paths) and len(self._inflight) < self.lookahead:
+            if self._inflight and self._held_bytes() + self._avg_unit_bytes > self.memory_budget:
+                break
+            unit_path = self.unit_paths[self._next]
+            self._next += 1
+            fut = self.executor.submit(load_unit_images, unit_path)
+            with self._lock:
+                self._inflight.append((unit_path, fut))
+            fut.add_done_callback(self._on_done)
+
+    def __iter__(self):
+        """Yields: (unit_path, (stud_cvs, student_paths) veya None, hata veya None) girdi sırasıyla"""
+        if self.executor is None:
+            for unit_path in self.unit_paths:
+                try:
+                    yield unit_path, load_unit_images(unit_path), None
+                except Exception as e:
+                    yield unit_path, None, e
+            return
+
+        self._fill()
+        while self._inflight:
+            with self._lock:
+                unit_path, fut = self._inflight.popleft()
+            try:
+                unit, error = fut.result(), None
+            except Exception as e:
+                unit, error = None, e
+            with self._lock:
+                self._done_bytes.pop(fut, None)
+            if unit is not None:
+                self._units_seen += 1
+                self._avg_unit_bytes += (_unit_bytes(unit) - self._avg_unit_bytes) // self._units_seen
+            del fut
+            # Bu öğrenci işlenirken sıradakiler rasterleştirilir
+            self._fill()
+            yield unit_path, unit, error
+            unit = None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self._inflight.clear()
+            self._done_bytes.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
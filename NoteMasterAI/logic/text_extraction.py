@@ -0,0 +1,147 @@
+import io
+import os
+import json
+import hashlib
+import threading
+import concurrent.futures
+
+from logic.pdf_render import pdfium, PDFIUM_LOCK
+
+# --- METİN ÇIKARMA AYARLARI ---
+# Ders notlarının sayfa metinleri bir kez çıkarılır ve PDF'in SHA-256 özetiyle
+# cache/text/<özet>.json altında saklanır. Çıkarıcı: pdfium (hızlı, süreç içi), yoksa pdfplumber.
+# Büyük belgelerde sayfa aralıkları süreç havuzunda paralel işlenir.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # NoteMasterAI/
+TEXT_CACHE_DIR = os.path.join(BASE_DIR, "cache", "text")
+TEXT_CACHE_VERSION = 1
+TEXT_MAX_WORKERS = 4            # Paralel çıkarma süreçleri
+TEXT_PARALLEL_MIN_PAGES = 16    # Bundan kısa belgeler tek süreçte işlenir (havuz başlatma maliyeti)
+
+def _page_record(page_no, text):
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    return {
+        "page": page_no,
+        "text": text,
+        "chars": len(text),
+        "alnum_chars": sum(ch.isalnum() for ch in text) # ~0 ise sayfa büyük olasılıkla yalnızca görsel
+    }
+
+def _extract_range_pdfium(pdf_bytes, start, stop):
+    # Rasterleştirme ile aynı kilit (PDFium iş parçacığı güvenli değil); sayfa başına alınır
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        records = []
+        for i in range(start, stop):
+            with PDFIUM_LOCK:
+                page = pdf[i]
+                textpage = page.get_textpage()
+                try:
+                    text = textpage.get_text_range()
+                finally:
+                    textpage.close()
+                    page.close()
+            records.append(_page_record(i + 1, text))
+        return records
+    finally:
+        with PDFIUM_LOCK:
+            pdf.close()
+
+def _extract_range_pdfplumber(pdf_bytes, start, stop):
+    import pdfplumber
+    with io.BytesIO(pdf_bytes) as f:
+        with pdfplumber.open(f) as pdf:
+            return [_page_record(i + 1, pdf.pages[i].extract_text()) for i in range(start, stop)]
+
+def _extract_range(extractor, pdf_bytes, start, stop):
+    if extractor == "pdfium":
+        return _extract_range_pdfium(pdf_bytes, start, stop)
+    return _extract_range_pdfplumber(pdf_bytes, start, stop)
+
+def _page_count(extractor, pdf_bytes):
+    if extractor == "pdfium":
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    import pdfplumber
+    with io.BytesIO(pdf_bytes) as f:
+        with pdfplumber.open(f) as pdf:
+            return len(pdf.pages)
+
+def default_extractor():
+    return "pdfium" if pdfium is not None else "pdfplumber"
+
+def extract_pages(pdf_bytes, extractor=None, max_workers=TEXT_MAX_WORKERS):
+    """
+    Önbelleğe bakmadan sayfa metinlerini çıkarır.
+
+    Returns: [{"page": 1 tabanlı sayfa no, "text", "chars", "alnum_chars"}]
+    """
+    extractor = extractor or default_extractor()
+    n_pages = _page_count(extractor, pdf_bytes)
+    workers = min(max_workers, os.cpu_count() or 1)
+    if n_pages < TEXT_PARALLEL_MIN_PAGES or workers <= 1:
+        return _extract_range(extractor, pdf_bytes, 0, n_pages)
+
+    # Süreç başına bir sayfa aralığı (belge her süreçte bir kez açılır)
+    bounds = [n_pages * k // workers for k in range(workers + 1)]
+    records = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futs = [pool.submit(_extract_range, extractor, pdf_bytes, bounds[k], bounds[k + 1])
+                    for k in range(workers) if bounds[k] < bounds[k + 1]]
+            for fut in futs:
+                records.extend(fut.result())
+    except Exception as e:
+        print(f"[Text] Paralel metin çıkarma başarısız, tek süreçte devam ediliyor: {e}")
+        records = _extract_range(extractor, pdf_bytes, 0, n_pages)
+    return records
+
+_MEMO = {}
+_MEMO_LOCK = threading.Lock()
+
+def get_pdf_pages(pdf_bytes, use_cache=True):
+    """
+    Sayfa kayıtları; PDF özetine göre süreç içinde ve diskte önbelleklenir.
+    Aynı ders notları yeniden yüklendiğinde PDF tekrar ayrıştırılmaz.
+
+    Returns: [{"page", "text", "chars", "alnum_chars"}]
+    """
+    if not pdf_bytes:
+        return []
+    if not use_cache:
+        return extract_pages(pdf_bytes)
+
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    with _MEMO_LOCK:
+        if digest in _MEMO:
+            return _MEMO[digest]
+
+    path = os.path.join(TEXT_CACHE_DIR, f"{digest}.json")
+    records = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == TEXT_CACHE_VERSION:
+            records = data["pages"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if records is None:
+        extractor = default_extractor()
+        records = extract_pages(pdf_bytes, extractor)
+        try:
+            os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": TEXT_CACHE_VERSION, "extractor": extractor, "pages": records}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[Text] Metin önbelleğe yazılamadı: {e}")
+
+    with _MEMO_LOCK:
+        _MEMO[digest] = records
+    return records
@@ -6,19 +6,129 @@ import base64
 import os
 import cv2
 import numpy as np
+import io
 import shutil
 import cgi
+import time
+import hashlib
+import collections
+from PIL import Image
 from logic import pdf_utils
-from logic.alignment import align_image
+from logic.alignment import (align_image, compute_template_features, template_fingerprint,
+                             fingerprints_match, validate_homography, _rotation_matrix, AlignmentResult)
 from PyQt5.QtCore import QObject, pyqtSignal
 
 # Global reference for the server to access
 CURRENT_REFERENCE_IMAGE = None
+CURRENT_REFERENCE_FEATURES = None
 SESSION_PDF_IMAGES = {} # 1-based index: cv2 image
+SESSION_PDF_FEATURES = {} # 1-based index: TemplateFeatures
 UPLOAD_DIR = "d:/Projects/NoteMaster/Scans"
 
-def set_reference_image(img):
-    global CURRENT_REFERENCE_IMAGE
+# /verify sırasında bulunan homografiler (görüntü sha256 -> kayıt). /save bunları yan dosyaya yazar.
+VERIFIED_ALIGNMENTS = collections.OrderedDict()
+VERIFIED_ALIGNMENTS_MAX = 256
+_VERIFIED_LOCK = threading.Lock()
+SIDECAR_SUFFIX = ".align.json"
+
+# EXIF Orientation -> cv2.imdecode'un uyguladığı döndürme (aynalı değerler desteklenmez)
+_EXIF_ROTATIONS = {1: 0, 3: 180, 6: 90, 8: -90}
+
+def _exif_rotation(file_data):
+    """Ham JPEG piksellerinden cv2.imdecode çıktısına giden 90° döndürme (None = desteklenmez)."""
+    try:
+        orientation = Image.open(io.BytesIO(file_data)).getexif().get(0x0112, 1)
+    except Exception:
+        orientation = 1
+    return _EXIF_ROTATIONS.get(orientation)
+
+def remember_alignment(file_data, img, ref_img, result):
+    """
+    /verify hizalamasını saklar. Homografi, ham (EXIF uygulanmamış) piksel
+    koordinatlarına çevrilir; notlandırma görüntüyü PIL ile ham yükler.
+    """
+    angle = _exif_rotation(file_data)
+    if angle is None: return
+    h, w = img.shape[:2]
+    if angle in (90, -90):
+        h, w = w, h # Ham görüntü boyutu
+    H_raw = result.homography @ _rotation_matrix(angle, w, h)
+
+    record = {
+        "image_sha256": hashlib.sha256(file_data).hexdigest(),
+        "image_shape": [h, w],
+        "template": template_fingerprint(ref_img),
+        "method": result.method,
+        "homography": H_raw.tolist(),
+        # Notlandırmada kaydedilen hizalama istatistikleri için (şablon pikselinde, döndürmeden bağımsız)
+        "inliers": result.inliers,
+        "matches": result.matches,
+        "reproj_error": result.reproj_error
+    }
+    with _VERIFIED_LOCK:
+        VERIFIED_ALIGNMENTS[record["image_sha256"]] = record
+        VERIFIED_ALIGNMENTS.move_to_end(record["image_sha256"])
+        while len(VERIFIED_ALIGNMENTS) > VERIFIED_ALIGNMENTS_MAX:
+            VERIFIED_ALIGNMENTS.popitem(last=False)
+
+def write_alignment_sidecar(file_path, file_data):
+    """Bu görüntü /verify'da hizalandıysa `<file_path>.align.json` yazar."""
+    with _VERIFIED_LOCK:
+        record = VERIFIED_ALIGNMENTS.get(hashlib.sha256(file_data).hexdigest())
+    if record is None: return False
+    with open(file_path + SIDECAR_SUFFIX, "w") as f:
+        json.dump(record, f)
+    return True
+
+def load_alignment_sidecar(image_path, image_shape, tmpl_cv, tmpl_fp=None):
+    """
+    Kayıtlı /verify homografisini doğrular ve döndürür.
+    Dosya içeriği (sha256), görüntü boyutu ve şablon parmak izi eşleşmeli,
+    homografi de geçerli olmalı; aksi halde None.
+
+    Returns: AlignmentResult (method="VERIFIED", homografi ham piksel koordinatlarında,
+             /verify'daki iç nokta / hata istatistikleriyle) veya None
+    """
+    if not image_path: return None
+    t0 = time.perf_counter()
+    sidecar = image_path + SIDECAR_SUFFIX
+    if not os.path.exists(sidecar): return None
+    try:
+        with open(sidecar, "r") as f:
+            record = json.load(f)
+        with open(image_path, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != record["image_sha256"]:
+                return None
+        if list(record["image_shape"]) != list(image_shape[:2]):
+            return None
+        if not fingerprints_match(record["template"], tmpl_fp or template_fingerprint(tmpl_cv)):
+            return None
+        H = np.array(record["homography"], dtype=np.float64).reshape(3, 3)
+    except Exception as e:
+        print(f"[Align Sidecar] Okunamadı ({sidecar}): {e}")
+        return None
+
+    h_t, w_t = tmpl_cv.shape[:2]
+    if not validate_homography(H, image_shape[0], image_shape[1], h_t, w_t):
+        return None
+
+    result = AlignmentResult()
+    result.homography = H
+    result.method = "VERIFIED"
+    # Döndürme bilgisi (sadece rapor için): H'nin dönme bileşeni 90'ın katına yuvarlanır
+    angle = int(round(np.degrees(np.arctan2(-H[0, 1], H[0, 0])) / 90.0)) * 90
+    result.angle = 180 if angle == -180 else angle
+    result.inliers = int(record.get("inliers") or 0)
+    result.matches = int(record.get("matches") or 0)
+    result.reproj_error = record.get("reproj_error")
+    result.count("pages")
+    result.count("verified_hits")
+    result.add_time("sidecar", t0)
+    return result
+
+def set_reference_image(img, features=None):
+    """features: Bu görüntü için önceden hesaplanmış TemplateFeatures (Verilmezse burada hesaplanır)."""
+    global CURRENT_REFERENCE_IMAGE, CURRENT_REFERENCE_FEATURES
     # Check if PIL Image
     if hasattr(img, 'save'): 
         # Convert PIL to OpenCV (RGB -> BGR)
@@ -26,6 +136,10 @@ def set_reference_image(img):
         CURRENT_REFERENCE_IMAGE = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
     else:
         CURRENT_REFERENCE_IMAGE = img
+    # Template side is the same for every scan, compute it once
+    CURRENT_REFERENCE_FEATURES = None
+    if CURRENT_REFERENCE_IMAGE is not None:
+        CURRENT_REFERENCE_FEATURES = features if features is not None else compute_template_features(CURRENT_REFERENCE_IMAGE)
 
 class ServerSignals(QObject):
     log = pyqtSignal(str)
@@ -55,19 +169,21 @@ class MobileRequestHandler(http.server.BaseHTTPRequestHandler):
             if 'pdf' in fields:
                 pdf_bytes = fields['pdf'][0]
                 try:
-                    images = pdf_utils.pdf_to_images(pdf_bytes)
-                    
                     global SESSION_PDF_IMAGES
                     SESSION_PDF_IMAGES.clear()
+                    SESSION_PDF_FEATURES.clear()
                     
-                    for i, pil_img in enumerate(images):
+                    # Streamed: each page is converted and its features computed before the next is rasterised
+                    for i, pil_img in pdf_utils.iter_pdf_images(pdf_bytes):
                         # Convert PIL RGB to CV2 BGR
-                        cv_img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+                        cv_img = cv2.cvtColor(np.array(pil_img.convert('RGB')), cv2.COLOR_RGB2BGR)
+                        del pil_img
                         SESSION_PDF_IMAGES[i+1] = cv_img
+                        SESSION_PDF_FEATURES[i+1] = compute_template_features(cv_img)
                         
-                    print(f"DEBUG: Session PDF Loaded. {len(images)} pages.")
+                    print(f"DEBUG: Session PDF Loaded. {len(SESSION_PDF_IMAGES)} pages.")
                     if hasattr(self.server, 'signals'):
-                        self.server.signals.log.emit(f"Mobil PDF Yüklendi: {len(images)} sayfa")
+                        self.server.signals.log.emit(f"Mobil PDF Yüklendi: {len(SESSION_PDF_IMAGES)} sayfa")
                         
                     self.send_response(200)
                     self.end_headers()
@@ -121,10 +237,12 @@ class MobileRequestHandler(http.server.BaseHTTPRequestHandler):
                 
             # Get Reference from Session if available
             ref_img = SESSION_PDF_IMAGES.get(page_num)
+            ref_feats = SESSION_PDF_FEATURES.get(page_num)
             
             # Fallback to Global Single Ref
             if ref_img is None:
                 ref_img = CURRENT_REFERENCE_IMAGE
+                ref_feats = CURRENT_REFERENCE_FEATURES
             
             status = "raw"
             preview_b64 = ""
@@ -133,9 +251,13 @@ class MobileRequestHandler(http.server.BaseHTTPRequestHandler):
             # Perform Alignment
             if ref_img is not None:
                 try:
-                    aligned = align_image(ref_img, img)
-                    if aligned is not None:
+                    result = align_image(ref_img, img, template_features=ref_feats)
+                    print(f"[Verify] Sayfa {page_num}: {result}")
+                    if result.ok:
+                        aligned = result.image
                         status = "aligned"
+                        # Notlandırmada tekrar hizalamamak için sakla
+                        remember_alignment(file_data, img, ref_img, result)
                         # Resize for preview (max 500px)
                         h, w = aligned.shape[:2]
                         scale = 500 / max(h, w)
@@ -197,6 +319,13 @@ class MobileRequestHandler(http.server.BaseHTTPRequestHandler):
                 with open(file_path, 'wb') as f:
                     f.write(file_data)
                 
+                # 1b. Verified alignment sidecar (reused by grading)
+                try:
+                    if write_alignment_sidecar(file_path, file_data):
+                        print(f"[Save] Hizalama yan dosyası yazıldı: {file_path}{SIDECAR_SUFFIX}")
+                except Exception as e:
+                    print(f"Sidecar Save Error: {e}")
+                
                 # 2. Save Reference (if provided) - For debugging/comparison
                 if 'reference' in fields:
                     try:
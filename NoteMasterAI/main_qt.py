@@ -1,5 +1,7 @@
 import sys
 import os
+import logging
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from ui.main_window import MainWindow
 
@@ -7,6 +9,9 @@ def main():
     # High DPI scaling
     os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
     
+    # logic/ modülleri (alignment vb.) logging kullanır, konsola yaz
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     app = QApplication(sys.argv)
     
     # Modern font
@@ -26,4 +31,6 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # Needed for the alignment process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     main()
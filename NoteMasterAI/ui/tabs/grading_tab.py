@@ -1,19 +1,25 @@
 import os
 import io
+import shutil
 import cv2
 import numpy as np
 import json
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
                              QFileDialog, QProgressBar, QTableWidget, QTableWidgetItem, 
                              QHeaderView, QMessageBox, QInputDialog, QLineEdit, QComboBox, 
-                             QFrame, QTextEdit, QSplitter, QScrollArea)
+                             QFrame, QTextEdit, QSplitter, QScrollArea, QCheckBox)
 from PyQt5.QtGui import QImage, QPixmap
 from PIL import Image
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSettings, QFileSystemWatcher
 
-from logic import alignment, omr, grading
-from logic.pdf_utils import pdf_to_images, get_text_from_pdf
+from logic import alignment, omr, grading, ai_cache
+from logic.pdf_utils import iter_pdf_images
+from logic.notes_index import NotesIndex
+from logic.prefetch import StudentPrefetcher, PREFETCH_MEMORY_MB
 from logic.model_manager import ModelManager
+from logic.align_engine import AlignmentEngine, ENGINE_LOOKAHEAD
+from logic.page_matching import PageMatcher
+from logic.model_router import ModelRouter
 from logic.utils import preprocess_image_for_ocr
 from logic import database
 import logic.transfer_server as transfer_server
@@ -29,17 +35,22 @@ class GradingWorker(QThread):
     finished_all = pyqtSignal()
     log_signal = pyqtSignal(str)
 
-    def __init__(self, file_paths, api_key, service_account_path, teacher_prompt=""):
+    def __init__(self, file_paths, api_key, service_account_path, teacher_prompt="", auto_route=False,
+                 local_omr=True, use_ai_cache=True):
         super().__init__()
         self.file_paths = file_paths
         self.api_key = api_key
         self.service_account_path = service_account_path
         self.teacher_prompt = teacher_prompt
+        self.auto_route = auto_route # Mixed batch: pick the exam model per student
+        self.local_omr = local_omr # MC/TF zones read locally first, Gemini only when ambiguous
+        self.use_ai_cache = use_ai_cache # Identical Gemini requests answered from the local response cache
         self.state = GlobalState()
         self.is_running = True
 
     def run(self):
         import concurrent.futures
+        import collections
         import functools
         import threading
         
@@ -50,24 +61,15 @@ class GradingWorker(QThread):
             return
 
         # 2. Parse Context & Answer Key
-        context_text = ""
+        # Lecture notes: BM25 index over page chunks; each zone gets only its relevant passages
+        notes_index = None
+        notes_context = {} # {(model, zone_id): [DERS NOTLARI] text}, same for every student
         if self.state.pdf_ders_notlari:
-            context_text = get_text_from_pdf(self.state.pdf_ders_notlari)
-        
-        ideal_texts = {} 
-        if self.state.zones:
-            for p_idx, page_zones in self.state.zones.items():
-                for z in page_zones:
-                    z_id = z.get('id', 'Unknown')
-                    ideal_texts[z_id] = z.get("answer", "")
-
-        answer_key_images = []
-        if self.state.pdf_cevap_anahtari:
             try:
-                answer_key_images = pdf_to_images(self.state.pdf_cevap_anahtari)
+                notes_index = NotesIndex.from_pdf(self.state.pdf_ders_notlari)
             except Exception as e:
-                print(f"ERROR: Failed to parse Answer Key images: {e}")
-
+                print(f"[Grading] Ders notları okunamadı: {e}")
+        
         # Database Setup
         if len(self.file_paths) > 0:
             first_path = self.file_paths[0].rstrip(os.sep) 
@@ -85,16 +87,144 @@ class GradingWorker(QThread):
         
         database.init_db(self.db_path)
 
+        ai_stats_start = None
+        if self.use_ai_cache:
+            try:
+                ai_stats_start = ai_cache.get_ai_cache().stats()
+            except Exception as e:
+                print(f"[Grading] AI önbelleği açılamadı, istekler doğrudan gönderilecek: {e}")
+        
         # Thread Pool (Max 5 workers for AI)
         executor = concurrent.futures.ThreadPoolExecutor(max_workers=5) 
         
-        # Semaphore for memory heavy ops (Loading/Aligning)
-        # Allow 2 students to align in parallel (CPU bound but memory heavy)
-        align_sem = threading.Semaphore(2) 
+        # --- MODEL CONTEXTS ---
+        # Per-exam templates, zones and answer key. A normal run uses the model selected
+        # in the UI; a mixed batch loads every saved model and routes each student.
+        def make_context(name, pil_pages, zones, template_features, key_bytes=None, key_pdf_path=None):
+            # Template pages (BGR) are converted once per run
+            tmpl_cvs = [cv2.cvtColor(np.array(p.convert('RGB')), cv2.COLOR_RGB2BGR) for p in pil_pages]
+            ideal_texts = {}
+            for p_idx, page_zones in (zones or {}).items():
+                for z in page_zones:
+                    z_id = z.get('id', 'Unknown')
+                    ideal_texts[z_id] = z.get("answer", "")
+            ctx = {
+                "name": name,
+                "zones": zones or {},
+                "template_features": template_features or [],
+                "tmpl_cvs": tmpl_cvs,
+                # Fingerprints to validate alignments saved by the mobile /verify flow
+                "tmpl_fps": [alignment.template_fingerprint(t) for t in tmpl_cvs],
+                "ideal_texts": ideal_texts,
+                "key_bytes": key_bytes,
+                "key_pdf_path": key_pdf_path,
+                "answer_key_images": {}, # {page: PIL}, each key page rasterised on first use
+                "page_omr": {}, # {page: omr.PageOMR}, built on first use
+                "compiled_key": None, # {zone_id: {"key_value", "crop", ...}}, loaded/compiled on first use
+                "key_crop_files": {}, # {zone_id: (crop file in crops_dir, key crop BGR)}
+                "matcher": None
+            }
+            # Page Matcher: maps out-of-order / mixed student pages to template pages
+            if len(tmpl_cvs) > 1:
+                try:
+                    ctx["matcher"] = PageMatcher(tmpl_cvs, ctx["template_features"])
+                except Exception as e:
+                    print(f"[Grading] Sayfa eşleştirici kurulamadı, sıra esas alınacak: {e}")
+            return ctx
+
+        def get_key_bytes(ctx):
+            if ctx["key_bytes"] is None and ctx["key_pdf_path"] and os.path.exists(ctx["key_pdf_path"]):
+                with open(ctx["key_pdf_path"], "rb") as f:
+                    ctx["key_bytes"] = f.read()
+            return ctx["key_bytes"]
+
+        def get_answer_key_image(ctx, p_idx):
+            """Answer key page p_idx (PIL) or None; only the requested page is rasterised."""
+            if p_idx not in ctx["answer_key_images"]:
+                ctx["answer_key_images"][p_idx] = None
+                try:
+                    key_bytes = get_key_bytes(ctx)
+                    if key_bytes:
+                        for _, k_img in iter_pdf_images(key_bytes, pages=[p_idx]):
+                            ctx["answer_key_images"][p_idx] = k_img
+                except Exception as e:
+                    print(f"ERROR: Failed to parse Answer Key images: {e}")
+            return ctx["answer_key_images"][p_idx]
+
+        def get_compiled_key(ctx):
+            """Compiled answer key of the model; compiled here if missing/stale or if some key was never tried with AI."""
+            if ctx["compiled_key"] is None:
+                ctx["compiled_key"] = {}
+                if ctx["name"]:
+                    try:
+                        manager = ModelManager()
+                        key_bytes = get_key_bytes(ctx)
+                        compiled = manager.load_compiled_key(ctx["name"], ctx["zones"], key_bytes)
+                        if compiled is None or any(not e["key_value"] and e["crop"] and not e.get("ai_tried")
+                                                   for e in compiled["zones"].values()):
+                            compiled = manager.compile_key(ctx["name"], ctx["zones"], key_bytes,
+                                                           read_key_ai=lambda pil, zt: grading.read_key_answer(gemini_model, pil, zt,
+                                                                                                                   use_cache=self.use_ai_cache))
+                        ctx["compiled_key"] = compiled["zones"]
+                    except Exception as e:
+                        print(f"[Grading] Cevap anahtarı derlenemedi, anahtar her öğrencide okunacak: {e}")
+            return ctx["compiled_key"]
+
+        def get_compiled_key_crop(ctx, z_id, entry):
+            """Key crop of a compiled zone: copied into crops_dir once per run (shared by all students)."""
+            if z_id not in ctx["key_crop_files"]:
+                ctx["key_crop_files"][z_id] = ("", None)
+                src = os.path.join(ModelManager().models_dir, ctx["name"], "key_crops", entry["crop"])
+                if entry["crop"] and os.path.exists(src):
+                    k_crop_name = f"KEY_{ctx['name']}_{entry['crop']}".replace(" ", "_").replace("/", "-")
+                    shutil.copyfile(src, os.path.join(self.crops_dir, k_crop_name))
+                    ctx["key_crop_files"][z_id] = (k_crop_name, cv2.imread(src))
+            return ctx["key_crop_files"][z_id]
+
+        contexts = {}
+        router = None
+        if self.auto_route:
+            manager = ModelManager()
+            router = ModelRouter(manager)
+            for name in router.model_names:
+                loaded = manager.load_model(name)
+                if not loaded: continue
+                config, images = loaded
+                raw_zones = config.get("zones", {})
+                contexts[name] = make_context(name, images, {int(k): v for k, v in raw_zones.items()},
+                                              manager.load_template_features(name, images, raw_zones),
+                                              key_pdf_path=os.path.join(manager.models_dir, name, "key.pdf"))
+            # Close-call routing votes on the templates already loaded here (no second load)
+            router.set_templates({name: (ctx["tmpl_cvs"], ctx["template_features"]) for name, ctx in contexts.items()})
+            print(f"[Grading] Karışık sınav modu: {len(contexts)} model yüklendi.")
+        else:
+            contexts[None] = make_context(self.state.model_name, self.state.pdf_images, self.state.zones,
+                                          self.state.template_features, key_bytes=self.state.pdf_cevap_anahtari)
+
+        # Alignment Engine: process pool sized to the cores, templates of every context published once
+        # via shared memory (key: (context, page)).
+        # Students are loaded and submitted up to 'lookahead' ahead of the one being graded,
+        # bounded by a fixed count and by the size of their pages (not by the core count).
+        engine = None
+        engine_templates, engine_features = {}, {}
+        for ctx_key, ctx in contexts.items():
+            for p_idx, tmpl_cv in enumerate(ctx["tmpl_cvs"]):
+                engine_templates[(ctx_key, p_idx)] = tmpl_cv
+                if p_idx < len(ctx["template_features"]):
+                    engine_features[(ctx_key, p_idx)] = ctx["template_features"][p_idx]
+        if engine_templates:
+            try:
+                engine = AlignmentEngine(engine_templates, engine_features)
+            except Exception as e:
+                print(f"[Grading] Hizalama motoru başlatılamadı, tek süreçte devam ediliyor: {e}")
+        lookahead = min(engine.max_workers, ENGINE_LOOKAHEAD) if engine else 1
+        pending_budget = PREFETCH_MEMORY_MB * 1024 * 1024
 
         # Progress Tracker: {unit_name: {'total': N, 'done': 0, 'buffer': [], 'details': {}}}
         prog_tracker = {}
         tracker_lock = threading.Lock()
+        omr_stats = collections.Counter() # local / ai
+        align_stats = collections.Counter() # AlignmentResult.stats toplamı (havuzdan dönen sonuçlar dahil)
 
         # --- CALLBACK HELPER ---
         def task_done_callback(fut, meta, u_name, db_pth, s_db_id):
@@ -151,9 +281,7 @@ class GradingWorker(QThread):
                         score = score_coeff * max_pts
                         reason = res_data.get("gerekce", "")
                         val_s = res_data.get("okunan_cevap", "")
-                        z_struct = meta.get("z", {})
-                        z_id = z_struct.get("id", "Unknown")
-                        val_c = ideal_texts.get(z_id, "")
+                        val_c = meta.get("ideal_text", "")
                     
                     final_res = {
                         "sys_meta": meta,
@@ -237,231 +365,360 @@ class GradingWorker(QThread):
                 if u_name in prog_tracker:
                     del prog_tracker[u_name] # Cleanup
 
-        # --- MAIN LOOP ---
-        for idx, unit_path in enumerate(self.file_paths):
-            if not self.is_running: break
+        def load_student(unit_path, unit_name, unit):
+            """Takes the student's prefetched pages (BGR), creates the DB record and submits alignment."""
+            self.student_progress.emit(unit_name, "Görüntüler İşleniyor...", 5)
             
-            unit_name = os.path.basename(unit_path)
+            stud_cvs, student_paths = unit if unit is not None else ([], []) # student_paths: source file per page (empty for PDFs)
+            if not stud_cvs:
+                self.error_occurred.emit(f"{unit_name}: Görüntü yüklenemedi")
+                return None
             
-            # Initial UI Update
-            self.student_progress.emit(unit_name, "Hazırlanıyor...", 0)
+            # Route -> Exam Model (mixed batch only)
+            if router is not None:
+                model_name, route = router.classify_student(stud_cvs)
+                ctx = contexts.get(model_name)
+                if ctx is None:
+                    self.student_progress.emit(unit_name, "Sınav Modeli Bulunamadı", 100)
+                    return None
+                print(f"[Grading] {unit_name} -> {model_name} ({route['method']})")
+            else:
+                ctx = contexts[None]
             
-            align_sem.acquire() # Block if too many active loading
+            student_db_id = database.save_student_header(self.db_path, unit_name, unit_path, 
+                                                         model_name=ctx["name"] or "")
             
-            try:
-                self.student_progress.emit(unit_name, "Görüntüler İşleniyor...", 5)
+            # Match Pages -> Template Pages (student page order is not trusted)
+            matcher = ctx["matcher"]
+            if matcher is not None:
+                report = matcher.assign(stud_cvs)
+                page_map = report["assignment"]
+                if any(s_idx != t_idx for s_idx, t_idx in page_map.items()):
+                    print(f"[Grading] {unit_name}: Sayfa sırası düzeltildi {page_map}")
+                problems = []
+                if report["missing"]:
+                    problems.append("Eksik sayfa: " + ", ".join(str(t + 1) for t in report["missing"]))
+                if report["duplicates"]:
+                    problems.append("Tekrarlanan sayfa: " + ", ".join(f"{s + 1}->{t + 1}" for s, t in report["duplicates"]))
+                if report["unmatched"]:
+                    problems.append("Tanınmayan sayfa: " + ", ".join(str(s + 1) for s in report["unmatched"]))
+                if problems:
+                    print(f"[Grading] {unit_name}: {' | '.join(problems)}")
+                    self.student_progress.emit(unit_name, " | ".join(problems), 5)
+            else:
+                page_map = {s_idx: s_idx for s_idx in range(len(stud_cvs))}
+            
+            # (template page, student image), in template order
+            pages = sorted(((t_idx, stud_cvs[s_idx], s_idx) for s_idx, t_idx in page_map.items()), key=lambda p: p[0])
+            
+            # Calculate Total Tasks (Zones)
+            total_tasks = 0
+            for p_idx, _, _ in pages:
+                 total_tasks += len([z for z in ctx["zones"].get(p_idx, []) if z.get("zone_type") != "Tanımsız"])
+            
+            if total_tasks == 0:
+                 self.student_progress.emit(unit_name, "Soru Bulunamadı", 100)
+                 return None
+
+            # Initialize Tracker
+            with tracker_lock:
+                prog_tracker[unit_name] = {
+                    'total': total_tasks,
+                    'done': 0,
+                    'buffer': [],
+                    'details': {"name": "", "number": "", "class": ""}
+                }
+
+            tmpl_cvs = ctx["tmpl_cvs"]
+            align_futs = {}
+            engine_items = []
+            for p_idx, stud_cv, s_idx in pages:
+                # Pages verified live on the phone carry their homography in a sidecar
+                if p_idx < len(tmpl_cvs) and s_idx < len(student_paths):
+                    a_res = transfer_server.load_alignment_sidecar(student_paths[s_idx], stud_cv.shape, 
+                                                                   tmpl_cvs[p_idx], ctx["tmpl_fps"][p_idx])
+                    if a_res is not None:
+                        done = concurrent.futures.Future()
+                        done.set_result(a_res)
+                        align_futs[p_idx] = done
+                        continue
                 
-                # Load Images
-                student_images = []
-                if os.path.isdir(unit_path):
-                    valid_exts = ('.jpg', '.jpeg', '.png', '.bmp')
-                    img_files = [f for f in os.listdir(unit_path) if f.lower().endswith(valid_exts)]
-                    def sort_key(s):
-                        import re
-                        parts = re.split(r'(\d+)', s)
-                        return [int(p) if p.isdigit() else p.lower() for p in parts]
-                    img_files.sort(key=sort_key)
-                    for img_f in img_files:
-                        try:
-                            im = Image.open(os.path.join(unit_path, img_f)).convert("RGB")
-                            student_images.append(im)
-                        except: pass
-                else:
-                    with open(unit_path, "rb") as f:
-                        student_images = pdf_to_images(f.read())
-                        
-                if not student_images:
-                    self.error_occurred.emit(f"{unit_name}: Görüntü yüklenemedi")
-                    continue
+                engine_key = (ctx["name"] if router is not None else None, p_idx)
+                if engine is not None and engine.has_template(engine_key):
+                    engine_items.append((engine_key, stud_cv))
+            
+            # First page aligned cold, the rest warm-started from its result
+            if engine_items:
+                for (engine_key, _), fut in zip(engine_items, engine.submit_student(engine_items)):
+                    align_futs[engine_key[1]] = fut
+            return ctx, unit_name, student_db_id, [(p_idx, stud_cv) for p_idx, stud_cv, _ in pages], align_futs
 
-                student_db_id = database.save_student_header(self.db_path, unit_name, unit_path)
+        def grade_student(ctx, unit_name, student_db_id, pages, align_futs):
+            tmpl_cvs = ctx["tmpl_cvs"]
+            # --- PROCESS PAGES ---
+            # pages: [(template page index, student image BGR)]
+            prior = None # Previous page's alignment (warm start for the single-process path)
+            for p_idx, stud_cv in pages:
+                if not self.is_running: break
                 
-                # Calculate Total Tasks (Zones)
-                total_tasks = 0
-                for p_idx in range(len(student_images)):
-                     total_tasks += len([z for z in self.state.zones.get(p_idx, []) if z.get("zone_type") != "Tanımsız"])
+                self.student_progress.emit(unit_name, f"Sayfa {p_idx+1} Hizalanıyor...", 10)
                 
-                if total_tasks == 0:
-                     self.student_progress.emit(unit_name, "Soru Bulunamadı", 100)
-                     continue
+                # Alignment
+                tmpl_cv = tmpl_cvs[p_idx] if p_idx < len(tmpl_cvs) else None
+                if tmpl_cv is not None:
+                    a_res = None
+                    fut = align_futs.get(p_idx)
+                    if fut is not None:
+                        try:
+                            a_res = fut.result()
+                        except Exception as e:
+                            print(f"[Grading] Hizalama motoru hatası ({e}), tek süreçte hizalanıyor.")
+                    if a_res is None:
+                        tmpl_feats = ctx["template_features"][p_idx] if p_idx < len(ctx["template_features"]) else None
+                        a_res = alignment.find_homography(tmpl_cv, stud_cv, template_features=tmpl_feats, prior=prior)
+                    if a_res.ok:
+                        prior = a_res
+                    align_stats.update(a_res.stats)
 
-                # Initialize Tracker
-                with tracker_lock:
-                    prog_tracker[unit_name] = {
-                        'total': total_tasks,
-                        'done': 0,
-                        'buffer': [],
-                        'details': {"name": "", "number": "", "class": ""}
-                    }
+                    print(f"[Grading] {unit_name} Sayfa {p_idx+1}: {a_res}")
+                    try:
+                        database.save_alignment_result(self.db_path, student_db_id, p_idx, a_res.to_dict())
+                    except Exception as e:
+                        print(f"[Grading] Hizalama kaydı yazılamadı: {e}")
 
-                # --- WAIT FOR TASKS ---
-                # REMOVED blocking 'wait' to allow parallel students.
-                # Completion is handled via callbacks and prog_tracker.
-                # --- PROCESS PAGES ---
-                for p_idx, p_img in enumerate(student_images):
-                    if not self.is_running: break
+                    # Only zone ROIs are warped (lazily), not the whole page
+                    if a_res.ok:
+                        page_view = alignment.AlignedPageView(a_res.homography, stud_cv, tmpl_cv.shape)
+                    else:
+                        # Fallback: Assume it IS aligned (from Server) but needs resizing to match Template
+                        print(f"[Grading] Alignment failed for {unit_name}, assuming pre-aligned. Resizing to template.")
+                        page_view = alignment.AlignedPageView.resized(stud_cv, tmpl_cv.shape)
+                else:
+                    page_view = alignment.AlignedPageView(np.eye(3), stud_cv, stud_cv.shape)
+                
+                # Submit Tasks
+                page_zones = ctx["zones"].get(p_idx, [])
+                page_zones = sorted(page_zones, key=lambda z: z.get('top', 0))
+                
+                # Page-level OMR: every MC/TF zone of the page read in one pass (one warp + one threshold)
+                page_marks = {}
+                if self.local_omr:
+                    page_omr = ctx["page_omr"].get(p_idx)
+                    if page_omr is None:
+                        page_omr = ctx["page_omr"][p_idx] = omr.PageOMR(page_zones)
+                    if page_omr.zones:
+                        bx, by, bw, bh = page_view.clamp(*page_omr.bbox)
+                        page_marks = page_omr.read(page_view.crop(bx, by, bw, bh), offset=(bx, by))
+                
+                for z in page_zones:
+                    z_name = z.get("zone_name", "Unknown")
+                    z_type = z.get("zone_type", "Klasik")
+                    if z_type == "Tanımsız": continue
                     
-                    self.student_progress.emit(unit_name, f"Sayfa {p_idx+1} Hizalanıyor...", 10)
+                    x, y, w, h = int(z['left']), int(z['top']), int(z['width']), int(z['height'])
                     
-                    if p_img.mode != 'RGB': p_img = p_img.convert('RGB')
-                    stud_cv = cv2.cvtColor(np.array(p_img), cv2.COLOR_RGB2BGR)
+                    # Crop (warps only this ROI)
+                    x, y, w, h = page_view.clamp(x, y, w, h)
+                    crop = page_view.crop(x, y, w, h)
                     
-                    # Alignment
-                    # Alignment
-                    tmpl_pil = self.state.pdf_images[p_idx] if p_idx < len(self.state.pdf_images) else None
-                    if tmpl_pil:
-                        tmpl_cv = cv2.cvtColor(np.array(tmpl_pil.convert('RGB')), cv2.COLOR_RGB2BGR)
-                        matches_vis_path = os.path.join(debug_dir, f"debug_matches_{unit_name}_{p_idx}.jpg")
-                        aligned_stud = alignment.align_image(tmpl_cv, stud_cv, debug_path=matches_vis_path)
-                        if aligned_stud is None: 
-                            # Fallback: Assume it IS aligned (from Server) but needs resizing to match Template
-                            print(f"[Grading] Alignment failed for {unit_name}, assuming pre-aligned. Resizing to template.")
-                            h_t, w_t = tmpl_cv.shape[:2]
-                            aligned_stud = cv2.resize(stud_cv, (w_t, h_t))
-                    else:
-                        aligned_stud = stud_cv
-                        tmpl_cv = None 
+                    from logic import utils
+                    proc_crop_cv = utils.preprocess_for_gemini(crop)
                     
-                    # Submit Tasks
-                    page_zones = self.state.zones.get(p_idx, [])
-                    page_zones = sorted(page_zones, key=lambda z: z.get('top', 0))
+                    safe_zid = str(z.get("id", "no_id"))[:6]
+                    crop_filename = f"{unit_name}_{z_name}_{safe_zid}_{p_idx}.jpg".replace(" ", "_").replace("/", "-")
+                    cv2.imwrite(os.path.join(self.crops_dir, crop_filename), proc_crop_cv)
+                    pil_crop_input = Image.fromarray(cv2.cvtColor(proc_crop_cv, cv2.COLOR_BGR2RGB))
                     
-                    for z in page_zones:
-                        z_name = z.get("zone_name", "Unknown")
-                        z_type = z.get("zone_type", "Klasik")
-                        if z_type == "Tanımsız": continue
-                        
-                        x, y, w, h = int(z['left']), int(z['top']), int(z['width']), int(z['height'])
-                        
-                        # Crop
-                        h_img, w_img = aligned_stud.shape[:2]
-                        x = max(0, min(x, w_img-1))
-                        y = max(0, min(y, h_img-1))
-                        w = max(1, min(w, w_img-x))
-                        h = max(1, min(h, h_img-y))
-                        crop = aligned_stud[y:y+h, x:x+w]
-                        
-                        from logic import utils
-                        proc_crop_cv = utils.preprocess_for_gemini(crop)
-                        
-                        safe_zid = str(z.get("id", "no_id"))[:6]
-                        crop_filename = f"{unit_name}_{z_name}_{safe_zid}_{p_idx}.jpg".replace(" ", "_").replace("/", "-")
-                        cv2.imwrite(os.path.join(self.crops_dir, crop_filename), proc_crop_cv)
-                        pil_crop_input = Image.fromarray(cv2.cvtColor(proc_crop_cv, cv2.COLOR_BGR2RGB))
-                        
-                        task_meta = {
-                            "p_idx": p_idx,
-                            "top": y,
-                            "z_name": z_name,
-                            "z_type": z_type,
-                            "z": z, 
-                            "crop": proc_crop_cv,
-                            "crop_path": crop_filename,
-                            "key_crop_path": ""
-                        }
-                        
-                        # Student Info
-                        if z_type == "Öğrenci Bilgisi":
-                              def parse_info_task(model, img):
-                                  try:
-                                      return {"type": "info", "data": grading.parse_student_info(model, img)}
-                                  except Exception as e:
-                                      return {"type": "error", "msg": str(e)}
-
-                              fut = executor.submit(parse_info_task, gemini_model, pil_crop_input)
-                              cb = functools.partial(task_done_callback, meta=task_meta, u_name=unit_name, 
-                                                     db_pth=self.db_path, s_db_id=student_db_id)
-                              fut.add_done_callback(cb)
-                              continue
-
-                        # Safe Max Points Parsing
-                        try:
-                            raw_pts = str(z.get('zone_points', 0))
-                            raw_pts = raw_pts.replace(',', '.')
-                            max_pts_val = float(raw_pts)
-                        except:
-                            max_pts_val = 0.0
-                        
-                        if max_pts_val <= 0 and z_type == "AI Çözsün": max_pts_val = 10.0
-                            
-                        # Key Crop Logic (same as before)
-                        key_crop_cv = None
-                        key_crop_pil = None
-                        if z_type in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
-                            if p_idx < len(answer_key_images):
-                                try:
-                                    k_page = np.array(answer_key_images[p_idx].convert('RGB'))
-                                    k_page = cv2.cvtColor(k_page, cv2.COLOR_RGB2BGR)
-                                    h_k, w_k = k_page.shape[:2]
-                                    kx = max(0, min(x, w_k-1))
-                                    ky = max(0, min(y, h_k-1))
-                                    kw = max(1, min(w, w_k-kx))
-                                    kh = max(1, min(h, h_k-ky))
-                                    key_crop_cv = k_page[ky:ky+kh, kx:kx+kw]
-                                    key_proc_cv = utils.preprocess_for_gemini(key_crop_cv)
-                                    
-                                    safe_zid = str(z.get("id", "no_id"))[:6]
-                                    k_crop_name = f"{unit_name}_{z_name}_{safe_zid}_{p_idx}_KEY.jpg".replace(" ", "_").replace("/", "-")
-                                    cv2.imwrite(os.path.join(self.crops_dir, k_crop_name), key_proc_cv)
-                                    
-                                    task_meta["key_crop_path"] = k_crop_name
-                                    task_meta["key_crop"] = key_proc_cv
-                                    key_crop_pil = Image.fromarray(cv2.cvtColor(key_proc_cv, cv2.COLOR_BGR2RGB))
-                                except: pass
-                        
-                        # Context (same as before)
-                        context_img_pil = None
-                        if "context_rect" in z and tmpl_cv is not None:
-                             # ... (Simple Copy) ...
-                            cr = z["context_rect"]
-                            cx, cy, cw, ch = int(cr["left"]), int(cr["top"]), int(cr["width"]), int(cr["height"])
-                            h_t, w_t = tmpl_cv.shape[:2]
-                            cx = max(0, min(cx, w_t-1))
-                            cy = max(0, min(cy, h_t-1))
-                            cw = max(1, min(cw, w_t-cx))
-                            ch = max(1, min(ch, h_t-cy))
-                            if cw>0 and ch>0:
-                                ctx_crop = tmpl_cv[cy:cy+ch, cx:cx+cw]
-                                context_img_pil = Image.fromarray(cv2.cvtColor(ctx_crop, cv2.COLOR_BGR2RGB))
-                        
-                        if context_img_pil is None and tmpl_cv is not None:
-                            tmpl_zone = tmpl_cv[y:y+h, x:x+w]
-                            context_img_pil = Image.fromarray(cv2.cvtColor(tmpl_zone, cv2.COLOR_BGR2RGB))
-
-                        # Define Task Function
-                        def grade_task(model, s_crop, k_crop, c_crop, z_type_str, ideal, ctx_txt, t_prompt, q_note):
-                            if z_type_str in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
-                                return {"type": "comparison", "data": grading.get_ai_comparison_result(model, s_crop, k_crop, z_type_str, preprocess=False)}
-                            else:
-                                txt = "" 
-                                return {"type": "grading", "data": grading.get_gemini_score(model, txt, ideal, ctx_txt, z_type_str, 
-                                                                                            sorunun_gorseli=c_crop, ogrenci_gorseli=s_crop, 
-                                                                                            teacher_prompt=t_prompt, question_prompt=q_note, preprocess=False)}
-
-                        # Submit
-                        z_id = z.get("id", "")
-                        ideal_text = ideal_texts.get(z_id, "")
-                        q_note = z.get('ai_note', '')
-                        task_meta["max_points"] = max_pts_val
-                        
-                        fut = executor.submit(grade_task, gemini_model, pil_crop_input, key_crop_pil, context_img_pil, 
-                                                 str(z_type), ideal_text, context_text, self.teacher_prompt, q_note)
+                    task_meta = {
+                        "p_idx": p_idx,
+                        "top": y,
+                        "z_name": z_name,
+                        "z_type": z_type,
+                        "z": z, 
+                        "crop": proc_crop_cv,
+                        "crop_path": crop_filename,
+                        "key_crop_path": ""
+                    }
+                    
+                    # Student Info
+                    if z_type == "Öğrenci Bilgisi":
+                          def parse_info_task(model, img):
+                              try:
+                                  return {"type": "info", "data": grading.parse_student_info(model, img, use_cache=self.use_ai_cache)}
+                              except Exception as e:
+                                  return {"type": "error", "msg": str(e)}
+
+                          fut = executor.submit(parse_info_task, gemini_model, pil_crop_input)
+                          cb = functools.partial(task_done_callback, meta=task_meta, u_name=unit_name, 
+                                                 db_pth=self.db_path, s_db_id=student_db_id)
+                          fut.add_done_callback(cb)
+                          continue
+
+                    # Safe Max Points Parsing
+                    try:
+                        raw_pts = str(z.get('zone_points', 0))
+                        raw_pts = raw_pts.replace(',', '.')
+                        max_pts_val = float(raw_pts)
+                    except:
+                        max_pts_val = 0.0
+                    
+                    if max_pts_val <= 0 and z_type == "AI Çözsün": max_pts_val = 10.0
                         
-                        cb = functools.partial(task_done_callback, meta=task_meta, u_name=unit_name, 
-                                               db_pth=self.db_path, s_db_id=student_db_id)
-                        fut.add_done_callback(cb)
+                    # Key Crop Logic
+                    key_crop_cv = None
+                    key_crop_pil = None
+                    key_value = ""
+                    compiled_entry = None
+                    if z_type in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
+                        compiled_entry = get_compiled_key(ctx).get(z.get("id"))
+                    if compiled_entry and compiled_entry["key_value"]:
+                        # Compiled key: answer known, key crop prepared once per model
+                        key_value = compiled_entry["key_value"]
+                        k_crop_name, key_proc_cv = get_compiled_key_crop(ctx, z.get("id"), compiled_entry)
+                        if k_crop_name:
+                            task_meta["key_crop_path"] = k_crop_name
+                            task_meta["key_crop"] = key_proc_cv
+                    elif z_type in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
+                        key_page_img = get_answer_key_image(ctx, p_idx)
+                        if key_page_img is not None:
+                            try:
+                                k_page = np.array(key_page_img.convert('RGB'))
+                                k_page = cv2.cvtColor(k_page, cv2.COLOR_RGB2BGR)
+                                h_k, w_k = k_page.shape[:2]
+                                kx = max(0, min(x, w_k-1))
+                                ky = max(0, min(y, h_k-1))
+                                kw = max(1, min(w, w_k-kx))
+                                kh = max(1, min(h, h_k-ky))
+                                key_crop_cv = k_page[ky:ky+kh, kx:kx+kw]
+                                key_proc_cv = utils.preprocess_for_gemini(key_crop_cv)
+                                
+                                safe_zid = str(z.get("id", "no_id"))[:6]
+                                k_crop_name = f"{unit_name}_{z_name}_{safe_zid}_{p_idx}_KEY.jpg".replace(" ", "_").replace("/", "-")
+                                cv2.imwrite(os.path.join(self.crops_dir, k_crop_name), key_proc_cv)
+                                
+                                task_meta["key_crop_path"] = k_crop_name
+                                task_meta["key_crop"] = key_proc_cv
+                                key_crop_pil = Image.fromarray(cv2.cvtColor(key_proc_cv, cv2.COLOR_BGR2RGB))
+                            except: pass
+                    
+                    # Context (same as before)
+                    context_img_pil = None
+                    if "context_rect" in z and tmpl_cv is not None:
+                         # ... (Simple Copy) ...
+                        cr = z["context_rect"]
+                        cx, cy, cw, ch = int(cr["left"]), int(cr["top"]), int(cr["width"]), int(cr["height"])
+                        h_t, w_t = tmpl_cv.shape[:2]
+                        cx = max(0, min(cx, w_t-1))
+                        cy = max(0, min(cy, h_t-1))
+                        cw = max(1, min(cw, w_t-cx))
+                        ch = max(1, min(ch, h_t-cy))
+                        if cw>0 and ch>0:
+                            ctx_crop = tmpl_cv[cy:cy+ch, cx:cx+cw]
+                            context_img_pil = Image.fromarray(cv2.cvtColor(ctx_crop, cv2.COLOR_BGR2RGB))
+                    
+                    if context_img_pil is None and tmpl_cv is not None:
+                        tmpl_zone = tmpl_cv[y:y+h, x:x+w]
+                        context_img_pil = Image.fromarray(cv2.cvtColor(tmpl_zone, cv2.COLOR_BGR2RGB))
+
+                    # Define Task Function
+                    def grade_task(model, s_crop, k_crop, c_crop, z_type_str, ideal, ctx_txt, t_prompt, q_note, omr_args=None, key_val=""):
+                        if z_type_str in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
+                            # Local OMR first; Gemini only for low margin / multiple marks / unreadable key
+                            if omr_args is not None:
+                                local_res, confident = omr.local_comparison(*omr_args)
+                                with tracker_lock:
+                                    omr_stats["local" if confident else "ai"] += 1
+                                if confident:
+                                    return {"type": "comparison", "data": local_res}
+                            return {"type": "comparison", "data": grading.get_ai_comparison_result(model, s_crop, k_crop, z_type_str, preprocess=False,
+                                                                                                   key_value=key_val or None, use_cache=self.use_ai_cache)}
+                        else:
+                            txt = "" 
+                            return {"type": "grading", "data": grading.get_gemini_score(model, txt, ideal, ctx_txt, z_type_str, 
+                                                                                        sorunun_gorseli=c_crop, ogrenci_gorseli=s_crop, 
+                                                                                        teacher_prompt=t_prompt, question_prompt=q_note, preprocess=False,
+                                                                                        use_cache=self.use_ai_cache)}
+
+                    # Submit
+                    z_id = z.get("id", "")
+                    ideal_text = ctx["ideal_texts"].get(z_id, "")
+                    q_note = z.get('ai_note', '')
+                    task_meta["max_points"] = max_pts_val
+                    task_meta["ideal_text"] = ideal_text
+                    
+                    context_text = ""
+                    if notes_index is not None and z_type not in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
+                        notes_key = (ctx["name"], z_id)
+                        if notes_key not in notes_context:
+                            notes_context[notes_key] = notes_index.context_for(f"{z_name} {ideal_text} {q_note}")
+                        context_text = notes_context[notes_key]
+                    
+                    omr_args = None
+                    if self.local_omr and z_type in ["Çoktan Seçmeli", "Doğru-Yanlış"]:
+                        omr_args = (crop, z_type, int(z.get("num_options", 5)), z.get("layout", "dikey"),
+                                    key_value or z.get("answer", ""), key_crop_cv, page_marks.get(z.get("id")), z)
+                    
+                    fut = executor.submit(grade_task, gemini_model, pil_crop_input, key_crop_pil, context_img_pil, 
+                                             str(z_type), ideal_text, context_text, self.teacher_prompt, q_note, omr_args, key_value)
+                    
+                    cb = functools.partial(task_done_callback, meta=task_meta, u_name=unit_name, 
+                                           db_pth=self.db_path, s_db_id=student_db_id)
+                    fut.add_done_callback(cb)
 
-                # After submitting all tasks for this student, we can notify "Queued" 
-                # and release semaphore to allow next student to load.
-                self.student_progress.emit(unit_name, "AI Bekleniyor...", 15)
+            # After submitting all tasks for this student, we can notify "Queued"
+            self.student_progress.emit(unit_name, "AI Bekleniyor...", 15)
+
+        # --- MAIN LOOP ---
+        # Students are loaded/submitted to the alignment engine ahead of grading,
+        # so the pool keeps working while the current student's zones are cropped.
+        # Student PDFs are rasterised ahead in their own process pool (see logic/prefetch.py).
+        pending = collections.deque()
+        pending_bytes = 0 # Pages held by submitted, not yet graded students
+        prefetcher = StudentPrefetcher(self.file_paths)
+        try:
+            for unit_path, unit, load_error in prefetcher:
+                if not self.is_running: break
+                
+                unit_name = os.path.basename(unit_path)
+                
+                # Initial UI Update
+                self.student_progress.emit(unit_name, "Hazırlanıyor...", 0)
+                if load_error is not None:
+                    print(f"[Grading] {unit_name}: Öğrenci yüklenemedi: {load_error}")
                 
-            finally:
-                align_sem.release()
+                loaded = load_student(unit_path, unit_name, unit)
+                unit = None
+                if loaded is not None:
+                    pending.append(loaded)
+                    pending_bytes += sum(stud_cv.nbytes for _, stud_cv in loaded[3])
+
+                # The newest student always stays submitted, so the pool keeps working while grading
+                while len(pending) > lookahead or (len(pending) > 1 and pending_bytes > pending_budget):
+                    graded = pending.popleft()
+                    pending_bytes -= sum(stud_cv.nbytes for _, stud_cv in graded[3])
+                    grade_student(*graded)
+                    graded = None
+
+            while pending and self.is_running:
+                grade_student(*pending.popleft())
+        finally:
+            prefetcher.close()
+            if engine is not None:
+                engine.close()
 
         # Shutdown waiter? No, run() ends but threads continue.
         # We need to wait until all trackers are empty?
         # Actually, executor.shutdown(wait=True) will wait for all tasks.
         executor.shutdown(wait=True)
+        if omr_stats:
+            print(f"[Grading] OMR: {omr_stats['local']} bölge yerelde okundu, {omr_stats['ai']} bölge Gemini'ye gönderildi.")
+        if align_stats:
+            counts = ", ".join(f"{k}={v}" for k, v in sorted(align_stats.items()) if k != "pages")
+            print(f"[Grading] Hizalama: {align_stats['pages']} sayfa ({counts})")
+        if ai_stats_start is not None:
+            ai_stats = ai_cache.get_ai_cache().stats()
+            print(f"[Grading] AI önbelleği: {ai_stats['hits'] - ai_stats_start['hits']} isabet, "
+                  f"{ai_stats['misses'] - ai_stats_start['misses']} API çağrısı.")
         self.finished_all.emit()
 
     def stop(self):
@@ -499,6 +756,22 @@ class GradingTab(QWidget):
         btn_refresh.clicked.connect(self.populate_models)
         hbox_ctrl.addWidget(btn_refresh)
         
+        # Mixed Batch: each student is routed to its exam model automatically
+        self.chk_mixed = QCheckBox("Karışık Sınavlar")
+        self.chk_mixed.setToolTip("Klasörde farklı sınavlar varsa her öğrenci için model otomatik seçilir.")
+        hbox_ctrl.addWidget(self.chk_mixed)
+        
+        # Local OMR: bubbles read on this machine, Gemini only for ambiguous marks
+        self.chk_local_omr = QCheckBox("Yerel OMR")
+        self.chk_local_omr.setChecked(True)
+        self.chk_local_omr.setToolTip("Çoktan seçmeli / doğru-yanlış bölgeleri önce yerelde okunur; sadece belirsiz işaretler AI'a gönderilir.")
+        hbox_ctrl.addWidget(self.chk_local_omr)
+        
+        self.chk_ai_cache = QCheckBox("AI Önbelleği")
+        self.chk_ai_cache.setChecked(True)
+        self.chk_ai_cache.setToolTip("Aynı görsel ve istemle yapılan AI istekleri önceki yanıttan karşılanır (yeniden puanlamada API çağrılmaz).")
+        hbox_ctrl.addWidget(self.chk_ai_cache)
+        
         hbox_ctrl.addSpacing(20)
         
         self.btn_load_folder = QPushButton("📂 Öğrenci Klasörü Seç")
@@ -599,12 +872,13 @@ class GradingTab(QWidget):
         # Load Model to State
         config, images = self.manager.load_model(name)
         if config and images:
+            self.state.model_name = name
             self.state.pdf_images = images # Template Images
+            self.state.template_features = self.manager.load_template_features(name, images, config.get("zones", {}))
             
-            # Set Server Reference & Auto-Start
-            set_reference_image(images[0])
-            # Set Server Reference & Auto-Start
-            set_reference_image(images[0])
+            # Set Server Reference & Auto-Start (features already loaded/cached above, no recompute on the GUI thread)
+            feats = self.state.template_features
+            set_reference_image(images[0], features=feats[0] if feats else None)
             self.toggle_transfer_server(force_start=True)
             
             # Load Zones
@@ -748,7 +1022,10 @@ class GradingTab(QWidget):
         api_key = os.environ.get("GEMINI_API_KEY", "")
         service_account_path = "service_account.json" 
         
-        self.worker = GradingWorker(self.student_files, api_key, service_account_path, teacher_notes)
+        self.worker = GradingWorker(self.student_files, api_key, service_account_path, teacher_notes,
+                                    auto_route=self.chk_mixed.isChecked(),
+                                    local_omr=self.chk_local_omr.isChecked(),
+                                    use_ai_cache=self.chk_ai_cache.isChecked())
         self.worker.log_signal.connect(self.log) 
         self.worker.student_progress.connect(self.update_student_progress)
         self.worker.result_ready.connect(self.add_result_row)
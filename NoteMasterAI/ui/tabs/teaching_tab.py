@@ -3,12 +3,13 @@ import os
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
                              QFileDialog, QMessageBox, QGroupBox, QStackedWidget,
                              QListWidget, QFormLayout, QLineEdit, QComboBox, QDoubleSpinBox, QSpinBox, 
-                             QProgressDialog)
+                             QProgressDialog, QApplication)
 from PyQt5.QtCore import Qt
 from ui.widgets.canvas import CanvasWidget
 from logic.model_manager import ModelManager
 from logic.utils import run_yolo_detection, load_yolo_model, pil_to_qpixmap
-from logic.pdf_utils import pdf_to_images
+from logic.pdf_utils import iter_pdf_images, pdf_page_count
+from logic import fiducials
 from logic.transfer_server import set_reference_image
 from logic.constants import YOLO_CLASS_MAPPING, DEFAULT_SETTINGS
 
@@ -230,8 +231,23 @@ class TeachingTab(QWidget):
         dlg.show()
         
         try:
-            self.current_model_images = pdf_to_images(self.raw_blank_bytes)
+            # Fiducial Markers (Hızlı ve sağlam hizalama için köşe işaretleri)
+            add_markers = False
+            if fiducials.is_available():
+                reply = QMessageBox.question(self, "Köşe İşaretleri",
+                                             "Hızlı hizalama için sayfa köşelerine işaret eklensin mi?\n"
+                                             "(Sınavı kaydedilen modelin blank.pdf dosyasından yazdırın.)",
+                                             QMessageBox.Yes | QMessageBox.No)
+                add_markers = reply == QMessageBox.Yes
+            
+            # Convert (page by page; markers drawn as each page arrives, no second copy of the document)
+            dlg.setMaximum(pdf_page_count(self.raw_blank_bytes))
+            self.current_model_images = []
             self.current_zones = {}
+            for i, img in iter_pdf_images(self.raw_blank_bytes):
+                self.current_model_images.append(fiducials.add_markers(img) if add_markers else img)
+                dlg.setValue(i + 1)
+                QApplication.processEvents()
             
             # AI Check
             if self.yolo_model:
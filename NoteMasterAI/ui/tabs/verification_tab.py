@@ -345,6 +345,12 @@ class VerificationTab(QWidget):
             cfg_path = os.path.join(model_dir, "config.json")
             with open(cfg_path, "w") as f:
                 json.dump(self.current_model_config, f, indent=4)
+            
+            # 3. Compile Key: key crops + key answers decided once (AI-only zones are resolved at first grading)
+            try:
+                self.manager.compile_key(name, self.current_zones)
+            except Exception as e:
+                print(f"[Verification] Cevap anahtarı derlenemedi: {e}")
                 
             QMessageBox.information(self, "Başarılı", "Cevap anahtarı ve model kaydedildi.")
             